@@ -0,0 +1,148 @@
+"""
+静的ファイルの配信
+copy_questions.pyで生成したハッシュ付きファイル（app/static/dist/）とマニフェストを使い、
+テンプレートのURL解決と、事前圧縮版（br / gzip）の配信を行う（リクエスト時には圧縮しない）
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import stat
+from pathlib import Path
+from typing import Dict, Optional
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+
+STATIC_DIR = Path(__file__).parent / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+STATIC_URL = "/static"
+
+# 事前圧縮版の拡張子（優先順）
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# ハッシュ付きファイルは内容が変わるとURLも変わるため、長期キャッシュさせる
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# ハッシュなしのファイルは毎回ETagで再検証させる
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> Dict[str, str]:
+    """
+    マニフェストを読み込み、元ファイル名 → ハッシュ付きファイルのパス（static/からの相対）を返す
+    ビルド後に元ファイルが変更されたものは、古い内容を配信しないよう除外する
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    resolved = {}
+    for name, entry in manifest.get("assets", {}).items():
+        source = STATIC_DIR / name
+        if not source.is_file() or not (STATIC_DIR / entry["file"]).is_file():
+            continue
+        if file_sha256(source) != entry["sha256"]:
+            continue
+        resolved[name] = entry["file"]
+    return resolved
+
+
+_manifest: Optional[Dict[str, str]] = None
+
+
+def get_manifest() -> Dict[str, str]:
+    global _manifest
+    if _manifest is None:
+        _manifest = load_manifest()
+    return _manifest
+
+
+def reset_manifest():
+    """マニフェストを次回参照時に読み直す"""
+    global _manifest
+    _manifest = None
+
+
+def asset_url(name: str) -> str:
+    """テンプレート用: 静的ファイルのURL（ビルド済みならハッシュ付き、未ビルドなら元ファイル）"""
+    return f"{STATIC_URL}/{get_manifest().get(name, name)}"
+
+
+def is_hashed_asset(path: str) -> bool:
+    return Path(path).parts[:1] == (DIST_DIR.name,)
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encodingヘッダーを 符号化方式 → q値 に変換（q=0は除く）"""
+    accepted = {}
+    for item in header.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        coding = parts[0].lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted[coding] = q
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Accept-Encodingに応じて事前圧縮版（.br / .gz）を返すStaticFiles
+    ハッシュ付きファイル（dist/配下）には immutable のCache-Controlを付ける
+    """
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await self._precompressed_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        if is_hashed_asset(path):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            response.headers["Vary"] = "Accept-Encoding"
+        else:
+            response.headers.setdefault("Cache-Control", REVALIDATE_CACHE_CONTROL)
+        return response
+
+    async def _precompressed_response(self, path: str, scope: Scope) -> Optional[Response]:
+        if scope["method"] not in ("GET", "HEAD") or not is_hashed_asset(path):
+            return None
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        if not accepted:
+            return None
+
+        # q値が高いものを優先し、同じならbrを優先する
+        candidates = sorted(
+            (encoding for encoding in ENCODINGS if encoding[0] in accepted or "*" in accepted),
+            key=lambda encoding: -accepted.get(encoding[0], accepted.get("*", 0.0)),
+        )
+        for encoding, suffix in candidates:
+            try:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            except OSError:
+                continue
+            if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            media_type = mimetypes.guess_type(os.path.basename(path))[0] or "application/octet-stream"
+            response = FileResponse(full_path, stat_result=stat_result, media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
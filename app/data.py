@@ -1,7 +1,7 @@
 """
 設問データのシード定義
 """
-from typing import List
+from typing import Dict, List, Tuple
 from app.schemas import Question
 
 QUESTIONS: List[Question] = [
@@ -145,15 +145,92 @@ QUESTIONS: List[Question] = [
 ]
 
 
-def get_questions_by_topic(topic: str) -> List[Question]:
+class QuestionRepository:
+    """
+    設問の索引
+    IDでのO(1)参照、トピック別の不変タプル、通し番号（ordinal）を起動時に構築する
+    通し番号はストアなどで設問を小さな整数で扱うために使う
+    """
+    def __init__(self, questions: List[Question]):
+        self.questions: Tuple[Question, ...] = tuple(questions)
+        self._by_id: Dict[str, Question] = {}
+        self._ordinals: Dict[str, int] = {}
+        self._topic_positions: Dict[str, int] = {}
+        by_topic: Dict[str, List[Question]] = {}
+
+        for ordinal, question in enumerate(self.questions):
+            if question.id in self._by_id:
+                raise ValueError(f"Duplicate question id: {question.id}")
+            self._by_id[question.id] = question
+            self._ordinals[question.id] = ordinal
+            topic_questions = by_topic.setdefault(question.topic, [])
+            self._topic_positions[question.id] = len(topic_questions)
+            topic_questions.append(question)
+
+        self._by_topic: Dict[str, Tuple[Question, ...]] = {
+            topic: tuple(topic_questions) for topic, topic_questions in by_topic.items()
+        }
+        self._topic_ordinals: Dict[str, Tuple[int, ...]] = {
+            topic: tuple(self._ordinals[q.id] for q in topic_questions)
+            for topic, topic_questions in self._by_topic.items()
+        }
+        self.topics: Tuple[str, ...] = tuple(self._by_topic)
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self._by_id
+
+    def get(self, question_id: str) -> Question:
+        question = self._by_id.get(question_id)
+        if question is None:
+            raise ValueError(f"Question not found: {question_id}")
+        return question
+
+    def ordinal(self, question_id: str) -> int:
+        """設問の通し番号"""
+        ordinal = self._ordinals.get(question_id)
+        if ordinal is None:
+            raise ValueError(f"Question not found: {question_id}")
+        return ordinal
+
+    def by_ordinal(self, ordinal: int) -> Question:
+        return self.questions[ordinal]
+
+    def by_topic(self, topic: str) -> Tuple[Question, ...]:
+        return self._by_topic.get(topic, ())
+
+    def topic_ordinals(self, topic: str) -> Tuple[int, ...]:
+        """トピックの設問の通し番号（トピック内の並び順）"""
+        return self._topic_ordinals.get(topic, ())
+
+    def topic_position(self, question_id: str) -> int:
+        """トピック内での設問の位置（0始まり）"""
+        position = self._topic_positions.get(question_id)
+        if position is None:
+            raise ValueError(f"Question not found: {question_id}")
+        return position
+
+
+REPOSITORY = QuestionRepository(QUESTIONS)
+
+
+def get_questions_by_topic(topic: str) -> Tuple[Question, ...]:
     """指定されたトピックの設問を取得"""
-    return [q for q in QUESTIONS if q.topic == topic]
+    return REPOSITORY.by_topic(topic)
 
 
 def get_question_by_id(question_id: str) -> Question:
     """IDで設問を取得"""
-    for q in QUESTIONS:
-        if q.id == question_id:
-            return q
-    raise ValueError(f"Question not found: {question_id}")
+    return REPOSITORY.get(question_id)
+
+
+def get_question_ordinal(question_id: str) -> int:
+    """設問の通し番号を取得"""
+    return REPOSITORY.ordinal(question_id)
+
 
+def get_question_by_ordinal(ordinal: int) -> Question:
+    """通し番号で設問を取得"""
+    return REPOSITORY.by_ordinal(ordinal)
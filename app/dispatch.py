@@ -0,0 +1,358 @@
+"""
+リマインドの配信
+管理画面からの送信依頼をジョブとしてキューに積み、バックグラウンドのワーカー（asyncioタスク）が
+宛先をまとめて配信する（送信数の上限、失敗時の再試行、宛先ごとの配信状態の記録）
+- log: 配信せず、ログ出力と通知ログへの記録のみ（既定）
+- smtp: SMTPサーバー経由でメールを送信
+"""
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+from app import store
+
+
+REMIND_TRANSPORT = os.environ.get("REMIND_TRANSPORT", "log")
+REMIND_WORKERS = int(os.environ.get("REMIND_WORKERS", "4"))
+# 1回の配信にまとめる宛先数
+REMIND_BATCH_SIZE = int(os.environ.get("REMIND_BATCH_SIZE", "50"))
+# 1秒あたりの送信数の上限（0で無制限）
+REMIND_RATE_LIMIT = float(os.environ.get("REMIND_RATE_LIMIT", "20"))
+# 宛先ごとの最大試行回数と、再試行までの待ち時間の基準（秒、試行のたびに倍にする）
+REMIND_MAX_ATTEMPTS = int(os.environ.get("REMIND_MAX_ATTEMPTS", "3"))
+REMIND_RETRY_BASE = float(os.environ.get("REMIND_RETRY_BASE", "1.0"))
+# 保持するジョブ数（古いものから捨てる）
+REMIND_JOB_HISTORY = 100
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "1025"))
+SMTP_FROM = os.environ.get("SMTP_FROM", "training@example.com")
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "") == "1"
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "10"))
+# 受講者名にドメインが含まれない場合に付けるメールアドレスのドメイン
+REMIND_EMAIL_DOMAIN = os.environ.get("REMIND_EMAIL_DOMAIN", "example.com")
+
+REMIND_SUBJECT = "【内部研修】受講のリマインド"
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """1宛先分の配信失敗（retryable が偽なら再試行しない）"""
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Transport:
+    """配信方式の基底クラス（スレッドで呼ばれるため、ブロッキングI/Oを使ってよい）"""
+    name = ""
+
+    def send(self, recipients: List[str], message: str) -> Dict[str, Optional[DeliveryError]]:
+        """宛先ごとに None（成功）または DeliveryError を返す。例外を送出した場合はまとめて再試行する"""
+        raise NotImplementedError
+
+
+class LogTransport(Transport):
+    """実際には配信せず、ログに出力する"""
+    name = "log"
+
+    def send(self, recipients: List[str], message: str) -> Dict[str, Optional[DeliveryError]]:
+        for name in recipients:
+            logger.info("remind to=%s message=%s", name, message)
+        return {name: None for name in recipients}
+
+
+def email_address(name: str) -> str:
+    return name if "@" in name else f"{name}@{REMIND_EMAIL_DOMAIN}"
+
+
+class SMTPTransport(Transport):
+    """
+    SMTPでメールを送信（1回の配信で1接続を使い回す）
+    ローカルの確認用SMTPサーバーでも試せる（python -m smtpd -n -c DebuggingServer localhost:1025 など）
+    """
+    name = "smtp"
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, sender: str = SMTP_FROM,
+                 username: str = SMTP_USERNAME, password: str = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS,
+                 timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def _message(self, name: str, message: str) -> EmailMessage:
+        email = EmailMessage()
+        email["From"] = self.sender
+        email["To"] = email_address(name)
+        email["Subject"] = REMIND_SUBJECT
+        email.set_content(f"{name} さん\n\n{message}\n")
+        return email
+
+    @staticmethod
+    def _response_error(e: smtplib.SMTPResponseException) -> DeliveryError:
+        # 4xxは一時的なエラーとして再試行し、5xxは再試行しない
+        detail = e.smtp_error.decode("utf-8", "replace") if isinstance(e.smtp_error, bytes) else e.smtp_error
+        return DeliveryError(f"{e.smtp_code} {detail}", retryable=400 <= e.smtp_code < 500)
+
+    def send(self, recipients: List[str], message: str) -> Dict[str, Optional[DeliveryError]]:
+        results: Dict[str, Optional[DeliveryError]] = {}
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+                for name in recipients:
+                    try:
+                        smtp.send_message(self._message(name, message))
+                        results[name] = None
+                    except smtplib.SMTPRecipientsRefused as e:
+                        code = next(iter(e.recipients.values()))[0]
+                        results[name] = DeliveryError(f"recipient refused ({code})", retryable=400 <= code < 500)
+                    except smtplib.SMTPResponseException as e:
+                        results[name] = self._response_error(e)
+        except (smtplib.SMTPException, OSError) as e:
+            # 接続できない・途中で切れた場合は、結果の出た宛先はそのままにして残りの宛先だけを失敗にする
+            # （送信済みの宛先をまとめて再試行して重複して届かないように）
+            if isinstance(e, smtplib.SMTPResponseException):
+                error = self._response_error(e)
+            else:
+                error = DeliveryError(f"{type(e).__name__}: {e}")
+            for name in recipients:
+                results.setdefault(name, error)
+        return results
+
+
+TRANSPORTS = {
+    LogTransport.name: LogTransport,
+    SMTPTransport.name: SMTPTransport,
+}
+
+
+def create_transport(name: str = None) -> Transport:
+    """環境変数 REMIND_TRANSPORT（または name）に応じた配信方式を作成"""
+    name = name or REMIND_TRANSPORT
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown remind transport: {name}")
+    return TRANSPORTS[name]()
+
+
+class RateLimiter:
+    """トークンバケットによる送信数の制限（rate 件/秒、最大 burst 件まで貯める）"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, count: int):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            # バッチが burst より大きくても、貯まる上限まで待てば送れるようにする
+            count = min(count, self.burst)
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= count:
+                    self._tokens -= count
+                    return
+                await asyncio.sleep((count - self._tokens) / self.rate)
+
+
+class RecipientState:
+    """宛先ごとの配信状態"""
+    __slots__ = ("name", "status", "attempts", "error", "delivered_at")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"  # pending / retrying / sent / failed
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.delivered_at: Optional[datetime] = None
+
+
+class ReminderJob:
+    """1回のリマインド送信依頼"""
+    def __init__(self, recipients: List[str], message: str, topic: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.message = message or store.DEFAULT_NOTIFICATION_MESSAGE
+        self.topic = topic
+        # 同じ宛先の重複は1件にまとめる（並び順は保つ）
+        self.recipients: Dict[str, RecipientState] = {name: RecipientState(name) for name in recipients}
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.recipients)
+
+    @property
+    def done(self) -> bool:
+        return self.sent + self.failed >= self.total
+
+    def to_dict(self, include_recipients: bool = False) -> Dict:
+        result = {
+            "job_id": self.id,
+            "status": "done" if self.done else "running",
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": self.total - self.sent - self.failed,
+        }
+        if include_recipients:
+            result["recipients"] = [
+                {"name": state.name, "status": state.status, "attempts": state.attempts, "error": state.error}
+                for state in self.recipients.values()
+            ]
+        return result
+
+
+class ReminderDispatcher:
+    """
+    リマインドの配信キュー
+    submit はジョブを作ってキューに積むだけで、配信はワーカーがバッチ単位で行う
+    """
+    def __init__(self, transport: Optional[Transport] = None, workers: int = REMIND_WORKERS,
+                 batch_size: int = REMIND_BATCH_SIZE, rate_limit: float = REMIND_RATE_LIMIT,
+                 max_attempts: int = REMIND_MAX_ATTEMPTS, retry_base: float = REMIND_RETRY_BASE):
+        self._transport = transport
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rate_limit = rate_limit
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.jobs: "OrderedDict[str, ReminderJob]" = OrderedDict()
+        self.retries = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._limiter: Optional[RateLimiter] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def transport(self) -> Transport:
+        if self._transport is None:
+            self._transport = create_transport()
+        return self._transport
+
+    def start(self):
+        """ワーカーを起動（イベントループ上で呼ぶ）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._limiter = RateLimiter(self.rate_limit, self.batch_size)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"remind-{i}") for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, recipients: List[str], message: str, topic: Optional[str] = None) -> ReminderJob:
+        """ジョブを登録して宛先をバッチに分けてキューに積み、すぐに返す"""
+        if not self._tasks:
+            self.start()
+        job = ReminderJob(recipients, message, topic)
+        self.jobs[job.id] = job
+        while len(self.jobs) > REMIND_JOB_HISTORY:
+            self.jobs.popitem(last=False)
+        names = list(job.recipients)
+        for i in range(0, len(names), self.batch_size):
+            self._queue.put_nowait((job, names[i:i + self.batch_size]))
+        if not names:
+            job.finished_at = datetime.now()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[ReminderJob]:
+        return self.jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job, names = await self._queue.get()
+            try:
+                await self._deliver(job, names)
+            except Exception:
+                logger.exception("remind batch failed unexpectedly")
+            finally:
+                self._queue.task_done()
+
+    def _send(self, job: ReminderJob, names: List[str]) -> Dict[str, Optional[DeliveryError]]:
+        """配信し、届いた宛先を通知ログに記録する（ワーカースレッドで実行）"""
+        results = self.transport.send(names, job.message)
+        for name in names:
+            if name in results and results[name] is None:
+                store.add_notification_log(name, topic=job.topic, message=job.message)
+        return results
+
+    async def _deliver(self, job: ReminderJob, names: List[str]):
+        await self._limiter.acquire(len(names))
+        for name in names:
+            job.recipients[name].attempts += 1
+        try:
+            results = await asyncio.to_thread(self._send, job, names)
+        except Exception as e:
+            # 配信方式の想定外の例外は、バッチ全体を一時的な失敗として扱う
+            error = DeliveryError(f"{type(e).__name__}: {e}")
+            results = {name: error for name in names}
+
+        retry = []
+        for name in names:
+            state = job.recipients[name]
+            error = results.get(name, DeliveryError("no result from transport"))
+            if error is None:
+                state.status = "sent"
+                state.error = None
+                state.delivered_at = datetime.now()
+                job.sent += 1
+            elif error.retryable and state.attempts < self.max_attempts:
+                state.status = "retrying"
+                state.error = str(error)
+                retry.append(name)
+            else:
+                state.status = "failed"
+                state.error = str(error)
+                job.failed += 1
+
+        if retry:
+            self.retries += len(retry)
+            attempts = job.recipients[retry[0]].attempts
+            delay = self.retry_base * 2 ** (attempts - 1) * (1 + random.random() * 0.5)
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, (job, retry))
+        if job.done and job.finished_at is None:
+            job.finished_at = datetime.now()
+
+    def stats(self) -> Dict:
+        return {
+            "transport": self.transport.name,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "rate_limit": self.rate_limit,
+            "queued_batches": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": len(self.jobs),
+            "running_jobs": sum(1 for job in self.jobs.values() if not job.done),
+            "retries": self.retries,
+        }
+
+
+reminder_dispatcher = ReminderDispatcher()
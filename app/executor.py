@@ -0,0 +1,222 @@
+"""
+QA処理（規程検索・要約生成）をイベントループの外で実行する実行器
+- inline: 従来どおりリクエスト処理中にそのまま実行
+- thread: スレッドプールで実行（既定）
+- process: 回答キャッシュの参照は本体で行い、スコアリングはインデックスを事前構築した
+  プロセスプールで実行
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app import rag
+
+
+QA_EXECUTOR_MODE = os.environ.get("QA_EXECUTOR", "thread")
+QA_EXECUTOR_WORKERS = int(os.environ.get("QA_EXECUTOR_WORKERS", "4"))
+# 実行中・待機中を合わせたQA処理の上限（超えたら即座に混雑エラー）
+QA_MAX_PENDING = int(os.environ.get("QA_MAX_PENDING", "32"))
+# 1リクエストあたりの待ち時間の上限（秒）
+QA_TIMEOUT = float(os.environ.get("QA_TIMEOUT", "10"))
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+class QAOverloadedError(RuntimeError):
+    """待機中のQA処理が上限に達している"""
+
+
+class QATimeoutError(TimeoutError):
+    """QA処理が制限時間内に終わらなかった"""
+
+
+def _warm_worker():
+    """プロセスプールの初期化処理（インデックスを事前に構築）"""
+    rag.get_policy_index()
+
+
+def _worker_answer(normalized: str, top_k: int, ranker: str, digest: str) -> Tuple:
+    """プロセスプール側の回答計算（本体と同じ版のインデックスを使う）"""
+    index = rag.get_policy_index()
+    if index.digest != digest:
+        rag.reload_policy_index()
+        index = rag.get_policy_index()
+    return rag.compute_answer(normalized, top_k, ranker, index=index)
+
+
+def _worker_search(normalized: str, top_k: int, ranker: str, digest: str) -> List[Dict]:
+    """プロセスプール側の規程検索"""
+    index = rag.get_policy_index()
+    if index.digest != digest:
+        rag.reload_policy_index()
+        index = rag.get_policy_index()
+    return rag.search_policies(normalized, top_k=top_k, ranker=ranker, index=index)
+
+
+def _worker_answer_batch(normalized_queries: List[str], top_k: int, ranker: str, digest: str) -> List[Tuple]:
+    """プロセスプール側の一括回答計算"""
+    index = rag.get_policy_index()
+    if index.digest != digest:
+        rag.reload_policy_index()
+        index = rag.get_policy_index()
+    return rag.compute_answers(normalized_queries, top_k, ranker, index=index)
+
+
+class QAExecutor:
+    """QA処理の実行器（待機数の上限とリクエストごとのタイムアウト付き）"""
+    def __init__(self, mode: str = QA_EXECUTOR_MODE, workers: int = QA_EXECUTOR_WORKERS,
+                 max_pending: int = QA_MAX_PENDING, timeout: float = QA_TIMEOUT):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._pool: Optional[Executor] = None
+
+    def start(self):
+        """プールを作成（processモードではワーカーを起動してインデックスを構築しておく）"""
+        if self._pool is not None or self.mode == "inline":
+            return
+        if self.mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="qa")
+        else:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+            for future in [self._pool.submit(_warm_worker) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _release(self):
+        self.pending -= 1
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop):
+        """プール側の処理完了時に、イベントループ上で待機数を減らす"""
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # イベントループが既に閉じている場合
+            self._release()
+
+    async def _run(self, fn, *args):
+        """待機数を数えながらプールで実行し、タイムアウトまで待つ"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise QAOverloadedError("QA queue is full")
+        if self._pool is None:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future = self._pool.submit(fn, *args)
+        # 待ち側がタイムアウトしても、処理が実際に終わるまで待機数に含める
+        future.add_done_callback(lambda _: self._on_done(loop))
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise QATimeoutError(f"QA processing exceeded {self.timeout} seconds")
+
+    async def answer(self, query: str, top_k: int = 3,
+                     ranker: Optional[str] = None) -> Tuple[List[Dict], str, str]:
+        """rag.answer_queryと同じ（参照条文, 自信度, 要約）を返す"""
+        if self.mode == "inline":
+            return rag.answer_query(query, top_k=top_k, ranker=ranker)
+        if self.mode == "thread":
+            return await self._run(rag.answer_query, query, top_k, ranker)
+
+        # processモード: キャッシュは本体プロセスで参照・更新する
+        normalized = rag.normalize_query(query)
+        ranker = ranker or rag.DEFAULT_RANKER
+        digest = rag.get_policy_index().digest
+        key = (normalized, top_k, ranker)
+        cached = rag.answer_cache.get(key, digest)
+        if cached is None:
+            cached = await self._run(_worker_answer, normalized, top_k, ranker, digest)
+            rag.answer_cache.put(key, digest, cached)
+        return rag.unpack_answer(cached)
+
+    async def answer_stream(self, query: str, top_k: int = 3,
+                            ranker: Optional[str] = None) -> AsyncIterator[Tuple[str, object]]:
+        """
+        回答を段階ごとに返す（references → confidence → summary）
+        検索が終わった時点で参照条文を返し、続けて自信度・要約を計算する
+        """
+        normalized = rag.normalize_query(query)
+        ranker = ranker or rag.DEFAULT_RANKER
+        index = rag.get_policy_index()
+        key = (normalized, top_k, ranker)
+
+        cached = rag.answer_cache.get(key, index.digest)
+        if cached is not None:
+            references, confidence, summary = rag.unpack_answer(cached)
+            yield "references", references
+            yield "confidence", confidence
+            yield "summary", summary
+            return
+
+        if self.mode == "inline":
+            top_results = rag.search_policies(normalized, top_k=top_k, ranker=ranker, index=index)
+        elif self.mode == "thread":
+            top_results = await self._run(rag.search_policies, normalized, top_k, ranker, index)
+        else:
+            top_results = await self._run(_worker_search, normalized, top_k, ranker, index.digest)
+        yield "references", [dict(ref) for ref in top_results]
+
+        confidence = rag.calculate_confidence(top_results)
+        yield "confidence", confidence
+
+        summary = rag.generate_summary(normalized, top_results, index=index)
+        rag.answer_cache.put(key, index.digest, (tuple(top_results), confidence, summary))
+        yield "summary", summary
+
+    async def answer_batch(self, queries: List[str], top_k: int = 3,
+                           ranker: Optional[str] = None) -> List[Tuple[List[Dict], str, str]]:
+        """rag.answer_queriesと同じ結果を返す（1バッチを1件の処理として数える）"""
+        if self.mode == "inline":
+            return rag.answer_queries(queries, top_k=top_k, ranker=ranker)
+        if self.mode == "thread":
+            return await self._run(rag.answer_queries, queries, top_k, ranker)
+
+        # processモード: キャッシュにない質問だけをワーカーでまとめて計算する
+        ranker = ranker or rag.DEFAULT_RANKER
+        digest = rag.get_policy_index().digest
+        normalized = [rag.normalize_query(query) for query in queries]
+        answers = {}
+        for query in dict.fromkeys(normalized):
+            cached = rag.answer_cache.get((query, top_k, ranker), digest)
+            if cached is not None:
+                answers[query] = cached
+        missing = [query for query in dict.fromkeys(normalized) if query not in answers]
+        if missing:
+            computed = await self._run(_worker_answer_batch, missing, top_k, ranker, digest)
+            for query, answer in zip(missing, computed):
+                rag.answer_cache.put((query, top_k, ranker), digest, answer)
+                answers[query] = answer
+        return [rag.unpack_answer(answers[query]) for query in normalized]
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "timeout": self.timeout,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+qa_executor = QAExecutor()
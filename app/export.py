@@ -0,0 +1,160 @@
+"""
+受講データのエクスポート（CSV / NDJSON、gzip圧縮は任意）
+
+ストアを一定件数ずつ読みながら1行ずつ組み立て、まとまった大きさごとに返すジェネレータで、
+件数によらずメモリ使用量は一定（StreamingResponse にそのまま渡す）
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from app import store
+
+
+EXPORT_FORMATS = ("csv", "ndjson")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# 1回に送る大きさの目安（バイト）。小さな行をまとめて送る
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _user_rows() -> Iterator[Dict]:
+    for user in store.iter_users():
+        row = {"name": user.name, "updated_at": _isoformat(user.updated_at)}
+        for topic in store.TOPICS:
+            row[f"{topic}_status"] = user.status(topic)
+            row[f"{topic}_correct"] = user.correct_count(topic)
+            row[f"{topic}_answered"] = user.answered_count(topic)
+        yield row
+
+
+def _answer_rows() -> Iterator[Dict]:
+    for user in store.iter_users():
+        for question, selected_index in store.get_answers(user.name):
+            yield {
+                "name": user.name,
+                "topic": question.topic,
+                "question_id": question.id,
+                "selected_index": selected_index,
+                "correct": selected_index == question.correct_index,
+            }
+
+
+def _chat_rows() -> Iterator[Dict]:
+    for msg in store.iter_chat_messages():
+        yield {
+            "name": msg.name,
+            "seq": msg.seq,
+            "timestamp": _isoformat(msg.timestamp),
+            "is_user": msg.is_user,
+            "message": msg.message,
+            "confidence": msg.confidence,
+            "references": msg.references,
+        }
+
+
+def _escalation_rows() -> Iterator[Dict]:
+    for esc in store.iter_escalations():
+        yield {
+            "id": esc.id,
+            "name": esc.name,
+            "status": esc.status,
+            "confidence": esc.confidence,
+            "created_at": _isoformat(esc.created_at),
+            "updated_at": _isoformat(esc.updated_at),
+            "message": esc.message,
+            "retrieved_articles": esc.retrieved_articles,
+        }
+
+
+# データセット名 → (CSVの列, 行のジェネレータ)
+DATASETS: Dict[str, Tuple[List[str], Callable[[], Iterator[Dict]]]] = {
+    "users": (
+        ["name", "updated_at"] + [f"{topic}_{field}" for topic in store.TOPICS
+                                  for field in ("status", "correct", "answered")],
+        _user_rows,
+    ),
+    "answers": (["name", "topic", "question_id", "selected_index", "correct"], _answer_rows),
+    "chats": (["name", "seq", "timestamp", "is_user", "message", "confidence", "references"], _chat_rows),
+    "escalations": (
+        ["id", "name", "status", "confidence", "created_at", "updated_at", "message", "retrieved_articles"],
+        _escalation_rows,
+    ),
+}
+
+
+def _csv_value(value):
+    # 参照条文などの入れ子の値はJSON文字列にする
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _csv_lines(columns: List[str], rows: Iterable[Dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Excelで開いても文字化けしないようBOMを付ける
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(row[column]) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_lines(rows: Iterable[Dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def _chunks(lines: Iterable[str], compress: bool) -> Iterator[bytes]:
+    """行を EXPORT_CHUNK_BYTES 程度ずつまとめ、指定があればgzip形式で逐次圧縮して返す"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 はgzip形式
+    pending: List[bytes] = []
+    size = 0
+    for line in lines:
+        encoded = line.encode("utf-8")
+        pending.append(encoded)
+        size += len(encoded)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(pending)
+            pending.clear()
+            size = 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export(dataset: str, fmt: str = "csv", compress: bool = False) -> Iterator[bytes]:
+    """データセットを指定形式のバイト列として少しずつ返す"""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    columns, rows = DATASETS[dataset]
+    lines = _csv_lines(columns, rows()) if fmt == "csv" else _ndjson_lines(rows())
+    return _chunks(lines, compress)
+
+
+def export_filename(dataset: str, fmt: str = "csv", compress: bool = False) -> str:
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return filename + ".gz" if compress else filename
+
+
+def media_type(fmt: str, compress: bool = False) -> str:
+    return "application/gzip" if compress else MEDIA_TYPES[fmt]
@@ -0,0 +1,134 @@
+"""
+受講者名簿・回答の一括取り込み
+
+行ごとに検証して記録に変換し、IMPORT_BATCH_SIZE 件ごとに store.import_batch でまとめて適用する
+（スコア・状態の索引・集計の更新と永続化はバッチごとに1回）
+冪等キーを指定した場合はバッチごとに「キー:種類:バッチ番号」のキーを付け、同じ内容を同じキーで
+再送しても適用済みのバッチは数え直さない（バッチの内容のハッシュも一緒に記録し、同じキーで内容が
+異なる場合は store.ImportConflictError で拒否する）
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app import data, store
+
+
+# 1回の store.import_batch で適用する件数
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+# 応答に含める不正な行の最大件数（件数自体はすべて数える）
+IMPORT_MAX_ERRORS = 100
+
+
+def _name(row) -> str:
+    # 名簿は名前だけの配列も受け付ける
+    name = row if isinstance(row, str) else row.get("name") if isinstance(row, dict) else None
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("name is required")
+    return name
+
+
+def _user_record(row, at: str) -> Dict:
+    return {"type": "user", "name": _name(row), "at": at}
+
+
+def _answer_record(row, at: str) -> Dict:
+    """回答の行を検証し、設問の索引にある設問・選択肢への回答だけを記録にする"""
+    if not isinstance(row, dict):
+        raise ValueError("answer must be an object")
+    name = _name(row)
+    question_id = row.get("question_id")
+    if not isinstance(question_id, str):
+        raise ValueError("question_id is required")
+    question = data.get_question_by_id(question_id)
+    selected_index = row.get("selected_index")
+    if isinstance(selected_index, bool) or not isinstance(selected_index, int):
+        raise ValueError("selected_index must be an integer")
+    if not 0 <= selected_index < len(question.choices):
+        raise ValueError(f"Invalid choice index: {selected_index}")
+    answered_at = row.get("answered_at")
+    if answered_at is not None:
+        # LMSでの受講日時を引き継ぐ（最終更新日時として表示される）
+        try:
+            answered = datetime.fromisoformat(answered_at)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid answered_at: {answered_at}")
+        if answered.tzinfo is not None:
+            # ストアの日時はタイムゾーンなしのローカル時刻で持つ
+            answered = answered.astimezone().replace(tzinfo=None)
+        at = answered.isoformat()
+    return {"type": "answer", "name": name, "question_id": question.id, "selected_index": selected_index,
+            "at": at}
+
+
+_CONVERTERS = {"users": _user_record, "answers": _answer_record}
+
+
+class BulkImport:
+    """1回の取り込み（リクエスト）の状態。add で行を受け取り、flush でたまったバッチを適用する"""
+
+    def __init__(self, kind: str, key: Optional[str] = None, batch_size: int = IMPORT_BATCH_SIZE):
+        if kind not in _CONVERTERS:
+            raise ValueError(f"Unknown import kind: {kind}")
+        self.kind = kind
+        self.key = key
+        self.batch_size = batch_size
+        self.received = 0
+        self.rejected = 0
+        self.errors: List[Dict] = []
+        self.batches = 0
+        self.replayed_batches = 0
+        self.applied = {"records": 0, "created_users": 0, "answers": 0}
+        self._pending: List[Dict] = []
+        # 受け付けた行の内容のハッシュ（取り込んだ日時などリクエストごとに変わる値は含めない）
+        self._fingerprint = hashlib.sha256()
+        self._at = datetime.now().isoformat()
+
+    def add(self, line: int, row) -> bool:
+        """
+        1行を検証してバッチに加える（不正な行は理由を記録して読み飛ばす）
+        バッチが一杯になったら True を返すので、flush を呼ぶ
+        """
+        self.received += 1
+        try:
+            if isinstance(row, Exception):
+                raise row
+            self._pending.append(_CONVERTERS[self.kind](row, self._at))
+            self._fingerprint.update(json.dumps(row, ensure_ascii=False, sort_keys=True).encode("utf-8") + b"\n")
+        except ValueError as e:
+            self.reject(line, e)
+        return len(self._pending) >= self.batch_size
+
+    def reject(self, line: int, error: ValueError):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": str(error)})
+
+    def flush(self):
+        """たまった行を1バッチとして適用する（冪等キーが内容の異なるバッチに使われていれば ImportConflictError）"""
+        if not self._pending:
+            return
+        key = f"{self.key}:{self.kind}:{self.batches}" if self.key else None
+        result = store.import_batch(self._pending, key=key, fingerprint=self._fingerprint.hexdigest())
+        self._pending = []
+        self._fingerprint = hashlib.sha256()
+        self.batches += 1
+        if result["replayed"]:
+            self.replayed_batches += 1
+            return
+        for field in self.applied:
+            self.applied[field] += result[field]
+
+    def summary(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "idempotency_key": self.key,
+            "received": self.received,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "batches": self.batches,
+            "replayed_batches": self.replayed_batches,
+            "applied": self.applied,
+        }
@@ -1,18 +1,74 @@
 """
 FastAPI メインアプリケーション
 """
-from fastapi import FastAPI, Request, Form, HTTPException, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import Depends, FastAPI, Request, Form, Header, HTTPException, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from typing import Optional
+import json
 import os
 
 from app import data, store
-from app.schemas import AnswerRequest, RemindRequest
-from app import rag
-
-app = FastAPI(title="内部研修デモアプリ")
+from app.schemas import AnswerRequest, RemindRequest, QABatchRequest, QuestionAnswerRequest
+from app import export, importer, rag
+from app.assets import PrecompressedStaticFiles, asset_url
+from app.question_bank import get_question_bank, normalize_text, resolve_fields
+from app.ranking import RANKERS
+from app.executor import qa_executor, QAOverloadedError, QATimeoutError
+from app.dispatch import reminder_dispatcher
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時の初期化"""
+    # 受講者データの永続化バックエンドを開き、保存済みのデータを復元
+    store.init_storage()
+    # 規程検索インデックスを事前に構築し、policies.jsonの変更監視を開始
+    rag.get_policy_index()
+    rag.policy_watcher.start()
+    # 設問バンク（questions.json）を検証して読み込み、索引を構築
+    get_question_bank()
+    # QA処理の実行器（スレッド/プロセスプール）を起動
+    qa_executor.start()
+    # リマインド配信のワーカーを起動
+    reminder_dispatcher.start()
+    yield
+    await reminder_dispatcher.stop()
+    qa_executor.shutdown()
+    rag.policy_watcher.stop()
+    store.close_storage()
+
+
+async def sync_store():
+    """
+    他のワーカープロセスの更新を取り込んでからリクエストを処理する（STORE_BACKEND=shared の場合）
+    それ以外のバックエンドではスレッドプールに回さずにすぐ返す
+    """
+    if store.needs_refresh():
+        await run_in_threadpool(store.refresh)
+
+
+app = FastAPI(title="内部研修デモアプリ", lifespan=lifespan, dependencies=[Depends(sync_store)])
+
+# QA一括APIで1リクエストに受け付ける質問数の上限と、1回の処理にまとめる件数
+QA_BATCH_MAX_QUERIES = int(os.environ.get("QA_BATCH_MAX_QUERIES", "1000"))
+QA_BATCH_CHUNK = 200
+
+# 設問APIの1ページあたりの件数（既定・上限）
+QUESTIONS_PAGE_SIZE = 20
+QUESTIONS_PAGE_MAX = 100
+
+# QA画面に表示するチャット履歴の件数（質問と回答で2件）と、履歴APIの1ページの上限
+QA_HISTORY_PAGE_SIZE = 20
+QA_HISTORY_PAGE_MAX = 100
+
+# 通知ログ・エスカレーション管理画面・受講者一覧の1ページあたりの件数
+ADMIN_PAGE_SIZE = 50
+
+# 受講者検索API（/admin/users）の1ページあたりの件数（既定・上限）
+USERS_PAGE_SIZE = 100
+USERS_PAGE_MAX = 500
 
 # テンプレートと静的ファイルの設定
 templates = Jinja2Templates(directory="app/templates")
@@ -26,7 +82,9 @@ def round_filter(value, precision=0):
         return value
 
 templates.env.filters["round"] = round_filter
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# 静的ファイルのURL（copy_questions.pyでビルド済みならハッシュ付きのURL）
+templates.env.globals["asset_url"] = asset_url
+app.mount("/static", PrecompressedStaticFiles(directory="app/static"), name="static")
 
 
 # ==================== 受講者向け画面 ====================
@@ -66,36 +124,26 @@ async def quiz_page(
         raise HTTPException(status_code=404, detail="Questions not found")
     
     user = store.get_or_create_user(name)
-    answered_question_ids = set(user.answers.keys())
     
-    # 未回答の最初の設問を取得
-    current_question = None
-    question_index = 0
-    for idx, q in enumerate(questions):
-        if q.id not in answered_question_ids:
-            current_question = q
-            question_index = idx
-            break
+    # 未回答の最初の設問を取得（save_answerで更新済みの位置を参照）
+    question_index = user.next_position(topic)
     
     # すべて回答済みの場合は結果ページにリダイレクト
-    if current_question is None:
+    if question_index >= len(questions):
         return RedirectResponse(url=f"/result/{topic}?name={name}", status_code=303)
+    current_question = questions[question_index]
     
     # 前の設問の回答結果を取得（表示用）
-    # show_resultパラメータがある場合、または前の設問が回答済みの場合
+    # 現在の設問より前の設問はすべて回答済みなので、直前の設問の回答を表示する
     previous_result = None
-    if show_result or question_index > 0:
-        # 最新の回答結果を取得（回答済みの設問のうち、現在の設問の前のもの）
-        for idx in range(question_index - 1, -1, -1):
-            prev_q = questions[idx]
-            if prev_q.id in user.answers:
-                selected = user.answers[prev_q.id]
-                previous_result = {
-                    "question": prev_q,
-                    "selected_index": selected,
-                    "is_correct": selected == prev_q.correct_index
-                }
-                break
+    if question_index > 0:
+        prev_q = questions[question_index - 1]
+        selected = user.answers[prev_q.id]
+        previous_result = {
+            "question": prev_q,
+            "selected_index": selected,
+            "is_correct": selected == prev_q.correct_index
+        }
     
     return templates.TemplateResponse(
         "quiz.html",
@@ -185,41 +233,273 @@ async def result_page(
     )
 
 
+# ==================== 設問API ====================
+
+def _filter_value(value: Optional[str]) -> Optional[str]:
+    """未指定・"all" は条件なしとして扱う"""
+    if value is None or value == "" or value == "all":
+        return None
+    return value
+
+
+def _etag_response(request: Request, body: bytes, etag: str) -> Response:
+    """If-None-Matchが一致すれば304、そうでなければJSON本体を返す（毎回ETagで再検証させる）"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/api/questions")
+async def list_questions(
+    request: Request,
+    year: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    theme: Optional[str] = Query(None),
+    difficulty: Optional[str] = Query(None),
+    tag: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, max_length=200),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(QUESTIONS_PAGE_SIZE, ge=1, le=QUESTIONS_PAGE_MAX),
+    view: str = Query("quiz"),
+    fields: Optional[str] = Query(None),
+    lang: Optional[str] = Query(None)
+):
+    """設問一覧（絞り込み・全文検索・カーソルページング・返却項目の指定）"""
+    try:
+        projection = resolve_fields(view, fields, lang)
+        body, etag = get_question_bank().render_page(
+            _filter_value(year), _filter_value(category), _filter_value(theme),
+            _filter_value(difficulty), _filter_value(tag), normalize_text(q or ""),
+            cursor or None, limit, projection
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _etag_response(request, body, etag)
+
+
+@app.get("/api/questions/facets")
+async def question_facets(
+    request: Request,
+    year: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    theme: Optional[str] = Query(None),
+    difficulty: Optional[str] = Query(None)
+):
+    """絞り込み結果内の年次・カテゴリ・テーマ・難易度ごとの設問数"""
+    body, etag = get_question_bank().render_facets(
+        _filter_value(year), _filter_value(category), _filter_value(theme), _filter_value(difficulty)
+    )
+    return _etag_response(request, body, etag)
+
+
+@app.get("/api/questions/{question_id}")
+async def get_question(
+    request: Request,
+    question_id: str,
+    view: str = Query("quiz"),
+    fields: Optional[str] = Query(None),
+    lang: Optional[str] = Query(None)
+):
+    """設問1件"""
+    try:
+        projection = resolve_fields(view, fields, lang)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        body, etag = get_question_bank().render_question(question_id, projection)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _etag_response(request, body, etag)
+
+
+@app.post("/api/questions/{question_id}/answer")
+async def check_question_answer(question_id: str, payload: QuestionAnswerRequest):
+    """
+    回答の正誤判定（正解・解説は回答後にだけ返す）
+    設問バンクは読み取り専用で、回答はストアに記録しない（受講者の進捗・管理画面の集計には反映されない）
+    """
+    bank = get_question_bank()
+    try:
+        question = bank.get(question_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        correct = bank.check_answer(question_id, payload.selected_index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({
+        "question_id": question_id,
+        "selected_index": payload.selected_index,
+        "correct": correct,
+        "correct_choice_index": question.correct_choice_index,
+        "explanation_ja": question.explanation_ja,
+        "explanation_en": question.explanation_en,
+        "source_url": question.source_url,
+    })
+
+
 # ==================== 管理者向け画面 ====================
 
+def _user_filter(topic: Optional[str], status: Optional[str]) -> tuple:
+    """受講者の絞り込み条件を検証する（未指定・"all" は条件なし）"""
+    topic, status = _filter_value(topic), _filter_value(status)
+    if topic is not None and topic not in store.TOPICS:
+        raise HTTPException(status_code=400, detail=f"Invalid topic: {topic}")
+    if status is not None and status not in store.STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {status}")
+    return topic, status
+
+
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_page(request: Request):
-    """受講者一覧と集計情報"""
-    users = store.get_all_users()
+async def admin_page(
+    request: Request,
+    topic: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    after: Optional[str] = Query(None)
+):
+    """受講者一覧（テーマ×状態で絞り込み、名前順にページング）と集計情報"""
+    topic, status = _user_filter(topic, status)
+    users, next_after, user_total = store.find_users(topic, status, ADMIN_PAGE_SIZE, after or None)
     stats = store.get_topic_statistics()
     top_incorrect = store.get_top_incorrect_questions(limit=3)
+    qa_cache = rag.answer_cache.stats()
+    policy_index = rag.get_index_status()
     
     return templates.TemplateResponse(
         "admin.html",
         {
             "request": request,
             "users": users,
+            "user_total": user_total,
+            "topic": topic,
+            "status": status,
+            "after": after,
+            "next_after": next_after,
+            "status_counts": store.get_status_counts(),
             "stats": stats,
-            "top_incorrect": top_incorrect
+            "top_incorrect": top_incorrect,
+            "qa_cache": qa_cache,
+            "policy_index": policy_index
         }
     )
 
 
+def _user_json(user: store.UserProgress) -> dict:
+    return {
+        "name": user.name,
+        "status_by_topic": user.status_by_topic,
+        "score_by_topic": user.score_by_topic,
+        "updated_at": user.updated_at.isoformat() if user.updated_at else None,
+    }
+
+
+@app.get("/admin/users")
+async def admin_users(
+    topic: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    after: Optional[str] = Query(None),
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_PAGE_MAX)
+):
+    """
+    受講者の検索（テーマ×状態の索引から名前順に1ページ）
+    topic を省略すると「いずれかのテーマが status」、status を省略すると全員
+    next_after を次の after に指定すると続きを取得できる（これ以上なければ null）
+    """
+    topic, status = _user_filter(topic, status)
+    users, next_after, total = store.find_users(topic, status, limit, after or None)
+    return JSONResponse({
+        "users": [_user_json(user) for user in users],
+        "next_after": next_after,
+        "total": total,
+        "counts": store.get_status_counts(),
+    })
+
+
+@app.get("/admin/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    fmt: str = Query("csv", alias="format"),
+    compress: bool = Query(False, alias="gzip")
+):
+    """
+    受講者・回答・チャット履歴・エスカレーションの全件エクスポート（CSV / NDJSON、gzip=true で圧縮）
+    ストアを少しずつ読みながら返すため、件数によらずメモリ使用量は一定で、回答の保存も止めない
+    """
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset: {dataset}")
+    if fmt not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format: {fmt}")
+    filename = export.export_filename(dataset, fmt, compress)
+    # 同期ジェネレータはスレッドプールで1チャンクずつ進むため、イベントループを止めない
+    return StreamingResponse(
+        export.export(dataset, fmt, compress),
+        media_type=export.media_type(fmt, compress),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/admin/qa-cache")
+async def qa_cache_stats():
+    """QA回答キャッシュの統計情報"""
+    return JSONResponse(rag.answer_cache.stats())
+
+
+@app.get("/admin/qa-executor")
+async def qa_executor_stats():
+    """QA処理の実行器の状態（待機数・混雑/タイムアウト件数）"""
+    return JSONResponse(qa_executor.stats())
+
+
+@app.get("/admin/storage")
+async def storage_stats():
+    """受講者データの永続化バックエンドの状態（書き込みに失敗し続けている間は503）"""
+    stats = store.get_storage_stats()
+    return JSONResponse(stats, status_code=200 if stats.get("healthy", True) else 503)
+
+
+@app.get("/admin/policies/status")
+async def policy_index_status():
+    """規程インデックスの版・構築時間"""
+    return JSONResponse(rag.get_index_status())
+
+
+@app.get("/admin/question-bank")
+async def question_bank_status():
+    """設問バンクの件数（年次・カテゴリ・難易度別）"""
+    return JSONResponse(get_question_bank().stats())
+
+
+@app.post("/admin/policies/reload")
+async def reload_policies(force: bool = Query(False)):
+    """policies.jsonを読み直してインデックスを再構築"""
+    status = await run_in_threadpool(rag.reload_policy_index, force)
+    return JSONResponse(status, status_code=500 if status["last_error"] else 200)
+
+
 @app.get("/admin/remind", response_class=HTMLResponse)
-async def remind_page(request: Request):
-    """リマインド送信フォーム"""
-    users = store.get_all_users()
-    # 未受講者を抽出
-    not_started_users = []
-    for user in users:
-        if any(status == "not_started" for status in user.status_by_topic.values()):
-            not_started_users.append(user)
+async def remind_page(
+    request: Request,
+    topic: Optional[str] = Query(None),
+    status: Optional[str] = Query("not_started")
+):
+    """リマインド送信フォーム（既定はいずれかのテーマが未受講のユーザー。続きは /admin/users で読み込む）"""
+    topic, status = _user_filter(topic, status)
+    users, next_after, total = store.find_users(topic, status, USERS_PAGE_SIZE)
     
     return templates.TemplateResponse(
         "remind.html",
         {
             "request": request,
-            "users": not_started_users
+            "users": users,
+            "total": total,
+            "topic": topic,
+            "status": status,
+            "next_after": next_after,
+            "status_counts": store.get_status_counts()
         }
     )
 
@@ -237,25 +517,70 @@ async def send_remind(request: Request):
             {"request": request, "message": "送信先が選択されていません。"}
         )
     
-    # 通知ログに記録
-    for name in selected_names:
-        store.add_notification_log(name, message=message)
+    # 配信キューに積んですぐに返し、進捗画面で配信状況を確認する（通知ログには届いた宛先を記録）
+    job = reminder_dispatcher.submit(selected_names, message)
     
-    return RedirectResponse(url="/admin/logs", status_code=303)
+    return RedirectResponse(url=f"/admin/remind/jobs/{job.id}", status_code=303)
+
+
+@app.get("/admin/remind/jobs/{job_id}", response_class=HTMLResponse)
+async def remind_job_page(request: Request, job_id: str):
+    """リマインド配信の進捗"""
+    job = reminder_dispatcher.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return templates.TemplateResponse(
+        "remind_job.html",
+        {
+            "request": request,
+            "job": job.to_dict()
+        }
+    )
+
+
+@app.post("/api/remind", status_code=202)
+async def api_send_remind(payload: RemindRequest):
+    """リマインド配信の依頼（JSON）。ジョブIDと進捗の確認先を返す"""
+    if not payload.selected_names:
+        raise HTTPException(status_code=422, detail="selected_names is empty")
+    job = reminder_dispatcher.submit(payload.selected_names, payload.message)
+    return {**job.to_dict(), "status_url": f"/api/remind/jobs/{job.id}"}
+
+
+@app.get("/api/remind/jobs/{job_id}")
+async def api_remind_job(job_id: str, recipients: bool = Query(False)):
+    """リマインド配信の進捗（recipients=true で宛先ごとの配信状態も返す）"""
+    job = reminder_dispatcher.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict(include_recipients=recipients)
+
+
+@app.get("/admin/remind/dispatcher")
+async def remind_dispatcher_status():
+    """リマインド配信キューの状態（JSON）"""
+    return JSONResponse(reminder_dispatcher.stats())
 
 
 @app.get("/admin/logs", response_class=HTMLResponse)
-async def logs_page(request: Request):
-    """通知ログ一覧"""
-    logs = store.get_notification_logs()
-    # 新しい順にソート
-    logs.sort(key=lambda x: x.sent_at, reverse=True)
+async def logs_page(
+    request: Request,
+    to: Optional[str] = Query(None),
+    before: Optional[int] = Query(None, ge=1)
+):
+    """通知ログ一覧（新しい順。送信先での絞り込みと、通し番号をカーソルにしたページング）"""
+    to = _filter_value(to)
+    logs, next_before = store.get_notification_page(ADMIN_PAGE_SIZE, before=before, to_name=to)
     
     return templates.TemplateResponse(
         "logs.html",
         {
             "request": request,
-            "logs": logs
+            "logs": logs,
+            "to": to,
+            "before": before,
+            "next_before": next_before
         }
     )
 
@@ -263,26 +588,60 @@ async def logs_page(request: Request):
 # ==================== QA機能（擬似RAG） ====================
 
 @app.get("/qa", response_class=HTMLResponse)
-async def qa_page(request: Request, name: Optional[str] = Query(None)):
-    """QAチャットUI"""
+async def qa_page(
+    request: Request,
+    name: Optional[str] = Query(None),
+    before: Optional[int] = Query(None, ge=1)
+):
+    """QAチャットUI（最新の QA_HISTORY_PAGE_SIZE 件だけを表示し、古い履歴は必要になったら読み込む）"""
     if not name:
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "message": "名前が指定されていません。トップページから名前を入力してください。"}
         )
     
-    chat_history = store.get_chat_history(name)
+    chat_history, older_before = store.get_chat_page(name, QA_HISTORY_PAGE_SIZE, before)
     
     return templates.TemplateResponse(
         "qa.html",
         {
             "request": request,
             "name": name,
-            "chat_history": chat_history
+            "chat_history": chat_history,
+            "older_before": older_before
         }
     )
 
 
+def _chat_message_json(msg) -> dict:
+    return {
+        "seq": msg.seq,
+        "is_user": msg.is_user,
+        "message": msg.message,
+        "time": msg.timestamp.strftime('%Y-%m-%d %H:%M'),
+        "answer": msg.answer,
+        "references": msg.references,
+        "confidence": msg.confidence,
+    }
+
+
+@app.get("/api/qa/history")
+async def qa_history(
+    name: str = Query(..., min_length=1),
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(QA_HISTORY_PAGE_SIZE, ge=1, le=QA_HISTORY_PAGE_MAX)
+):
+    """
+    チャット履歴のページ（古い順）
+    next_before を次の before に指定すると、さらに古いページを取得できる（これ以上なければ null）
+    """
+    messages, older_before = store.get_chat_page(name, limit, before)
+    return JSONResponse({
+        "messages": [_chat_message_json(msg) for msg in messages],
+        "next_before": older_before,
+    })
+
+
 @app.post("/qa")
 async def qa_submit(request: Request):
     """QA質問送信・回答生成"""
@@ -296,19 +655,24 @@ async def qa_submit(request: Request):
             {"request": request, "message": "名前とメッセージを入力してください。"}
         )
     
-    # ユーザーメッセージを保存
-    store.add_chat_message(name, message, is_user=True)
-    
-    # 規程検索
-    top_results = rag.search_policies(message, top_k=3)
-    
-    # 自信度計算
-    confidence = rag.calculate_confidence(top_results)
-    
-    # 要約回答生成
-    summary = rag.generate_summary(message, top_results)
+    # 規程検索・自信度計算・要約回答生成（イベントループの外で実行し、同じ質問はキャッシュから返す）
+    try:
+        top_results, confidence, summary = await qa_executor.answer(message, top_k=3)
+    except QAOverloadedError:
+        return templates.TemplateResponse(
+            "error.html",
+            {"request": request, "message": "現在QAが混雑しています。しばらくしてから再度お試しください。"},
+            status_code=503
+        )
+    except QATimeoutError:
+        return templates.TemplateResponse(
+            "error.html",
+            {"request": request, "message": "回答の生成がタイムアウトしました。しばらくしてから再度お試しください。"},
+            status_code=504
+        )
     
-    # 回答メッセージを保存
+    # ユーザーメッセージと回答メッセージを保存
+    store.add_chat_message(name, message, is_user=True)
     store.add_chat_message(
         name, 
         summary, 
@@ -321,6 +685,108 @@ async def qa_submit(request: Request):
     return RedirectResponse(url=f"/qa?name={name}", status_code=303)
 
 
+def _sse_event(event: str, payload) -> str:
+    """Server-Sent Eventsの1イベント分の文字列"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/qa/stream")
+async def qa_stream(request: Request):
+    """QA質問送信（参照条文・自信度・要約をServer-Sent Eventsで順に返す）"""
+    form_data = await request.form()
+    name = form_data.get("name")
+    message = form_data.get("message")
+    
+    if not name or not message:
+        raise HTTPException(status_code=422, detail="名前とメッセージを入力してください。")
+    
+    async def events():
+        answer = {}
+        try:
+            async for stage, payload in qa_executor.answer_stream(message, top_k=3):
+                answer[stage] = payload
+                yield _sse_event(stage, payload)
+        except (QAOverloadedError, QATimeoutError) as e:
+            yield _sse_event("error", {"message": str(e)})
+            return
+        
+        # 回答がそろってからユーザーメッセージと回答メッセージを保存
+        store.add_chat_message(name, message, is_user=True)
+        store.add_chat_message(
+            name,
+            answer["summary"],
+            is_user=False,
+            answer=answer["summary"],
+            references=answer["references"],
+            confidence=answer["confidence"]
+        )
+        yield _sse_event("done", {})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/qa/batch")
+async def qa_batch(payload: QABatchRequest):
+    """QA一括問い合わせ（検索品質の評価・キャッシュの事前ウォームアップ用）"""
+    if not payload.queries:
+        raise HTTPException(status_code=422, detail="queries must not be empty")
+    if len(payload.queries) > QA_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=422, detail=f"Too many queries (max {QA_BATCH_MAX_QUERIES})")
+    if payload.top_k < 1:
+        raise HTTPException(status_code=422, detail="top_k must be positive")
+    if payload.ranker and payload.ranker not in RANKERS:
+        raise HTTPException(status_code=422, detail=f"Unknown ranker: {payload.ranker}")
+    if payload.record_history and not payload.name:
+        raise HTTPException(status_code=422, detail="name is required to record chat history")
+
+    async def answer_chunks():
+        # 一定件数ごとにまとめてスコアリングし、結果を順に返す
+        queries = payload.queries
+        for start in range(0, len(queries), QA_BATCH_CHUNK):
+            chunk = queries[start:start + QA_BATCH_CHUNK]
+            answers = await qa_executor.answer_batch(chunk, top_k=payload.top_k, ranker=payload.ranker)
+            for query, (references, confidence, summary) in zip(chunk, answers):
+                # チャット履歴は指定された場合のみ保存
+                if payload.record_history:
+                    store.add_chat_message(payload.name, query, is_user=True)
+                    store.add_chat_message(
+                        payload.name,
+                        summary,
+                        is_user=False,
+                        answer=summary,
+                        references=references,
+                        confidence=confidence
+                    )
+                yield {
+                    "query": query,
+                    "references": references,
+                    "confidence": confidence,
+                    "summary": summary
+                }
+
+    if payload.stream:
+        async def ndjson_lines():
+            try:
+                async for item in answer_chunks():
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+            except (QAOverloadedError, QATimeoutError) as e:
+                yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    try:
+        results = [item async for item in answer_chunks()]
+    except QAOverloadedError as e:
+        return JSONResponse({"detail": str(e)}, status_code=503)
+    except QATimeoutError as e:
+        return JSONResponse({"detail": str(e)}, status_code=504)
+    return JSONResponse({"count": len(results), "results": results})
+
+
 @app.post("/api/escalate")
 async def escalate(request: Request):
     """エスカレーション登録"""
@@ -328,9 +794,13 @@ async def escalate(request: Request):
     name = form_data.get("name")
     message = form_data.get("message")
     confidence = form_data.get("confidence", "Low")
+    if not isinstance(name, str) or not name.strip():
+        raise HTTPException(status_code=400, detail="name is required")
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPException(status_code=400, detail="message is required")
     
-    # 最新の回答から参照条文を取得
-    chat_history = store.get_chat_history(name)
+    # 最新の回答から参照条文を取得（QA画面に表示している最新の1ページだけを見る。退避した古い履歴は読まない）
+    chat_history, _ = store.get_chat_page(name, QA_HISTORY_PAGE_SIZE)
     retrieved_articles = []
     if chat_history:
         # 最新のボット回答を探す
@@ -353,17 +823,29 @@ async def escalate(request: Request):
 
 
 @app.get("/admin/escalations", response_class=HTMLResponse)
-async def escalations_page(request: Request):
-    """エスカレーション管理画面"""
-    escalations = store.get_escalations()
-    # 新しい順にソート
-    escalations.sort(key=lambda x: x.created_at, reverse=True)
+async def escalations_page(
+    request: Request,
+    status: Optional[str] = Query(None),
+    name: Optional[str] = Query(None),
+    before: Optional[int] = Query(None, ge=1)
+):
+    """エスカレーション管理画面（新しい順。ステータス・相談者での絞り込みと、IDをカーソルにしたページング）"""
+    status = _filter_value(status)
+    if status is not None and status not in store.ESCALATION_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {status}")
+    name = _filter_value(name)
+    escalations, next_before = store.get_escalation_page(ADMIN_PAGE_SIZE, before=before, status=status, name=name)
     
     return templates.TemplateResponse(
         "escalations.html",
         {
             "request": request,
-            "escalations": escalations
+            "escalations": escalations,
+            "status_counts": store.get_escalation_counts(),
+            "status": status,
+            "name": name,
+            "before": before,
+            "next_before": next_before
         }
     )
 
@@ -374,10 +856,89 @@ async def update_escalation_status(request: Request, escalation_id: int):
     form_data = await request.form()
     status = form_data.get("status")
     
-    if status in ["open", "in_progress", "closed"]:
+    if status in store.ESCALATION_STATUSES:
         store.update_escalation_status(escalation_id, status)
     
-    return RedirectResponse(url="/admin/escalations", status_code=303)
+    # 絞り込み・ページの状態を保ったまま一覧に戻る
+    back = form_data.get("back") or ""
+    if not back.startswith("/admin/escalations"):
+        back = "/admin/escalations"
+    return RedirectResponse(url=back, status_code=303)
+
+
+# ==================== 一括取り込み ====================
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+async def _import_rows(request: Request, field: str):
+    """
+    一括取り込みの本文から (行番号, 行) を順に返す
+    NDJSON（1行1件）は受信しながら1行ずつ読み、JSONは {field: [...]} または配列を受け付ける
+    読めない行は行の代わりに ValueError を返す
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in NDJSON_MEDIA_TYPES:
+        line_no = 0
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_no += 1
+                if line.strip():
+                    yield line_no, _parse_ndjson_line(line)
+        if buffer.strip():
+            yield line_no + 1, _parse_ndjson_line(buffer)
+        return
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    rows = body.get(field) if isinstance(body, dict) else body
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail=f"Body must be a list or an object with \"{field}\"")
+    for line_no, row in enumerate(rows, start=1):
+        yield line_no, row
+
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+async def _run_import(request: Request, kind: str, key: Optional[str]) -> JSONResponse:
+    """行を検証しながらバッチにため、一杯になるごとにスレッドプールで適用する"""
+    bulk = importer.BulkImport(kind, key or None)
+    try:
+        async for line_no, row in _import_rows(request, kind):
+            if bulk.add(line_no, row):
+                await run_in_threadpool(bulk.flush)
+        await run_in_threadpool(bulk.flush)
+    except store.ImportConflictError as e:
+        # 同じ冪等キーで内容の異なる取り込み（それより前のバッチは適用済み）
+        return JSONResponse({**bulk.summary(), "error": str(e)}, status_code=409)
+    return JSONResponse(bulk.summary())
+
+
+@app.post("/api/import/users")
+async def import_users(request: Request, idempotency_key: Optional[str] = Header(None)):
+    """
+    受講者名簿の一括取り込み（JSON {"users": [{"name": ...}]} / 名前の配列、または NDJSON）
+    Idempotency-Key を付けると、同じ内容の再送で適用済みのバッチを数え直さない
+    """
+    return await _run_import(request, "users", idempotency_key)
+
+
+@app.post("/api/import/answers")
+async def import_answers(request: Request, idempotency_key: Optional[str] = Header(None)):
+    """
+    回答の一括取り込み（JSON {"answers": [...]} または NDJSON。1件は name, question_id, selected_index,
+    answered_at〈任意〉）。設問の索引で検証し、不正な行は理由を返して読み飛ばす
+    """
+    return await _run_import(request, "answers", idempotency_key)
 
 
 # ==================== クイズ管理者画面 ====================
@@ -0,0 +1,306 @@
+"""
+設問バンク（questions.json）の読み込みと索引
+起動時にスキーマ検証して読み込み、year / category / theme / difficulty / tags の索引を構築する
+
+設問バンクは読み取り専用で、ストア（受講者の進捗・テーマ別の集計・誤答ランキング・リマインド対象）とは
+つながっていない。ストアが採点・集計するのは data.QUESTIONS の設問だけで、check_answer は正誤を返すだけで
+回答をどのユーザーにも記録しない（/quiz の進捗はブラウザのlocalStorageにだけ残る）
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+
+from app.schemas import BankQuestion
+
+
+QUESTION_BANK_PATH = Path(
+    os.environ.get("QUESTION_BANK_PATH", Path(__file__).parent.parent / "questions.json")
+)
+
+# 索引を作成する項目（tagsは1問に複数の値を持つ）
+INDEX_KEYS = ("year", "category", "theme", "difficulty", "tags")
+
+# 絞り込み結果を事前計算する項目（各項目は「値」または「指定なし」の組み合わせ）
+SLICE_KEYS = ("year", "category", "theme", "difficulty")
+
+QUESTION_FIELDS = tuple(BankQuestion.model_fields)
+
+# 設問APIの返却項目のプリセット（quizは解答・解説を含まない）
+QUESTION_VIEWS: Dict[str, Tuple[str, ...]] = {
+    "quiz": ("id", "year", "category", "theme", "difficulty", "tags",
+             "question_ja", "question_en", "choices_ja", "choices_en"),
+    "summary": ("id", "year", "category", "theme", "difficulty", "tags",
+                "learning_goal_ja", "learning_goal_en"),
+    "full": QUESTION_FIELDS,
+}
+LANGUAGES = ("ja", "en")
+
+# 設問ページ・集計のレスポンスを保持する件数
+RESPONSE_CACHE_SIZE = 1024
+
+Criterion = Union[str, Iterable[str], None]
+
+
+class QuestionBankError(ValueError):
+    """設問バンクの内容が不正"""
+
+
+def _validate(raw: List[Dict]) -> List[BankQuestion]:
+    """設問ごとにスキーマと項目間の整合性を検証"""
+    if not isinstance(raw, list):
+        raise QuestionBankError("questions.json must be a list of questions")
+
+    questions = []
+    seen = set()
+    for position, item in enumerate(raw):
+        try:
+            question = BankQuestion(**item)
+        except (TypeError, ValidationError) as e:
+            raise QuestionBankError(f"Invalid question at index {position}: {e}") from e
+
+        if question.id in seen:
+            raise QuestionBankError(f"Duplicate question id: {question.id}")
+        if not question.choices_ja:
+            raise QuestionBankError(f"Question has no choices: {question.id}")
+        if question.choices_en and len(question.choices_en) != len(question.choices_ja):
+            raise QuestionBankError(f"choices_ja and choices_en differ in length: {question.id}")
+        if not 0 <= question.correct_choice_index < len(question.choices_ja):
+            raise QuestionBankError(f"correct_choice_index out of range: {question.id}")
+        seen.add(question.id)
+        questions.append(question)
+    return questions
+
+
+def normalize_text(text: str) -> str:
+    """全文検索用の正規化（NFKC・小文字化・空白の統一）"""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def resolve_fields(view: str = "quiz", fields: Optional[str] = None,
+                   lang: Optional[str] = None) -> Tuple[str, ...]:
+    """
+    返却項目を決める
+    fields（カンマ区切り）を指定した場合はviewより優先し、langを指定した場合は他言語の項目を除く
+    """
+    if fields:
+        selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in selected if f not in QUESTION_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field: {', '.join(unknown)}")
+    elif view in QUESTION_VIEWS:
+        selected = QUESTION_VIEWS[view]
+    else:
+        raise ValueError(f"Unknown view: {view}")
+
+    if lang is not None:
+        if lang not in LANGUAGES:
+            raise ValueError(f"Unknown language: {lang}")
+        excluded = tuple(f"_{other}" for other in LANGUAGES if other != lang)
+        selected = tuple(f for f in selected if not f.endswith(excluded))
+    if "id" not in selected:
+        selected = ("id",) + selected
+    return selected
+
+
+def _search_text(question: BankQuestion) -> str:
+    return normalize_text(" ".join([
+        question.id, question.theme, question.learning_goal_ja, question.learning_goal_en,
+        question.question_ja, question.question_en, *question.tags,
+    ]))
+
+
+def _encode(payload: Dict) -> Tuple[bytes, str]:
+    """JSONにシリアライズし、内容から求めたETagと組にする"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class QuestionBank:
+    """
+    設問バンクの索引
+    項目の値ごとに設問の通し番号のタプルを保持し、絞り込みは通し番号の集合の積で行う
+    year / category / theme / difficulty の組み合わせごとの絞り込み結果は構築時に計算しておく
+    """
+    def __init__(self, questions: List[BankQuestion], digest: str = ""):
+        self.digest = digest
+        self.questions: Tuple[BankQuestion, ...] = tuple(questions)
+        self.by_id: Dict[str, BankQuestion] = {q.id: q for q in self.questions}
+        self.ordinals: Dict[str, int] = {q.id: i for i, q in enumerate(self.questions)}
+
+        indexes: Dict[str, Dict[str, List[int]]] = {key: {} for key in INDEX_KEYS}
+        for ordinal, question in enumerate(self.questions):
+            for key in INDEX_KEYS:
+                values = getattr(question, key)
+                for value in (values if isinstance(values, list) else [values]):
+                    postings = indexes[key].setdefault(value, [])
+                    if not postings or postings[-1] != ordinal:
+                        postings.append(ordinal)
+        self.indexes: Dict[str, Dict[str, Tuple[int, ...]]] = {
+            key: {value: tuple(ordinals) for value, ordinals in values.items()}
+            for key, values in indexes.items()
+        }
+
+        # 各設問を、自分の値と「指定なし」を組み合わせたすべての絞り込み条件に登録する
+        slices: Dict[Tuple[Optional[str], ...], List[int]] = {}
+        for ordinal, question in enumerate(self.questions):
+            values = tuple(getattr(question, key) for key in SLICE_KEYS)
+            for mask in range(1 << len(SLICE_KEYS)):
+                key = tuple(value if mask & (1 << i) else None for i, value in enumerate(values))
+                slices.setdefault(key, []).append(ordinal)
+        self.slices: Dict[Tuple[Optional[str], ...], Tuple[int, ...]] = {
+            key: tuple(ordinals) for key, ordinals in slices.items()
+        }
+
+        self.records: Tuple[Dict, ...] = tuple(
+            {field: getattr(q, field) for field in QUESTION_FIELDS} for q in self.questions
+        )
+        self._search_texts: Tuple[str, ...] = tuple(_search_text(q) for q in self.questions)
+        self.query = lru_cache(maxsize=RESPONSE_CACHE_SIZE)(self._query)
+        self.render_page = lru_cache(maxsize=RESPONSE_CACHE_SIZE)(self._render_page)
+        self.render_facets = lru_cache(maxsize=RESPONSE_CACHE_SIZE)(self._render_facets)
+        self.render_question = lru_cache(maxsize=RESPONSE_CACHE_SIZE)(self._render_question)
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def get(self, question_id: str) -> BankQuestion:
+        question = self.by_id.get(question_id)
+        if question is None:
+            raise ValueError(f"Question not found: {question_id}")
+        return question
+
+    def values(self, key: str) -> Dict[str, int]:
+        """項目の値ごとの設問数（データの出現順）"""
+        return {value: len(ordinals) for value, ordinals in self.indexes[key].items()}
+
+    def select(self, **criteria: Criterion) -> Tuple[int, ...]:
+        """
+        条件に合う設問の通し番号を昇順で返す
+        項目間はAND、1つの項目に複数の値を渡した場合はOR（None / "all" は条件なし）
+        """
+        selected: Optional[set] = None
+        for key, criterion in criteria.items():
+            if key not in self.indexes:
+                raise ValueError(f"Unknown filter: {key}")
+            if criterion is None or criterion == "all":
+                continue
+            values = [criterion] if isinstance(criterion, str) else list(criterion)
+            matched = set()
+            for value in values:
+                matched.update(self.indexes[key].get(value, ()))
+            selected = matched if selected is None else selected & matched
+            if not selected:
+                return ()
+        if selected is None:
+            return tuple(range(len(self.questions)))
+        return tuple(sorted(selected))
+
+    def filter(self, **criteria: Criterion) -> List[BankQuestion]:
+        """条件に合う設問をデータの並び順で返す"""
+        return [self.questions[ordinal] for ordinal in self.select(**criteria)]
+
+    def _query(self, year: Optional[str] = None, category: Optional[str] = None,
+               theme: Optional[str] = None, difficulty: Optional[str] = None,
+               tag: Optional[str] = None, text: str = "") -> Tuple[int, ...]:
+        """事前計算した絞り込み結果に、タグと全文検索（正規化済みの部分一致）の条件を重ねる"""
+        ordinals = self.slices.get((year, category, theme, difficulty), ())
+        if tag:
+            tagged = set(self.indexes["tags"].get(tag, ()))
+            ordinals = tuple(o for o in ordinals if o in tagged)
+        if text:
+            ordinals = tuple(o for o in ordinals if text in self._search_texts[o])
+        return ordinals
+
+    def project(self, ordinal: int, fields: Tuple[str, ...]) -> Dict:
+        record = self.records[ordinal]
+        return {field: record[field] for field in fields}
+
+    def _render_page(self, year: Optional[str], category: Optional[str], theme: Optional[str],
+                     difficulty: Optional[str], tag: Optional[str], text: str,
+                     cursor: Optional[str], limit: int, fields: Tuple[str, ...]) -> Tuple[bytes, str]:
+        """
+        設問一覧の1ページ分のJSONとETag
+        cursorは前ページ最後の設問ID（通し番号順のキーセット方式なので、ページ間で重複・欠落しない）
+        """
+        ordinals = self.query(year, category, theme, difficulty, tag, text)
+        start = 0
+        if cursor:
+            if cursor not in self.ordinals:
+                raise ValueError(f"Invalid cursor: {cursor}")
+            start = bisect.bisect_right(ordinals, self.ordinals[cursor])
+        page = ordinals[start:start + limit]
+        has_more = start + limit < len(ordinals)
+        return _encode({
+            "items": [self.project(ordinal, fields) for ordinal in page],
+            "total": len(ordinals),
+            "limit": limit,
+            "next_cursor": self.questions[page[-1]].id if page and has_more else None,
+        })
+
+    def _render_facets(self, year: Optional[str], category: Optional[str], theme: Optional[str],
+                       difficulty: Optional[str]) -> Tuple[bytes, str]:
+        """絞り込み結果内での項目ごとの設問数（テーマ選択肢などに使う）"""
+        ordinals = self.slices.get((year, category, theme, difficulty), ())
+        facets = {}
+        for key, name in (("year", "years"), ("category", "categories"),
+                          ("theme", "themes"), ("difficulty", "difficulties")):
+            counts: Dict[str, int] = {}
+            for ordinal in ordinals:
+                value = getattr(self.questions[ordinal], key)
+                counts[value] = counts.get(value, 0) + 1
+            facets[name] = counts
+        return _encode({"total": len(ordinals), **facets})
+
+    def _render_question(self, question_id: str, fields: Tuple[str, ...]) -> Tuple[bytes, str]:
+        self.get(question_id)
+        return _encode(self.project(self.ordinals[question_id], fields))
+
+    def check_answer(self, question_id: str, selected_index: int) -> bool:
+        question = self.get(question_id)
+        if not 0 <= selected_index < len(question.choices_ja):
+            raise ValueError(f"Invalid choice index: {selected_index}")
+        return selected_index == question.correct_choice_index
+
+    def stats(self) -> Dict:
+        return {
+            "path": str(QUESTION_BANK_PATH),
+            "digest": self.digest,
+            "questions": len(self.questions),
+            "years": self.values("year"),
+            "categories": self.values("category"),
+            "difficulties": self.values("difficulty"),
+            "themes": len(self.indexes["theme"]),
+            "tags": len(self.indexes["tags"]),
+        }
+
+
+def load_question_bank(path: Path = None) -> QuestionBank:
+    """questions.jsonを読み込み、検証して索引を構築する"""
+    path = Path(path) if path is not None else QUESTION_BANK_PATH
+    with open(path, "rb") as f:
+        raw = f.read()
+    return QuestionBank(_validate(json.loads(raw)), digest=hashlib.sha256(raw).hexdigest())
+
+
+_question_bank: Optional[QuestionBank] = None
+_bank_lock = threading.Lock()
+
+
+def get_question_bank() -> QuestionBank:
+    """読み込み済みの設問バンクを返す（未読み込みなら読み込む）"""
+    global _question_bank
+    bank = _question_bank
+    if bank is None:
+        with _bank_lock:
+            if _question_bank is None:
+                _question_bank = load_question_bank()
+            bank = _question_bank
+    return bank
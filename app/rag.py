@@ -1,17 +1,48 @@
 """
 擬似RAG検索ロジック（キーワードマッチングベース）
 """
+import hashlib
 import json
 import os
 import re
-from typing import List, Dict, Tuple
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
+from app.ranking import RankerRegistry
+
+
+POLICIES_PATH = Path(__file__).parent / "knowledge" / "policies.json"
+
+# トークン化に使う正規表現（英数字の連続 / 日本語の連続）
+_ASCII_TOKEN_RE = re.compile(r'[a-zA-Z0-9]+')
+_JA_TOKEN_RE = re.compile(r'[ぁ-んァ-ヶー一-龠]+')
+
+# インデックス対象のフィールド
+INDEX_FIELDS = ("title", "body")
+
+# 日本語の文字n-gramの長さ（bi-gram / tri-gram）
+NGRAM_SIZES = (2, 3)
+
+# 既定のランキングバックエンド（keyword / bm25 / bm25f / ngram）
+DEFAULT_RANKER = os.environ.get("RAG_RANKER", "keyword")
+
+# policies.jsonの変更を確認する間隔（秒）。0で監視しない
+POLICY_RELOAD_INTERVAL = float(os.environ.get("RAG_RELOAD_INTERVAL", "5"))
+
+# 回答キャッシュの件数上限と有効期間（秒）。件数0でキャッシュ無効
+ANSWER_CACHE_SIZE = int(os.environ.get("RAG_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = float(os.environ.get("RAG_CACHE_TTL", "600"))
+
 
 def load_policies() -> List[Dict]:
     """規程データを読み込む"""
-    json_path = Path(__file__).parent / "knowledge" / "policies.json"
-    with open(json_path, "r", encoding="utf-8") as f:
+    with open(POLICIES_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
@@ -23,9 +54,26 @@ def simple_tokenize(text: str) -> List[str]:
     # 英数字の連続、ひらがな/カタカナ/漢字の連続を抽出
     tokens = []
     # 英数字の連続
-    tokens.extend(re.findall(r'[a-zA-Z0-9]+', text.lower()))
+    tokens.extend(_ASCII_TOKEN_RE.findall(text.lower()))
     # 日本語（ひらがな、カタカナ、漢字）の連続
-    tokens.extend(re.findall(r'[ぁ-んァ-ヶー一-龠]+', text))
+    tokens.extend(_JA_TOKEN_RE.findall(text))
+    return tokens
+
+
+def ngram_tokenize(text: str, sizes: Tuple[int, ...] = NGRAM_SIZES) -> List[str]:
+    """
+    文字n-gramによるトークン化（日本語向け）
+    英数字は従来どおり単語単位、日本語の連続は文字bi-gram/tri-gramに分解する
+    """
+    tokens = _ASCII_TOKEN_RE.findall(text.lower())
+    min_size = min(sizes)
+    for run in _JA_TOKEN_RE.findall(text):
+        if len(run) < min_size:
+            # n-gramを作れない短い連続はそのまま1語とする
+            tokens.append(run)
+            continue
+        for n in sizes:
+            tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
     return tokens
 
 
@@ -65,35 +113,333 @@ def calculate_score(query: str, policy: Dict) -> float:
     return score
 
 
-def search_policies(query: str, top_k: int = 3) -> List[Dict]:
+# ==================== 転置インデックス ====================
+
+class WordAnalyzer:
+    """英数字・日本語それぞれの最長連続部分を1語とする解析器（simple_tokenizeと同じ分割）"""
+    name = "word"
+
+    def index_terms(self, text: str) -> Dict[str, int]:
+        """フィールド本文（小文字化済み）を索引語に分割し、出現回数を数える"""
+        freqs: Dict[str, int] = {}
+        for regex in (_ASCII_TOKEN_RE, _JA_TOKEN_RE):
+            for term in regex.findall(text):
+                freqs[term] = freqs.get(term, 0) + 1
+        return freqs
+
+    def query_terms(self, query: str) -> List[str]:
+        return [token.lower() for token in simple_tokenize(query)]
+
+    def resolve(self, term_index: "TermIndex", token: str) -> Tuple[str, ...]:
+        """tokenを部分文字列として含む索引語を返す（語彙の走査）"""
+        return tuple(term for term in term_index.vocabulary if token in term)
+
+
+class NgramAnalyzer:
+    """英数字は単語単位、日本語は文字n-gramに分解する解析器"""
+    name = "ngram"
+
+    def __init__(self, sizes: Tuple[int, ...] = NGRAM_SIZES):
+        self.sizes = sizes
+
+    def index_terms(self, text: str) -> Dict[str, int]:
+        freqs: Dict[str, int] = {}
+        for term in ngram_tokenize(text, self.sizes):
+            freqs[term] = freqs.get(term, 0) + 1
+        return freqs
+
+    def query_terms(self, query: str) -> List[str]:
+        return ngram_tokenize(query, self.sizes)
+
+    def resolve(self, term_index: "TermIndex", token: str) -> Tuple[str, ...]:
+        """索引語の完全一致で引く（1文字の日本語のみ、その文字で始まるn-gramも対象にする）"""
+        min_size = min(self.sizes)
+        if len(token) >= min_size or _ASCII_TOKEN_RE.fullmatch(token):
+            return (token,) if term_index.contains(token) else ()
+        return tuple(
+            term for term in term_index.vocabulary
+            if term == token or (len(term) == min_size and term.startswith(token))
+        )
+
+
+class PolicyDocument:
+    """インデックス済みの規程1件"""
+    def __init__(self, ordinal: int, policy: Dict):
+        self.ordinal = ordinal
+        self.policy = policy
+        self.id = policy["id"]
+        body = policy.get("body", "")
+        # 小文字化済みテキスト（検索時に再計算しない）
+        self.lower_text: Dict[str, str] = {
+            "title": policy.get("title", "").lower(),
+            "body": body.lower(),
+        }
+        self.snippet = body[:120] + "..." if len(body) > 120 else body
+
+
+class TermIndex:
+    """1種類の解析器で構築したフィールド別の転置インデックス"""
+    def __init__(self, analyzer, documents: List[PolicyDocument]):
+        self.analyzer = analyzer
+        # field -> 索引語 -> {文書番号: 出現回数}
+        self.postings: Dict[str, Dict[str, Dict[int, int]]] = {field: {} for field in INDEX_FIELDS}
+        # field -> 文書ごとの索引語数
+        self.doc_lengths: Dict[str, List[int]] = {field: [] for field in INDEX_FIELDS}
+
+        for doc in documents:
+            for field in INDEX_FIELDS:
+                freqs = analyzer.index_terms(doc.lower_text[field])
+                field_postings = self.postings[field]
+                for term, tf in freqs.items():
+                    field_postings.setdefault(term, {})[doc.ordinal] = tf
+                self.doc_lengths[field].append(sum(freqs.values()))
+
+        self.vocabulary: Tuple[str, ...] = tuple(sorted(
+            set().union(*(self.postings[field] for field in INDEX_FIELDS))
+        ))
+        # クエリ語 -> 索引語の解決結果（クエリ語ごとにキャッシュ）
+        self.resolve = lru_cache(maxsize=4096)(self._resolve)
+
+    def contains(self, term: str) -> bool:
+        return any(term in self.postings[field] for field in INDEX_FIELDS)
+
+    def query_terms(self, query: str) -> List[str]:
+        """クエリをこのインデックスの解析器で分割"""
+        return self.analyzer.query_terms(query)
+
+    def _resolve(self, token: str) -> Tuple[str, ...]:
+        return self.analyzer.resolve(self, token)
+
+
+class PolicyIndex:
     """
-    規程データから関連条文を検索（上位top_k件）
+    規程データの転置インデックス
+    起動時に一度だけ構築し、検索ではクエリ語を含む文書のみを走査する
     """
-    policies = load_policies()
-    
-    # 各規程のスコアを計算
-    scored_policies = []
-    for policy in policies:
-        score = calculate_score(query, policy)
-        if score > 0:
-            scored_policies.append((score, policy))
-    
-    # スコアでソート（降順）
-    scored_policies.sort(key=lambda x: x[0], reverse=True)
-    
-    # 上位top_k件を返す
-    result = []
-    for score, policy in scored_policies[:top_k]:
-        result.append({
+    def __init__(self, policies: List[Dict], digest: str = "", version: int = 1):
+        # 元データの内容ハッシュ（コーパスの変更検知に使う）
+        self.digest = digest
+        # 再構築のたびに増える版番号と構築日時・所要時間
+        self.version = version
+        self.built_at = datetime.now()
+        self.build_seconds = 0.0
+        self.documents: List[PolicyDocument] = [
+            PolicyDocument(ordinal, policy) for ordinal, policy in enumerate(policies)
+        ]
+        self.by_id: Dict[str, PolicyDocument] = {doc.id: doc for doc in self.documents}
+        # 解析器ごとの転置インデックス（word: 従来のトークン、ngram: 日本語文字n-gram）
+        self.analyses: Dict[str, TermIndex] = {
+            analyzer.name: TermIndex(analyzer, self.documents)
+            for analyzer in (WordAnalyzer(), NgramAnalyzer())
+        }
+        self.words = self.analyses["word"]
+        # クエリ語 -> 出現回数の計算結果（クエリ語ごとにキャッシュ）
+        self.field_counts = lru_cache(maxsize=4096)(self._field_counts)
+        # このインデックス上に構築したランキングバックエンド
+        self.rankers = RankerRegistry(self)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _field_counts(self, token: str, field: str) -> Dict[int, int]:
+        """
+        tokenのフィールド内出現回数を文書ごとに返す（str.countと同じ非重複カウント）
+        クエリ語は英数字・日本語どちらか一方の連続なので、出現箇所は必ず1つの索引語に収まる
+        """
+        counts: Dict[int, int] = {}
+        field_postings = self.words.postings[field]
+        for term in self.words.resolve(token):
+            occurrences = term.count(token)
+            for ordinal, tf in field_postings.get(term, {}).items():
+                counts[ordinal] = counts.get(ordinal, 0) + tf * occurrences
+        return counts
+
+    def keyword_scores(self, query_tokens: List[str]) -> Dict[int, float]:
+        """
+        calculate_scoreと同じ式で、クエリ語を含む文書のみスコアを計算
+        戻り値: {文書番号: スコア}（スコア0の文書は含まない）
+        """
+        if not query_tokens:
+            return {}
+
+        token_counts = []
+        candidates = set()
+        for token in query_tokens:
+            token_lower = token.lower()
+            title_counts = self.field_counts(token_lower, "title")
+            body_counts = self.field_counts(token_lower, "body")
+            token_counts.append((title_counts, body_counts))
+            candidates.update(title_counts)
+            candidates.update(body_counts)
+
+        scores: Dict[int, float] = {}
+        for ordinal in candidates:
+            score = 0.0
+            matched_tokens = 0
+            for title_counts, body_counts in token_counts:
+                body_count = body_counts.get(ordinal, 0)
+                # calculate_scoreはtitle+bodyを連結してtitleマッチを数える
+                title_count = title_counts.get(ordinal, 0) + body_count
+                score += title_count * 2.0
+                score += body_count * 1.0
+                if title_count > 0 or body_count > 0:
+                    matched_tokens += 1
+            match_ratio = matched_tokens / len(query_tokens)
+            score *= (1.0 + match_ratio * 0.5)  # マッチ率ボーナス
+            scores[ordinal] = score
+        return scores
+
+    def to_result(self, ordinal: int, score: float) -> Dict:
+        """検索結果の1件分を組み立てる"""
+        doc = self.documents[ordinal]
+        policy = doc.policy
+        return {
             "id": policy["id"],
             "category": policy["category"],
             "title": policy["title"],
-            "snippet": policy["body"][:120] + "..." if len(policy["body"]) > 120 else policy["body"],
+            "snippet": doc.snippet,
             "url": policy["url"],
             "score": score
-        })
-    
-    return result
+        }
+
+
+_policy_index: Optional[PolicyIndex] = None
+_policy_index_lock = threading.Lock()
+# 再構築は同時に1つだけ実行する
+_reload_lock = threading.Lock()
+_last_reload_error: Optional[str] = None
+
+
+def build_policy_index(raw: Optional[bytes] = None, version: int = 1) -> PolicyIndex:
+    """policies.jsonからインデックスを構築"""
+    start = time.perf_counter()
+    if raw is None:
+        raw = POLICIES_PATH.read_bytes()
+    index = PolicyIndex(json.loads(raw), digest=hashlib.sha256(raw).hexdigest(), version=version)
+    # 既定のランキングバックエンドも構築しておく
+    index.rankers.get(DEFAULT_RANKER)
+    index.build_seconds = time.perf_counter() - start
+    return index
+
+
+def get_policy_index() -> PolicyIndex:
+    """構築済みのインデックスを取得（未構築なら構築する）"""
+    global _policy_index
+    index = _policy_index
+    if index is None:
+        with _policy_index_lock:
+            if _policy_index is None:
+                _policy_index = build_policy_index()
+            index = _policy_index
+    return index
+
+
+def reload_policy_index(force: bool = False) -> Dict:
+    """
+    policies.jsonを読み直してインデックスを再構築し、完成後に差し替える
+    構築中も検索は旧インデックスを参照し続け、差し替えは参照の代入1回で行う
+    内容が変わっていなければ（force指定時を除き）再構築しない
+    """
+    global _policy_index, _last_reload_error
+    with _reload_lock:
+        current = get_policy_index()
+        try:
+            raw = POLICIES_PATH.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            reloaded = force or digest != current.digest
+            if reloaded:
+                new_index = build_policy_index(raw, version=current.version + 1)
+        except (OSError, ValueError, KeyError) as e:
+            # 読み込み・構築に失敗した場合は旧インデックスのまま運用を続ける
+            _last_reload_error = f"{type(e).__name__}: {e}"
+            status = get_index_status()
+            status["reloaded"] = False
+            return status
+
+        _last_reload_error = None
+        if reloaded:
+            with _policy_index_lock:
+                _policy_index = new_index
+            if new_index.digest != current.digest:
+                answer_cache.clear()
+        status = get_index_status()
+        status["reloaded"] = reloaded
+        return status
+
+
+def get_index_status() -> Dict:
+    """管理者向けのインデックス情報"""
+    index = get_policy_index()
+    return {
+        "version": index.version,
+        "digest": index.digest,
+        "documents": len(index),
+        "built_at": index.built_at.isoformat(timespec="seconds"),
+        "build_ms": round(index.build_seconds * 1000, 2),
+        "watching": policy_watcher.running,
+        "last_error": _last_reload_error,
+    }
+
+
+def _stat_policies() -> Optional[Tuple[int, int]]:
+    """変更検知用に（更新時刻, サイズ）を取得"""
+    try:
+        st = POLICIES_PATH.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class PolicyWatcher:
+    """
+    policies.jsonの変更を更新時刻・サイズのポーリングで検知し、
+    バックグラウンドスレッドでインデックスを再構築する（内容ハッシュが同じなら何もしない）
+    """
+    def __init__(self, interval: float = POLICY_RELOAD_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_stat: Optional[Tuple[int, int]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.interval <= 0 or self.running:
+            return
+        self._stop.clear()
+        self._last_stat = _stat_policies()
+        self._thread = threading.Thread(target=self._run, name="policy-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            stat = _stat_policies()
+            if stat is not None and stat != self._last_stat:
+                self._last_stat = stat
+                reload_policy_index()
+
+
+policy_watcher = PolicyWatcher()
+
+
+def search_policies(query: str, top_k: int = 3, ranker: Optional[str] = None,
+                    index: Optional[PolicyIndex] = None) -> List[Dict]:
+    """
+    規程データから関連条文を検索（上位top_k件）
+    rankerでランキングバックエンドを指定（省略時はRAG_RANKER）
+    """
+    index = index or get_policy_index()
+    backend = index.rankers.get(ranker or DEFAULT_RANKER)
+    top = backend.top_k(query, top_k)
+    return [index.to_result(ordinal, score) for ordinal, score in top]
 
 
 def calculate_confidence(top_results: List[Dict]) -> str:
@@ -126,7 +472,7 @@ def calculate_confidence(top_results: List[Dict]) -> str:
         return "Low"
 
 
-def generate_summary(query: str, top_results: List[Dict]) -> str:
+def generate_summary(query: str, top_results: List[Dict], index: Optional[PolicyIndex] = None) -> str:
     """
     規程抜粋を根拠に要約回答を生成（200-350文字程度）
     """
@@ -168,10 +514,9 @@ def generate_summary(query: str, top_results: List[Dict]) -> str:
     
     # 主要な規程の要点を追加
     if len(top_results) > 0:
-        main_body = load_policies()
-        main_policy_full = next((p for p in main_body if p["id"] == main_policy["id"]), None)
-        if main_policy_full:
-            body = main_policy_full.get("body", "")
+        main_doc = (index or get_policy_index()).by_id.get(main_policy["id"])
+        if main_doc:
+            body = main_doc.policy.get("body", "")
             # 最初の2文程度を抽出
             sentences = re.split(r'[。！？]', body)
             if sentences:
@@ -189,3 +534,146 @@ def generate_summary(query: str, top_results: List[Dict]) -> str:
     
     return summary
 
+
+# ==================== 回答キャッシュ ====================
+
+def normalize_query(query: str) -> str:
+    """キャッシュキー用にクエリを正規化（NFKC・小文字化・空白の統一）"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """
+    QA回答（参照条文, 自信度, 要約）のLRU/TTLキャッシュ
+    エントリは構築元インデックスの内容ハッシュを持ち、コーパスが変わると自動的に無効になる
+    """
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, str, Tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple, digest: str) -> Optional[Tuple]:
+        """キャッシュを参照（期限切れ・コーパス変更済みのエントリは破棄してNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_digest, value = entry
+                if entry_digest == digest and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, digest: str, value: Tuple):
+        """キャッシュに登録（上限を超えたら最も古く使われたエントリから削除）"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, digest, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """管理者向けの統計情報"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
+
+
+def compute_answer(normalized: str, top_k: int, ranker: str,
+                   index: Optional[PolicyIndex] = None) -> Tuple[Tuple[Dict, ...], str, str]:
+    """正規化済みのクエリから（参照条文, 自信度, 要約）を計算（キャッシュを介さない）"""
+    index = index or get_policy_index()
+    top_results = search_policies(normalized, top_k=top_k, ranker=ranker, index=index)
+    confidence = calculate_confidence(top_results)
+    summary = generate_summary(normalized, top_results, index=index)
+    return tuple(top_results), confidence, summary
+
+
+def compute_answers(normalized_queries: List[str], top_k: int, ranker: str,
+                    index: Optional[PolicyIndex] = None) -> List[Tuple[Tuple[Dict, ...], str, str]]:
+    """複数クエリの回答をまとめて計算（スコアリングはランキングバックエンドで一括実行）"""
+    index = index or get_policy_index()
+    backend = index.rankers.get(ranker)
+    answers = []
+    for query, top in zip(normalized_queries, backend.top_k_batch(normalized_queries, top_k)):
+        top_results = [index.to_result(ordinal, score) for ordinal, score in top]
+        confidence = calculate_confidence(top_results)
+        summary = generate_summary(query, top_results, index=index)
+        answers.append((tuple(top_results), confidence, summary))
+    return answers
+
+
+def unpack_answer(answer: Tuple) -> Tuple[List[Dict], str, str]:
+    """キャッシュ上の回答を呼び出し側に渡す形にする"""
+    references, confidence, summary = answer
+    # 呼び出し側での変更がキャッシュに波及しないようコピーを返す
+    return [dict(ref) for ref in references], confidence, summary
+
+
+def answer_query(query: str, top_k: int = 3, ranker: Optional[str] = None) -> Tuple[List[Dict], str, str]:
+    """
+    質問に対する（参照条文, 自信度, 要約）を返す
+    正規化したクエリ単位でキャッシュし、同じ質問の再計算を省く
+    """
+    normalized = normalize_query(query)
+    ranker = ranker or DEFAULT_RANKER
+    # 処理中にインデックスが差し替わっても、1つの版だけを参照する
+    index = get_policy_index()
+    key = (normalized, top_k, ranker)
+
+    cached = answer_cache.get(key, index.digest)
+    if cached is None:
+        cached = compute_answer(normalized, top_k, ranker, index=index)
+        answer_cache.put(key, index.digest, cached)
+    return unpack_answer(cached)
+
+
+def answer_queries(queries: List[str], top_k: int = 3,
+                   ranker: Optional[str] = None) -> List[Tuple[List[Dict], str, str]]:
+    """
+    複数の質問に対する（参照条文, 自信度, 要約）を入力順に返す
+    キャッシュにない質問だけをまとめてスコアリングし、結果はキャッシュに登録する
+    """
+    ranker = ranker or DEFAULT_RANKER
+    index = get_policy_index()
+    normalized = [normalize_query(query) for query in queries]
+
+    answers: Dict[str, Tuple] = {}
+    missing: List[str] = []
+    for query in dict.fromkeys(normalized):
+        cached = answer_cache.get((query, top_k, ranker), index.digest)
+        if cached is None:
+            missing.append(query)
+        else:
+            answers[query] = cached
+
+    for query, answer in zip(missing, compute_answers(missing, top_k, ranker, index=index)):
+        answer_cache.put((query, top_k, ranker), index.digest, answer)
+        answers[query] = answer
+
+    return [unpack_answer(answers[query]) for query in normalized]
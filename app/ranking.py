@@ -0,0 +1,295 @@
+"""
+規程検索のランキングバックエンド
+PolicyIndexの上に載せ替え可能なスコアリング方式を定義する
+"""
+import heapq
+import math
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# BM25Fのフィールド重み（titleのマッチを重視）
+DEFAULT_FIELD_WEIGHTS: Dict[str, float] = {"title": 2.0, "body": 1.0}
+
+# 一括スコアリング時にまとめて確保するスコア行列の要素数の上限
+BATCH_SCORE_CELLS = 1 << 20
+
+
+class Ranker:
+    """ランキングバックエンドの基底クラス"""
+    name = ""
+
+    def __init__(self, index):
+        self.index = index
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """上位k件の（文書番号, スコア）をスコア降順で返す（スコア0の文書は含まない）"""
+        raise NotImplementedError
+
+    def top_k_batch(self, queries: List[str], k: int) -> List[List[Tuple[int, float]]]:
+        """複数クエリの上位k件をまとめて返す"""
+        return [self.top_k(query, k) for query in queries]
+
+
+class KeywordRanker(Ranker):
+    """
+    従来のキーワード出現回数ベースのスコア（calculate_scoreと同じ式）
+    一括スコアリングではクエリ語ごとの（文書番号, 2×title + 3×body の出現回数）をまとめ、
+    出現回数の合計とマッチしたクエリ語数をそれぞれ1回のbincountで求めてからマッチ率ボーナスを掛ける
+    （出現回数の合計は整数なので、keyword_scoresと同じスコアになる）
+    """
+    name = "keyword"
+
+    def __init__(self, index):
+        super().__init__(index)
+        self.n_docs = len(index)
+        self.token_postings = lru_cache(maxsize=4096)(self._token_postings)
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        scores = self.index.keyword_scores(self.index.words.query_terms(query))
+        # スコア降順（同点は規程データの並び順）
+        return heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def _token_postings(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        """クエリ語を含む文書の番号と、その文書での出現回数の重み付き和（keyword_scoresと同じ重み）"""
+        title_counts = self.index.field_counts(token, "title")
+        body_counts = self.index.field_counts(token, "body")
+        ordinals = sorted(set(title_counts) | set(body_counts))
+        # calculate_scoreはtitle+bodyを連結してtitleマッチを数えるため、bodyの出現は3倍になる
+        weights = [2.0 * title_counts.get(o, 0) + 3.0 * body_counts.get(o, 0) for o in ordinals]
+        return np.array(ordinals, dtype=np.int64), np.array(weights, dtype=np.float64)
+
+    def score_batch(self, queries: List[str]) -> np.ndarray:
+        """複数クエリのスコア行列（クエリ数×文書数）"""
+        cells = []
+        weights = []
+        n_tokens = np.zeros(len(queries), dtype=np.float64)
+        for row, query in enumerate(queries):
+            tokens = self.index.words.query_terms(query)
+            n_tokens[row] = len(tokens)
+            for token in tokens:
+                ordinals, token_weights = self.token_postings(token)
+                cells.append(row * self.n_docs + ordinals)
+                weights.append(token_weights)
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.empty(0, dtype=np.float64)
+        size = len(queries) * self.n_docs
+        totals = np.bincount(cells, weights=weights, minlength=size).reshape(len(queries), self.n_docs)
+        matched = np.bincount(cells, minlength=size).reshape(len(queries), self.n_docs)
+        match_ratio = matched / np.maximum(n_tokens, 1.0)[:, None]
+        return totals * (1.0 + match_ratio * 0.5)
+
+    def top_k_batch(self, queries: List[str], k: int) -> List[List[Tuple[int, float]]]:
+        return top_k_by_blocks(self.score_batch, self.n_docs, queries, k)
+
+
+class BM25Ranker(Ranker):
+    """
+    BM25 / BM25Fによるスコア
+    索引語×文書の疎行列（CSR形式）に、クエリに依存しない語の寄与を事前計算して保持し、
+    クエリ全体を1回のbincountで全文書に対してスコアリングする
+
+    field_weightsを省略するとtitle+bodyを1フィールドとして扱う通常のBM25になる
+    analysisで使用する転置インデックス（word / ngram）を選ぶ
+    """
+    name = "bm25"
+    analysis = "word"
+
+    def __init__(self, index, k1: float = 1.2, b: float = 0.75,
+                 field_weights: Optional[Dict[str, float]] = None):
+        super().__init__(index)
+        term_index = index.analyses[self.analysis]
+        self.term_index = term_index
+        self.k1 = k1
+        self.b = b
+        self.field_weights = dict(field_weights) if field_weights else None
+        if self.field_weights:
+            groups = [((field,), weight) for field, weight in self.field_weights.items()]
+        else:
+            groups = [(("title", "body"), 1.0)]
+
+        documents = index.documents
+        n_docs = len(documents)
+        self.n_docs = n_docs
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(term_index.vocabulary)}
+
+        # フィールドグループごとの正規化係数 (1 - b + b * len / avglen)
+        norms = []
+        for fields, weight in groups:
+            lengths = np.array(
+                [sum(term_index.doc_lengths[f][doc.ordinal] for f in fields) for doc in documents],
+                dtype=np.float64,
+            )
+            avg_length = lengths.mean() if n_docs and lengths.mean() > 0 else 1.0
+            norms.append((fields, weight, 1.0 - b + b * lengths / avg_length))
+
+        # 索引語ごとの重み付き正規化tf（BM25Fのtf~）を文書単位で集計
+        indptr = [0]
+        doc_ids: List[int] = []
+        weights: List[float] = []
+        for term in term_index.vocabulary:
+            pseudo_tf: Dict[int, float] = {}
+            for fields, weight, norm in norms:
+                for field in fields:
+                    for ordinal, tf in term_index.postings[field].get(term, {}).items():
+                        pseudo_tf[ordinal] = pseudo_tf.get(ordinal, 0.0) + weight * tf / norm[ordinal]
+            df = len(pseudo_tf)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            for ordinal in sorted(pseudo_tf):
+                tf_tilde = pseudo_tf[ordinal]
+                doc_ids.append(ordinal)
+                weights.append(idf * tf_tilde * (k1 + 1.0) / (tf_tilde + k1))
+            indptr.append(len(doc_ids))
+
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.doc_ids = np.array(doc_ids, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float64)
+        self.query_term_ids = lru_cache(maxsize=4096)(self._query_term_ids)
+
+    def _query_term_ids(self, token: str) -> Tuple[int, ...]:
+        """クエリ語を含む索引語のIDを返す"""
+        return tuple(self.term_ids[term] for term in self.term_index.resolve(token))
+
+    def _posting_positions(self, term_ids: np.ndarray) -> np.ndarray:
+        """索引語IDの配列から、CSR上のポスティング位置をまとめて求める"""
+        starts = self.indptr[term_ids]
+        lengths = self.indptr[term_ids + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # 各索引語の区間 [start, start + length) を連結した位置配列
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total, dtype=np.int64)
+
+    def term_ids_for(self, query: str) -> np.ndarray:
+        """クエリを索引語IDの配列（重複なし）に変換"""
+        ids = set()
+        for token in self.term_index.query_terms(query):
+            ids.update(self.query_term_ids(token))
+        return np.fromiter(sorted(ids), dtype=np.int64, count=len(ids))
+
+    def score(self, query: str) -> np.ndarray:
+        """全文書のスコアを1回のベクトル演算で計算"""
+        positions = self._posting_positions(self.term_ids_for(query))
+        return np.bincount(self.doc_ids[positions], weights=self.weights[positions],
+                           minlength=self.n_docs)
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        return select_top_k(self.score(query), k)
+
+    def score_batch(self, queries: List[str]) -> np.ndarray:
+        """
+        複数クエリのスコア行列（クエリ数×文書数）を1回のbincountで計算
+        各クエリのポスティングに行番号×文書数のオフセットを足して1本の配列にまとめる
+        """
+        positions = []
+        rows = []
+        for row, query in enumerate(queries):
+            query_positions = self._posting_positions(self.term_ids_for(query))
+            positions.append(query_positions)
+            rows.append(np.full(query_positions.size, row, dtype=np.int64))
+        positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cells = rows * self.n_docs + self.doc_ids[positions]
+        scores = np.bincount(cells, weights=self.weights[positions],
+                             minlength=len(queries) * self.n_docs)
+        return scores.reshape(len(queries), self.n_docs)
+
+    def top_k_batch(self, queries: List[str], k: int) -> List[List[Tuple[int, float]]]:
+        return top_k_by_blocks(self.score_batch, self.n_docs, queries, k)
+
+
+class BM25FRanker(BM25Ranker):
+    """フィールド別の重みと正規化を持つBM25F"""
+    name = "bm25f"
+
+    def __init__(self, index, k1: float = 1.2, b: float = 0.75,
+                 field_weights: Optional[Dict[str, float]] = None):
+        super().__init__(index, k1=k1, b=b, field_weights=field_weights or DEFAULT_FIELD_WEIGHTS)
+
+
+class NgramRanker(BM25FRanker):
+    """日本語の文字n-gramインデックスに対するBM25F（クエリ語は索引の完全一致で引く）"""
+    name = "ngram"
+    analysis = "ngram"
+
+
+def select_top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """
+    スコア配列から上位k件を取り出す
+    全件ソートはせず、argpartitionで候補を絞ってからk件だけを並べる
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if k <= 0 or candidates.size == 0:
+        return []
+    if candidates.size > k:
+        # k件目のスコアを求め、それと同点の文書もすべて候補に残す
+        # （argpartitionは境界の同点からどれを選ぶか決まっていないため、並べてからk件に切る）
+        candidate_scores = scores[candidates]
+        kth = np.partition(candidate_scores, candidates.size - k)[candidates.size - k]
+        candidates = candidates[candidate_scores >= kth]
+    # スコア降順、同点は文書番号順
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return [(int(candidates[i]), float(scores[candidates[i]])) for i in order]
+
+
+def select_top_k_rows(scores: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+    """スコア行列の各行から上位k件を取り出す（行方向のpartitionで各行のk件目のスコアを一括して求める）"""
+    n_rows, n_docs = scores.shape
+    if k <= 0 or n_docs == 0:
+        return [[] for _ in range(n_rows)]
+    # 各行のk件目のスコア（それと同点の文書もすべて候補に残し、並べてからk件に切る）
+    if n_docs > k:
+        kth = np.partition(scores, n_docs - k, axis=1)[:, n_docs - k]
+    else:
+        kth = np.zeros(n_rows)
+    results = []
+    for row in range(n_rows):
+        row_all = scores[row]
+        # スコア0の文書は除く
+        row_candidates = np.flatnonzero((row_all >= kth[row]) & (row_all > 0))
+        row_scores = row_all[row_candidates]
+        # スコア降順、同点は文書番号順
+        order = np.lexsort((row_candidates, -row_scores))[:k]
+        results.append([(int(row_candidates[i]), float(row_scores[i])) for i in order])
+    return results
+
+
+def top_k_by_blocks(score_batch, n_docs: int, queries: List[str], k: int) -> List[List[Tuple[int, float]]]:
+    """スコア行列が大きくなりすぎないよう、クエリをブロックに分けてスコアリングし、各行の上位k件を返す"""
+    block = max(1, BATCH_SCORE_CELLS // max(n_docs, 1))
+    results: List[List[Tuple[int, float]]] = []
+    for start in range(0, len(queries), block):
+        results.extend(select_top_k_rows(score_batch(queries[start:start + block]), k))
+    return results
+
+
+RANKERS = {
+    KeywordRanker.name: KeywordRanker,
+    BM25Ranker.name: BM25Ranker,
+    BM25FRanker.name: BM25FRanker,
+    NgramRanker.name: NgramRanker,
+}
+
+
+class RankerRegistry:
+    """インデックスごとに構築済みのランキングバックエンドを保持する"""
+    def __init__(self, index):
+        self.index = index
+        self._rankers: Dict[str, Ranker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Ranker:
+        ranker = self._rankers.get(name)
+        if ranker is None:
+            if name not in RANKERS:
+                raise ValueError(f"Unknown ranker: {name}")
+            with self._lock:
+                ranker = self._rankers.get(name)
+                if ranker is None:
+                    ranker = RANKERS[name](self.index)
+                    self._rankers[name] = ranker
+        return ranker
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
 
@@ -18,6 +18,10 @@ class AnswerRequest(BaseModel):
     selected_index: int
 
 
+class QuestionAnswerRequest(BaseModel):
+    selected_index: int
+
+
 class RemindRequest(BaseModel):
     selected_names: List[str]
     message: Optional[str] = None
@@ -34,3 +38,33 @@ class EscalationRequest(BaseModel):
     retrieved_articles: List[dict]
     confidence: str
 
+
+class QABatchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 3
+    ranker: Optional[str] = None
+    name: Optional[str] = None
+    record_history: bool = False
+    stream: bool = False
+
+
+class BankQuestion(BaseModel):
+    """questions.json（設問バンク）の1問"""
+    id: str
+    year: str
+    category: str
+    theme: str
+    difficulty: Literal["easy", "medium", "hard"]
+    learning_goal_ja: str = ""
+    learning_goal_en: str = ""
+    common_misconception_ja: str = ""
+    common_misconception_en: str = ""
+    question_ja: str
+    question_en: str = ""
+    choices_ja: List[str]
+    choices_en: List[str] = []
+    correct_choice_index: int
+    explanation_ja: str = ""
+    explanation_en: str = ""
+    source_url: str = ""
+    tags: List[str] = []
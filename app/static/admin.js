@@ -1,50 +1,55 @@
 // 管理者画面のロジック
 
-let allQuestions = [];
 let filteredQuestions = [];
+// 設問APIの1ページあたりの取得件数
+const QUESTIONS_PAGE_SIZE = 100;
+// 古い検索条件の応答で表示を上書きしないための番号
+let tableRequestId = 0;
+let searchTimer = null;
 
 // 初期化
 document.addEventListener('DOMContentLoaded', async () => {
-    await loadQuestions();
     setupEventListeners();
-    updateStats();
-    updateTable();
+    await updateStats();
+    await updateTable();
 });
 
-// questions.jsonを読み込む
-async function loadQuestions() {
-    try {
-        const response = await fetch('/static/questions.json');
+// 読み込み失敗を表示
+function showLoadError(error) {
+    console.error('Error loading questions:', error);
+    const loadingMsg = document.getElementById('loadingMessage');
+    if (loadingMsg) {
+        loadingMsg.textContent = `問題の読み込みに失敗しました: ${error.message}`;
+        loadingMsg.style.color = '#e01e5a';
+        loadingMsg.classList.remove('hidden');
+    }
+}
+
+// 設問APIから条件に合う問題をすべて取得（一覧表示に必要な項目のみ）
+async function fetchQuestions(filters) {
+    const items = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ ...filters, view: 'summary', limit: QUESTIONS_PAGE_SIZE });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/questions?${params}`);
         if (!response.ok) {
             throw new Error(`Failed to load questions: ${response.status} ${response.statusText}`);
         }
-        allQuestions = await response.json();
-        filteredQuestions = [...allQuestions];
-        
-        // 読み込み成功をログ出力と表示
-        console.log(`Loaded ${allQuestions.length} questions`);
-        const loadingMsg = document.getElementById('loadingMessage');
-        const loadCountMsg = document.getElementById('loadCountMessage');
-        if (loadingMsg) {
-            loadingMsg.classList.add('hidden');
-        }
-        if (loadCountMsg) {
-            loadCountMsg.textContent = `✓ ${allQuestions.length}問を読み込みました`;
-            loadCountMsg.style.display = 'block';
-        }
-    } catch (error) {
-        console.error('Error loading questions:', error);
-        const loadingMsg = document.getElementById('loadingMessage');
-        if (loadingMsg) {
-            loadingMsg.textContent = `問題の読み込みに失敗しました: ${error.message}`;
-            loadingMsg.style.color = '#e01e5a';
-        }
-    }
+        const page = await response.json();
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return items;
 }
 
 // イベントリスナー設定
 function setupEventListeners() {
-    document.getElementById('searchInput').addEventListener('input', updateTable);
+    // 検索は入力が落ち着いてからサーバーに問い合わせる
+    document.getElementById('searchInput').addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(updateTable, 250);
+    });
     document.getElementById('adminYearFilter').addEventListener('change', updateTable);
     document.getElementById('adminCategoryFilter').addEventListener('change', updateTable);
     document.getElementById('adminDifficultyFilter').addEventListener('change', updateTable);
@@ -54,17 +59,32 @@ function setupEventListeners() {
     });
 }
 
-// 統計を更新
-function updateStats() {
+// 統計を更新（集計はサーバー側で行う）
+async function updateStats() {
+    let facets;
+    try {
+        const response = await fetch('/api/questions/facets');
+        if (!response.ok) {
+            throw new Error(`Failed to load stats: ${response.status} ${response.statusText}`);
+        }
+        facets = await response.json();
+    } catch (error) {
+        showLoadError(error);
+        return;
+    }
+
+    // 読み込み件数を表示
+    console.log(`Loaded ${facets.total} questions`);
+    const loadCountMsg = document.getElementById('loadCountMessage');
+    if (loadCountMsg) {
+        loadCountMsg.textContent = `✓ ${facets.total}問を読み込みました`;
+        loadCountMsg.style.display = 'block';
+    }
+
     // Year別集計
-    const yearStats = {};
-    allQuestions.forEach(q => {
-        yearStats[q.year] = (yearStats[q.year] || 0) + 1;
-    });
-    
     const yearStatsContainer = document.getElementById('yearStats');
     yearStatsContainer.innerHTML = '';
-    Object.entries(yearStats).forEach(([year, count]) => {
+    Object.entries(facets.years).forEach(([year, count]) => {
         const statItem = document.createElement('div');
         statItem.className = 'stat-item';
         statItem.innerHTML = `
@@ -75,14 +95,9 @@ function updateStats() {
     });
 
     // Category別集計
-    const categoryStats = {};
-    allQuestions.forEach(q => {
-        categoryStats[q.category] = (categoryStats[q.category] || 0) + 1;
-    });
-    
     const categoryStatsContainer = document.getElementById('categoryStats');
     categoryStatsContainer.innerHTML = '';
-    Object.entries(categoryStats).forEach(([category, count]) => {
+    Object.entries(facets.categories).forEach(([category, count]) => {
         const statItem = document.createElement('div');
         statItem.className = 'stat-item';
         statItem.innerHTML = `
@@ -93,34 +108,26 @@ function updateStats() {
     });
 }
 
-// テーブルを更新
-function updateTable() {
-    const searchTerm = document.getElementById('searchInput').value.toLowerCase();
+// テーブルを更新（絞り込み・検索はサーバー側で行う）
+async function updateTable() {
+    const q = document.getElementById('searchInput').value.trim();
     const year = document.getElementById('adminYearFilter').value;
     const category = document.getElementById('adminCategoryFilter').value;
     const difficulty = document.getElementById('adminDifficultyFilter').value;
+    const requestId = ++tableRequestId;
 
-    // フィルタリング
-    filteredQuestions = allQuestions.filter(q => {
-        if (year !== 'all' && q.year !== year) return false;
-        if (category !== 'all' && q.category !== category) return false;
-        if (difficulty !== 'all' && q.difficulty !== difficulty) return false;
-        
-        if (searchTerm) {
-            const searchableText = [
-                q.id,
-                q.theme,
-                q.learning_goal_ja,
-                q.learning_goal_en,
-                ...q.tags
-            ].join(' ').toLowerCase();
-            if (!searchableText.includes(searchTerm)) return false;
-        }
-        
-        return true;
-    });
+    let questions;
+    try {
+        questions = await fetchQuestions({ year, category, difficulty, q });
+    } catch (error) {
+        if (requestId === tableRequestId) showLoadError(error);
+        return;
+    }
+    // より新しい検索条件の取得が始まっていれば、この結果は使わない
+    if (requestId !== tableRequestId) return;
+    filteredQuestions = questions;
 
-    // テーブルを描画
+// テーブルを描画
     const tbody = document.getElementById('questionsTableBody');
     tbody.innerHTML = '';
 
@@ -148,10 +155,17 @@ function updateTable() {
     document.getElementById('questionsTable').classList.remove('hidden');
 }
 
-// 問題詳細を表示
-function showQuestionDetail(questionId) {
-    const question = allQuestions.find(q => q.id === questionId);
-    if (!question) return;
+// 問題詳細を表示（解答・解説を含む全項目を取得）
+async function showQuestionDetail(questionId) {
+    let question;
+    try {
+        const response = await fetch(`/api/questions/${encodeURIComponent(questionId)}?view=full`);
+        if (!response.ok) return;
+        question = await response.json();
+    } catch (error) {
+        console.error('Error loading question:', error);
+        return;
+    }
 
     const modalContent = document.getElementById('modalContent');
     modalContent.innerHTML = `
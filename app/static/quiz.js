@@ -1,6 +1,5 @@
 // クイズアプリのメインロジック
 
-let allQuestions = [];
 let filteredQuestions = [];
 let currentQuestionIndex = 0;
 let currentLanguage = 'ja';
@@ -9,10 +8,16 @@ let progress = {
     correct: 0,
     total: 0
 };
+// 設問APIの1ページあたりの取得件数
+const QUESTIONS_PAGE_SIZE = 100;
+// 正誤判定の結果（正解・解説）を設問IDごとに保持
+const answerResults = new Map();
+// 古いフィルタ条件の応答で表示を上書きしないための番号
+let filterRequestId = 0;
+let loadCountShown = false;
 
 // 初期化
 document.addEventListener('DOMContentLoaded', async () => {
-    await loadQuestions();
     loadProgress();
     setupEventListeners();
     
@@ -24,21 +29,17 @@ document.addEventListener('DOMContentLoaded', async () => {
     
     if (year && track && theme) {
         // URLパラメータがある場合は自動フィルタリング
-        applyUrlFilters(year, track, theme);
+        await applyUrlFilters(year, track, theme);
     } else {
-        // パラメータがない場合は全問題を表示（フィルタ更新）
-        updateFilters();
-        // フィルタ更新後に問題を表示
-        if (filteredQuestions.length > 0) {
-            showQuestion();
-        }
+        // パラメータがない場合は全問題を表示
+        await updateFilters();
     }
     
     updateProgress();
 });
 
 // URLパラメータに基づいてフィルタを適用
-function applyUrlFilters(year, track, theme) {
+async function applyUrlFilters(year, track, theme) {
     // パラメータの検証
     const validYears = ['Year1', 'Year2'];
     const validTracks = ['governance', 'business', 'management'];
@@ -52,15 +53,6 @@ function applyUrlFilters(year, track, theme) {
         return;
     }
     
-    // allQuestionsが読み込まれるまで待つ
-    if (allQuestions.length === 0) {
-        console.log('Waiting for questions to load...');
-        setTimeout(() => {
-            applyUrlFilters(year, track, theme);
-        }, 200);
-        return;
-    }
-    
     // フィルタ選択を設定
     const yearFilter = document.getElementById('yearFilter');
     const categoryFilter = document.getElementById('categoryFilter');
@@ -70,58 +62,38 @@ function applyUrlFilters(year, track, theme) {
     if (categoryFilter) categoryFilter.value = track;
     
     // Themeフィルタの候補を更新
-    updateThemeFilter(year, track);
+    try {
+        await updateThemeFilter(year, track);
+    } catch (error) {
+        showLoadError(error);
+        return;
+    }
     
-    // Themeを設定（updateThemeFilter完了後に確実に設定）
-    const setThemeFilter = () => {
-        if (!themeFilter) return;
-        
-        // themeは日本語文字列なので、完全一致で検索
-        const options = Array.from(themeFilter.options);
-        const matchingOption = options.find(opt => opt.value === theme || opt.textContent === theme);
-        
-        if (matchingOption) {
-            themeFilter.value = matchingOption.value;
-            // フィルタを適用
-            updateFilters();
-            
-            // フィルタ適用後に問題が0件の場合
-            setTimeout(() => {
-                if (filteredQuestions.length === 0) {
-                    showErrorMessage('該当する問題が見つかりませんでした。トップページに戻ります。');
-                    setTimeout(() => {
-                        window.location.href = '/';
-                    }, 2000);
-                }
-            }, 100);
-        } else {
-            // 完全一致しない場合は、部分一致で検索
-            const partialMatch = options.find(opt => 
-                opt.textContent.includes(theme) || theme.includes(opt.textContent)
-            );
-            
-            if (partialMatch) {
-                themeFilter.value = partialMatch.value;
-                updateFilters();
-            } else {
-                // テーマが見つからない場合（optionsがまだ生成されていない可能性がある）
-                if (options.length <= 1) {
-                    // optionsがまだ生成されていない場合は再試行
-                    setTimeout(setThemeFilter, 100);
-                } else {
-                    // optionsは生成されているが一致しない場合はエラー
-                    console.warn(`Theme not found: ${theme}`, 'Available themes:', Array.from(options).map(o => o.value));
-                    showErrorMessage(`テーマ「${theme}」が見つかりません。トップページに戻ります。`);
-                    setTimeout(() => {
-                        window.location.href = '/';
-                    }, 2000);
-                }
-            }
-        }
-    };
+    // themeは日本語文字列なので、完全一致で検索し、なければ部分一致
+    const options = Array.from(themeFilter.options);
+    const matchingOption = options.find(opt => opt.value === theme || opt.textContent === theme)
+        || options.find(opt => opt.value !== 'all' &&
+            (opt.textContent.includes(theme) || theme.includes(opt.textContent)));
+    
+    if (!matchingOption) {
+        console.warn(`Theme not found: ${theme}`, 'Available themes:', options.map(o => o.value));
+        showErrorMessage(`テーマ「${theme}」が見つかりません。トップページに戻ります。`);
+        setTimeout(() => {
+            window.location.href = '/';
+        }, 2000);
+        return;
+    }
+    
+    themeFilter.value = matchingOption.value;
+    await updateFilters();
     
-    // updateThemeFilter完了後に実行（少し遅延）
-    setTimeout(setThemeFilter, 150);
+    // フィルタ適用後に問題が0件の場合
+    if (filteredQuestions.length === 0) {
+        showErrorMessage('該当する問題が見つかりませんでした。トップページに戻ります。');
+        setTimeout(() => {
+            window.location.href = '/';
+        }, 2000);
+    }
 }
 
 // エラーメッセージを表示
@@ -135,68 +107,61 @@ function showErrorMessage(message) {
     }
 }
 
-// questions.jsonを読み込む
-async function loadQuestions() {
-    try {
-        const response = await fetch('/static/questions.json');
+// 読み込み失敗を表示
+function showLoadError(error) {
+    console.error('Error loading questions:', error);
+    const loadingMsg = document.getElementById('loadingMessage');
+    if (loadingMsg) {
+        loadingMsg.innerHTML = `
+            <div style="padding: 20px; text-align: center;">
+                <p style="color: #e01e5a; font-weight: 600; margin-bottom: 12px;">問題の読み込みに失敗しました</p>
+                <p style="color: #616061; font-size: 14px; margin-bottom: 16px;"></p>
+                <button onclick="location.reload()" class="btn-primary" style="margin-right: 8px;">再読み込み</button>
+                <a href="/" class="btn-secondary" style="display: inline-block; padding: 8px 16px; text-decoration: none;">トップページへ</a>
+            </div>
+        `;
+        loadingMsg.querySelector('p + p').textContent = error.message;
+        loadingMsg.style.color = '#e01e5a';
+        loadingMsg.style.backgroundColor = '#fee';
+        loadingMsg.classList.remove('hidden');
+    }
+}
+
+// 設問APIから条件に合う問題をすべて取得（解答・解説は含まない）
+async function fetchQuestions(filters) {
+    const items = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ ...filters, view: 'quiz', limit: QUESTIONS_PAGE_SIZE });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/questions?${params}`);
         if (!response.ok) {
             throw new Error(`Failed to load questions: ${response.status} ${response.statusText}`);
         }
-        
-        // テキストとして先に読み込んで、JSONとしてパース
-        const text = await response.text();
-        try {
-            allQuestions = JSON.parse(text);
-        } catch (parseError) {
-            // JSONパースエラーの詳細をログに出力（開発者向け）
-            console.error('JSON Parse Error:', parseError);
-            console.error('Error position:', parseError.message);
-            
-            // エラー位置付近のテキストを抽出（デバッグ用）
-            const match = parseError.message.match(/position (\d+)/);
-            if (match) {
-                const pos = parseInt(match[1]);
-                const start = Math.max(0, pos - 50);
-                const end = Math.min(text.length, pos + 50);
-                console.error('Context around error:', text.substring(start, end));
-            }
-            
-            throw new Error(`JSON形式エラー: ${parseError.message}。データファイルを確認してください。`);
-        }
-        
-        filteredQuestions = [...allQuestions];
-        
-        // 読み込み成功を表示（デバッグ用）
-        console.log(`Loaded ${allQuestions.length} questions`);
-        const loadingMsg = document.getElementById('loadingMessage');
-        const loadCountMsg = document.getElementById('loadCountMessage');
-        if (loadingMsg) {
-            loadingMsg.classList.add('hidden');
-        }
-        if (loadCountMsg) {
-            loadCountMsg.textContent = `✓ ${allQuestions.length}問を読み込みました`;
-            loadCountMsg.style.display = 'block';
-            setTimeout(() => {
-                if (loadCountMsg) loadCountMsg.style.display = 'none';
-            }, 3000);
-        }
-    } catch (error) {
-        console.error('Error loading questions:', error);
-        const loadingMsg = document.getElementById('loadingMessage');
-        if (loadingMsg) {
-            loadingMsg.innerHTML = `
-                <div style="padding: 20px; text-align: center;">
-                    <p style="color: #e01e5a; font-weight: 600; margin-bottom: 12px;">問題の読み込みに失敗しました</p>
-                    <p style="color: #616061; font-size: 14px; margin-bottom: 16px;">${error.message}</p>
-                    <button onclick="location.reload()" class="btn-primary" style="margin-right: 8px;">再読み込み</button>
-                    <a href="/" class="btn-secondary" style="display: inline-block; padding: 8px 16px; text-decoration: none;">トップページへ</a>
-                </div>
-            `;
-            loadingMsg.style.color = '#e01e5a';
-            loadingMsg.style.backgroundColor = '#fee';
-            loadingMsg.classList.remove('hidden');
-        }
+        const page = await response.json();
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+}
+
+// 回答の正誤判定（正解・解説はサーバーから回答後に取得）
+async function checkAnswer(questionId, selectedIndex) {
+    const cached = answerResults.get(questionId);
+    if (cached && cached.selected_index === selectedIndex) {
+        return cached;
     }
+    const response = await fetch(`/api/questions/${encodeURIComponent(questionId)}/answer`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ selected_index: selectedIndex })
+    });
+    if (!response.ok) {
+        throw new Error(`Failed to check answer: ${response.status} ${response.statusText}`);
+    }
+    const result = await response.json();
+    answerResults.set(questionId, result);
+    return result;
 }
 
 // 現在のユーザー名を取得
@@ -299,23 +264,27 @@ function toggleLanguage() {
     showQuestion();
 }
 
-// フィルタ更新
-function updateFilters() {
+// フィルタ更新（絞り込みはサーバー側で行う）
+async function updateFilters() {
     const year = document.getElementById('yearFilter').value;
     const category = document.getElementById('categoryFilter').value;
     const theme = document.getElementById('themeFilter').value;
     const mode = document.getElementById('modeSelect').value;
+    const requestId = ++filterRequestId;
 
-    // Themeフィルタの候補を更新
-    updateThemeFilter(year, category);
-
-    // フィルタリング
-    filteredQuestions = allQuestions.filter(q => {
-        if (year !== 'all' && q.year !== year) return false;
-        if (category !== 'all' && q.category !== category) return false;
-        if (theme !== 'all' && q.theme !== theme) return false;
-        return true;
-    });
+    let questions;
+    try {
+        // Themeフィルタの候補を更新
+        await updateThemeFilter(year, category);
+        const selectedTheme = document.getElementById('themeFilter').value;
+        questions = await fetchQuestions({ year, category, theme: selectedTheme });
+    } catch (error) {
+        if (requestId === filterRequestId) showLoadError(error);
+        return;
+    }
+    // より新しいフィルタ条件の取得が始まっていれば、この結果は使わない
+    if (requestId !== filterRequestId) return;
+    filteredQuestions = questions;
 
     // モードに応じて並び替え
     if (mode === 'random') {
@@ -326,6 +295,21 @@ function updateFilters() {
     const filterKey = `${year}_${category}_${theme}_${mode}`;
     const savedIndex = localStorage.getItem(`quizIndex_${filterKey}`);
     currentQuestionIndex = savedIndex ? parseInt(savedIndex) : 0;
+    if (currentQuestionIndex >= filteredQuestions.length) {
+        currentQuestionIndex = 0;
+    }
+
+    if (!loadCountShown) {
+        loadCountShown = true;
+        const loadCountMsg = document.getElementById('loadCountMessage');
+        if (loadCountMsg) {
+            loadCountMsg.textContent = `✓ ${filteredQuestions.length}問を読み込みました`;
+            loadCountMsg.style.display = 'block';
+            setTimeout(() => {
+                if (loadCountMsg) loadCountMsg.style.display = 'none';
+            }, 3000);
+        }
+    }
 
     if (filteredQuestions.length === 0) {
         document.getElementById('loadingMessage').classList.add('hidden');
@@ -337,26 +321,24 @@ function updateFilters() {
         document.getElementById('questionCard').classList.remove('hidden');
         showQuestion();
     }
+    updateProgress();
 }
 
-// Themeフィルタの候補を更新
-function updateThemeFilter(year, category) {
+// Themeフィルタの候補を更新（Year・Categoryで絞り込んだテーマ一覧をサーバーから取得）
+async function updateThemeFilter(year, category) {
     const themeFilter = document.getElementById('themeFilter');
     const currentTheme = themeFilter.value;
 
-    // フィルタ条件に合う問題からThemeを抽出
-    const themes = new Set();
-    allQuestions.forEach(q => {
-        if (year === 'all' || q.year === year) {
-            if (category === 'all' || q.category === category) {
-                themes.add(q.theme);
-            }
-        }
-    });
+    const params = new URLSearchParams({ year, category });
+    const response = await fetch(`/api/questions/facets?${params}`);
+    if (!response.ok) {
+        throw new Error(`Failed to load themes: ${response.status} ${response.statusText}`);
+    }
+    const facets = await response.json();
 
-    // Theme選択肢を更新
+    // Theme選択肢を更新（現在のテーマが候補にない場合はAllに戻す）
     themeFilter.innerHTML = '<option value="all">All</option>';
-    themes.forEach(theme => {
+    Object.keys(facets.themes).forEach(theme => {
         const option = document.createElement('option');
         option.value = theme;
         option.textContent = theme;
@@ -376,7 +358,7 @@ function shuffleArray(array) {
 }
 
 // 問題を表示
-function showQuestion() {
+async function showQuestion() {
     if (filteredQuestions.length === 0) return;
 
     const question = filteredQuestions[currentQuestionIndex];
@@ -418,42 +400,60 @@ function showQuestion() {
     if (answered) {
         // 既に回答済みの場合は選択肢を無効化し、結果を表示
         document.getElementById('choicesContainer').style.pointerEvents = 'none';
+        let result;
+        try {
+            result = await checkAnswer(questionId, answered.selectedIndex);
+        } catch (error) {
+            console.error('Error checking answer:', error);
+            return;
+        }
+        // 判定を待つ間に別の問題に移っていれば表示しない
+        if (filteredQuestions[currentQuestionIndex] !== question) return;
         const buttons = document.querySelectorAll('.choice-button');
         buttons.forEach((btn, index) => {
             if (index === answered.selectedIndex) {
                 btn.classList.add('selected');
                 btn.classList.add(answered.correct ? 'correct' : 'incorrect');
-            } else if (index === question.correct_choice_index) {
+            } else if (index === result.correct_choice_index) {
                 btn.classList.add('correct');
             }
         });
-        showResult(answered.selectedIndex, question, true);
+        showResult(answered.selectedIndex, result, true);
     }
 }
 
 // 選択肢を選択
-function selectChoice(selectedIndex, question) {
+async function selectChoice(selectedIndex, question) {
     // 選択肢を無効化
     document.getElementById('choicesContainer').style.pointerEvents = 'none';
+
+    let result;
+    try {
+        result = await checkAnswer(question.id, selectedIndex);
+    } catch (error) {
+        console.error('Error checking answer:', error);
+        document.getElementById('choicesContainer').style.pointerEvents = 'auto';
+        return;
+    }
     
     // 選択されたボタンをハイライト
     const buttons = document.querySelectorAll('.choice-button');
     buttons.forEach((btn, index) => {
         btn.classList.add('selected');
         if (index === selectedIndex) {
-            btn.classList.add(selectedIndex === question.correct_choice_index ? 'correct' : 'incorrect');
-        } else if (index === question.correct_choice_index) {
+            btn.classList.add(result.correct ? 'correct' : 'incorrect');
+        } else if (index === result.correct_choice_index) {
             btn.classList.add('correct');
         }
     });
 
     // 結果を表示
-    showResult(selectedIndex, question, false);
+    showResult(selectedIndex, result, false);
 
     // 進捗を更新
     const questionId = question.id;
     const existingAnswer = progress.answered.findIndex(a => a.id === questionId);
-    const isCorrect = selectedIndex === question.correct_choice_index;
+    const isCorrect = result.correct;
 
     if (existingAnswer >= 0) {
         // 既存の回答を更新
@@ -475,10 +475,10 @@ function selectChoice(selectedIndex, question) {
     updateProgress();
 }
 
-// 結果を表示
-function showResult(selectedIndex, question, isReplay) {
+// 結果を表示（resultは正誤判定APIの応答）
+function showResult(selectedIndex, result, isReplay) {
     const lang = currentLanguage;
-    const isCorrect = selectedIndex === question.correct_choice_index;
+    const isCorrect = result.correct;
     
     const resultContainer = document.getElementById('resultContainer');
     const resultMessage = document.getElementById('resultMessage');
@@ -490,10 +490,10 @@ function showResult(selectedIndex, question, isReplay) {
         : (lang === 'ja' ? '✗ 不正解' : '✗ Incorrect');
     resultMessage.className = `result-message ${isCorrect ? 'correct' : 'incorrect'}`;
 
-    explanationText.textContent = question[`explanation_${lang}`];
+    explanationText.textContent = result[`explanation_${lang}`];
     
-    if (question.source_url) {
-        sourceLink.href = question.source_url;
+    if (result.source_url) {
+        sourceLink.href = result.source_url;
         sourceLink.textContent = lang === 'ja' ? '根拠リンク →' : 'Source Link →';
         sourceLink.classList.remove('hidden');
     } else {
@@ -4,6 +4,9 @@ let learningTopics = {};
 let selectedYear = null;
 let selectedCategory = null;
 let selectedTheme = null;
+// 学習テーママスタのURL（テンプレートでハッシュ付きのURLを指定）
+const LEARNING_TOPICS_URL = (document.currentScript && document.currentScript.dataset.topicsUrl)
+    || '/static/learningTopics.json';
 
 // 初期化
 document.addEventListener('DOMContentLoaded', async () => {
@@ -51,7 +54,7 @@ function setupUserNameInput() {
 // 学習テーママスタを読み込む
 async function loadLearningTopics() {
     try {
-        const response = await fetch('/static/learningTopics.json');
+        const response = await fetch(LEARNING_TOPICS_URL);
         if (!response.ok) throw new Error('Failed to load learning topics');
         learningTopics = await response.json();
     } catch (error) {
@@ -0,0 +1,931 @@
+"""
+ストアの永続化バックエンド
+storeの更新は1件ずつの記録（dict）として append し、起動時に load で読み戻して再適用する
+- memory: 永続化しない（既定）
+- sqlite: SQLite（WALモード）
+- journal: 追記専用のNDJSONジャーナルと定期的なスナップショット
+- shared: 複数のワーカープロセスで共有するSQLiteの記録表（各プロセスが他プロセスの記録を取り込む）
+
+記録の種類（type）:
+- user: ユーザー作成（name, at）
+- answer: 回答（name, question_id, selected_index, at）
+- notification: 通知ログ（to_name, topic, message, at）
+- chat: チャットメッセージ（name, message, is_user, answer, references, confidence, at）
+- escalation: エスカレーション登録（id, name, message, retrieved_articles, confidence, at）
+- escalation_status: エスカレーションのステータス更新（id, status, at）
+- batch: 一括取り込み（key, fingerprint〈内容のハッシュ〉, records〈user / answer の記録の列〉, result, at）
+- import_key: 適用済みの一括取り込みの冪等キー（key, result）。スナップショット・SQLiteからの読み戻し用
+"""
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+STORE_BACKEND = os.environ.get("STORE_BACKEND", "memory")
+STORE_SQLITE_PATH = Path(os.environ.get("STORE_SQLITE_PATH", "data/store.sqlite3"))
+# 書き込みをまとめる最大待ち時間（秒）と1トランザクションあたりの最大件数
+STORE_FLUSH_INTERVAL = float(os.environ.get("STORE_FLUSH_INTERVAL", "0.05"))
+STORE_BATCH_SIZE = int(os.environ.get("STORE_BATCH_SIZE", "500"))
+# 書き込みに失敗したときの再試行の間隔（秒）。失敗が続くたびに倍にし、STORE_RETRY_MAX_INTERVAL で頭打ち
+STORE_RETRY_INTERVAL = float(os.environ.get("STORE_RETRY_INTERVAL", "0.1"))
+STORE_RETRY_MAX_INTERVAL = float(os.environ.get("STORE_RETRY_MAX_INTERVAL", "5"))
+# 停止時に書き込めない場合の再試行回数（これを超えると残りの記録をあきらめて停止する）
+STORE_CLOSE_RETRIES = 3
+STORE_JOURNAL_DIR = Path(os.environ.get("STORE_JOURNAL_DIR", "data/journal"))
+# ジャーナル・共有データベースに何件書き込むごとにスナップショットを取るか（0で取らない）
+STORE_SNAPSHOT_EVERY = int(os.environ.get("STORE_SNAPSHOT_EVERY", "10000"))
+STORE_SHARED_PATH = Path(os.environ.get("STORE_SHARED_PATH", "data/store-shared.sqlite3"))
+
+
+class StorageBackend:
+    """永続化バックエンドの基底クラス"""
+    name = ""
+    # 他のプロセスと状態を共有するか（catch_up で他プロセスの記録を取り込む必要があるか）
+    multi_process = False
+
+    def load(self) -> Iterator[Dict]:
+        """永続化済みの記録を、適用する順に返す"""
+        return iter(())
+
+    def start(self, export: Optional[Callable[[], Iterable[Dict]]] = None,
+              apply: Optional[Callable[[Dict], None]] = None):
+        """
+        load の後、append を受け付ける前に呼ぶ
+        exportはメモリ上の状態を記録の列として返す関数（スナップショットを取るバックエンドが使う。
+        呼び出した時点の状態を写し取り、返す列は後から別のスレッドで読み進めてよい）
+        applyは記録をメモリ上の状態に適用する関数（他プロセスの記録を取り込むバックエンドが使う）
+        """
+
+    def append(self, record: Dict):
+        raise NotImplementedError
+
+    def catch_up(self):
+        """他のプロセスが書き込んだ記録をメモリ上の状態に取り込む（共有しないバックエンドでは何もしない）"""
+
+    def exclusive(self):
+        """
+        更新の区間（この中で状態を確認し、記録を append する）
+        共有するバックエンドでは区間の開始時に他プロセスの記録を取り込み、書き込みをプロセス間で直列化する
+        スナップショットを取るバックエンドでは、スナップショットを取る間は区間に入るのを待たせる
+        """
+        return nullcontext()
+
+    def flush(self):
+        """受け付け済みの記録がすべて書き込まれるまで待つ"""
+
+    def close(self):
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class MemoryBackend(StorageBackend):
+    """永続化しない（従来どおりプロセス内のメモリのみ）"""
+    name = "memory"
+
+    def append(self, record: Dict):
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    name TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    selected_index INTEGER NOT NULL,
+    answered_at TEXT NOT NULL,
+    PRIMARY KEY (name, question_id)
+);
+CREATE INDEX IF NOT EXISTS idx_answers_question_id ON answers (question_id);
+CREATE TABLE IF NOT EXISTS notification_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_name TEXT NOT NULL,
+    topic TEXT,
+    message TEXT NOT NULL,
+    sent_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notification_logs_to_name ON notification_logs (to_name);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    is_user INTEGER NOT NULL,
+    answer TEXT,
+    refs TEXT NOT NULL,
+    confidence TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_name ON chat_messages (name);
+CREATE TABLE IF NOT EXISTS escalations (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    retrieved_articles TEXT NOT NULL,
+    confidence TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_escalations_status ON escalations (status);
+CREATE INDEX IF NOT EXISTS idx_escalations_name ON escalations (name);
+CREATE TABLE IF NOT EXISTS import_keys (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+# 記録の種類ごとの書き込み文（パラメータ化した固定のSQLで、接続の文キャッシュに載せる）
+_WRITE_SQL = {
+    "user": "INSERT OR IGNORE INTO users (name, created_at) VALUES (?, ?)",
+    "answer": (
+        "INSERT INTO answers (name, question_id, selected_index, answered_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (name, question_id) DO UPDATE SET "
+        "selected_index = excluded.selected_index, answered_at = excluded.answered_at"
+    ),
+    "notification": "INSERT INTO notification_logs (to_name, topic, message, sent_at) VALUES (?, ?, ?, ?)",
+    "chat": (
+        "INSERT INTO chat_messages (name, message, is_user, answer, refs, confidence, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "escalation": (
+        "INSERT OR REPLACE INTO escalations "
+        "(id, name, message, retrieved_articles, confidence, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, 'open', ?, ?)"
+    ),
+    "escalation_status": "UPDATE escalations SET status = ?, updated_at = ? WHERE id = ?",
+    "import_key": "INSERT OR IGNORE INTO import_keys (key, result, created_at) VALUES (?, ?, ?)",
+}
+
+
+def _expand_batches(records: List[Dict]) -> Iterator[Dict]:
+    """一括取り込みの記録は、含まれるユーザー・回答の記録と冪等キーの記録に分けて返す（表ごとに書き込む用）"""
+    for record in records:
+        if record["type"] != "batch":
+            yield record
+            continue
+        yield from record["records"]
+        if record.get("key") is not None:
+            yield {"type": "import_key", "key": record["key"], "result": record["result"], "at": record["at"]}
+
+
+def _write_params(record: Dict) -> tuple:
+    kind = record["type"]
+    if kind == "user":
+        return (record["name"], record["at"])
+    if kind == "answer":
+        return (record["name"], record["question_id"], record["selected_index"], record["at"])
+    if kind == "notification":
+        return (record["to_name"], record["topic"], record["message"], record["at"])
+    if kind == "chat":
+        return (record["name"], record["message"], int(record["is_user"]), record["answer"],
+                json.dumps(record["references"], ensure_ascii=False), record["confidence"], record["at"])
+    if kind == "escalation":
+        return (record["id"], record["name"], record["message"],
+                json.dumps(record["retrieved_articles"], ensure_ascii=False), record["confidence"],
+                record["at"], record["at"])
+    if kind == "escalation_status":
+        return (record["status"], record["at"], record["id"])
+    if kind == "import_key":
+        return (record["key"], json.dumps(record["result"], ensure_ascii=False), record["at"])
+    raise ValueError(f"Unknown record type: {kind}")
+
+
+_STOP = object()
+
+
+class WriteBehindBackend(StorageBackend):
+    """
+    append はキューに積むだけで、書き込みスレッドが flush_interval 秒または batch_size 件ごとに
+    まとめて _write に渡すバックエンドの基底クラス（write-behind）
+    _write が retryable の例外で失敗した場合は、書き込めるまで間隔を広げながら同じバッチを再試行する
+    （後続の記録はキューに残したまま順序を保つ）
+    rejectable の例外（記録そのものの不備で、再試行しても書き込めない）で失敗した場合は、バッチを1件ずつ
+    書き直し、書き込めない記録だけを読み捨てて rejected に数える
+    """
+    retryable: Tuple[type, ...] = (OSError,)
+    rejectable: Tuple[type, ...] = (TypeError, ValueError, KeyError)
+
+    def __init__(self, flush_interval: float = STORE_FLUSH_INTERVAL, batch_size: int = STORE_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retry_interval = STORE_RETRY_INTERVAL
+        self.retry_max_interval = STORE_RETRY_MAX_INTERVAL
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_rejected: Optional[Dict] = None
+        self.failing_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self, export: Optional[Callable[[], Iterable[Dict]]] = None,
+              apply: Optional[Callable[[Dict], None]] = None):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name=f"store-{self.name}", daemon=True)
+            self._writer.start()
+
+    def append(self, record: Dict):
+        self._queue.put(record)
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            record = self._queue.get()
+            if record is _STOP:
+                self._queue.task_done()
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(record)
+            self._write_with_retry(batch)
+            # flush がスナップショットなどの後処理まで待つよう、後処理の後で完了にする
+            self._after_batch()
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_with_retry(self, batch: List):
+        try:
+            self._write_retrying(batch)
+            return
+        except self.rejectable as e:
+            if len(batch) == 1:
+                self._reject(batch[0], e)
+                return
+        # 不正な記録を含むバッチは1件ずつ書き直し、書き込めない記録だけを読み捨てる
+        for record in batch:
+            try:
+                self._write_retrying([record])
+            except self.rejectable as e:
+                self._reject(record, e)
+
+    def _write_retrying(self, batch: List):
+        """一時的な失敗は書き込めるまで再試行する（rejectable の例外はそのまま送出する）"""
+        delay = self.retry_interval
+        attempts = 0
+        while True:
+            try:
+                self._write(batch)
+            except self.rejectable:
+                self.failing_since = None
+                raise
+            except self.retryable as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if self.failing_since is None:
+                    self.failing_since = time.time()
+                attempts += 1
+                if self._stopping.is_set() and attempts > STORE_CLOSE_RETRIES:
+                    self.dropped += len(batch)
+                    return
+                self.retries += 1
+                # 停止要求があれば待たずに再試行する
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.retry_max_interval)
+                continue
+            self.failing_since = None
+            return
+
+    def _reject(self, record: Dict, error: Exception):
+        self.rejected += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.last_rejected = {"type": record.get("type"), "error": self.last_error}
+
+    def _write(self, batch: List):
+        """バッチを書き込む（失敗したら例外を送出する。途中まで書いた分は取り消すこと）"""
+        raise NotImplementedError
+
+    def _after_batch(self):
+        """書き込みスレッドで、バッチを書き込むたびに呼ぶ"""
+
+    def _drain(self) -> List:
+        """キューに残っている記録を待たずにすべて取り出して書き込む（停止の印はキューに戻す）"""
+        batch = []
+        stopping = False
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                self._queue.task_done()
+                stopping = True
+                continue
+            batch.append(record)
+        if batch:
+            self._write_with_retry(batch)
+            for _ in batch:
+                self._queue.task_done()
+        if stopping:
+            self._queue.put(_STOP)
+        return batch
+
+    def _close(self):
+        """書き込みスレッドの停止後に呼ぶ"""
+
+    def flush(self):
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._writer is not None:
+            self._stopping.set()
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+        self._close()
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            # 再試行中のバッチも含めた未書き込みの件数
+            "pending": self._queue.unfinished_tasks,
+            "written": self.written,
+            "batches": self.batches,
+            "healthy": self.failing_since is None,
+            "failing_since": self.failing_since,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "last_rejected": self.last_rejected,
+            "last_error": self.last_error,
+        }
+
+
+class SQLiteBackend(WriteBehindBackend):
+    """
+    SQLite（WALモード）への永続化
+    書き込みスレッドが記録をまとめて1トランザクションでコミットする
+    """
+    name = "sqlite"
+    retryable = (sqlite3.Error, OSError)
+    # 制約違反などは記録の不備なので再試行しない（sqlite3.Error の一部なので retryable より先に判定する）
+    rejectable = (sqlite3.IntegrityError, sqlite3.ProgrammingError, sqlite3.InterfaceError,
+                  TypeError, ValueError, KeyError)
+
+    def __init__(self, path: Path = STORE_SQLITE_PATH, flush_interval: float = STORE_FLUSH_INTERVAL,
+                 batch_size: int = STORE_BATCH_SIZE):
+        super().__init__(flush_interval=flush_interval, batch_size=batch_size)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def load(self) -> Iterator[Dict]:
+        conn = self._conn
+        for name, created_at in conn.execute("SELECT name, created_at FROM users ORDER BY created_at"):
+            yield {"type": "user", "name": name, "at": created_at}
+        for name, question_id, selected_index, answered_at in conn.execute(
+                "SELECT name, question_id, selected_index, answered_at FROM answers ORDER BY answered_at"):
+            yield {"type": "answer", "name": name, "question_id": question_id,
+                   "selected_index": selected_index, "at": answered_at}
+        for to_name, topic, message, sent_at in conn.execute(
+                "SELECT to_name, topic, message, sent_at FROM notification_logs ORDER BY id"):
+            yield {"type": "notification", "to_name": to_name, "topic": topic, "message": message,
+                   "at": sent_at}
+        for name, message, is_user, answer, refs, confidence, created_at in conn.execute(
+                "SELECT name, message, is_user, answer, refs, confidence, created_at "
+                "FROM chat_messages ORDER BY id"):
+            yield {"type": "chat", "name": name, "message": message, "is_user": bool(is_user),
+                   "answer": answer, "references": json.loads(refs), "confidence": confidence,
+                   "at": created_at}
+        for (escalation_id, name, message, articles, confidence, status, created_at,
+             updated_at) in conn.execute(
+                "SELECT id, name, message, retrieved_articles, confidence, status, created_at, updated_at "
+                "FROM escalations ORDER BY id"):
+            yield {"type": "escalation", "id": escalation_id, "name": name, "message": message,
+                   "retrieved_articles": json.loads(articles), "confidence": confidence,
+                   "at": created_at}
+            yield {"type": "escalation_status", "id": escalation_id, "status": status, "at": updated_at}
+        for key, result in conn.execute("SELECT key, result FROM import_keys"):
+            yield {"type": "import_key", "key": key, "result": json.loads(result)}
+
+    def _write(self, batch: List[Dict]):
+        """記録の並び順を保ったまま、同じ種類が続く区間ごとにexecutemanyで書き込む（失敗したらロールバック）"""
+        with self._transaction():
+            for kind, group in itertools.groupby(_expand_batches(batch), key=lambda record: record["type"]):
+                self._conn.executemany(_WRITE_SQL[kind], [_write_params(record) for record in group])
+        self.written += len(batch)
+        self.batches += 1
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            # エラーの種類によってはSQLiteが自動でロールバック済み
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+
+    def _close(self):
+        self._conn.close()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "path": str(self.path)}
+
+
+class SnapshotBarrier:
+    """
+    スナップショット用の読み書きロック
+    更新の区間（storeでの記録の適用と append）は shared で並行に進め、スナップショットは exclusive で
+    更新の途中でない状態を取り出す。exclusive を待っている間は新しい更新を待たせる
+    （同じスレッドで入れ子になった shared はそのまま通す）
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def shared(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            with self._cond:
+                while self._writing or self._waiting:
+                    self._cond.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class JournalBackend(WriteBehindBackend):
+    """
+    追記専用のジャーナル（NDJSON）への永続化
+    - 書き込みスレッドがまとめた記録を1回のwriteとfsyncで書き込む（グループコミット）
+    - snapshot_every 件ごとにメモリ上の状態を記録の列として書き出し、ジャーナルを新しいセグメントに切り替える
+      （書き込みスレッドが更新を止めてキューに残った記録を書き切り、書き込んだ記録と一致する状態を取り出す）
+    - 起動時は最新のスナップショットと、それ以降のセグメントだけを読み込む
+    - 書き込みに失敗した場合は書きかけの分を切り詰めてから再試行する
+
+    ファイル: snapshot-<n>.ndjson はセグメント journal-<n>.ndjson より前の記録をすべて反映した状態
+    """
+    name = "journal"
+
+    def __init__(self, directory: Path = STORE_JOURNAL_DIR, snapshot_every: int = STORE_SNAPSHOT_EVERY,
+                 flush_interval: float = STORE_FLUSH_INTERVAL, batch_size: int = STORE_BATCH_SIZE):
+        super().__init__(flush_interval=flush_interval, batch_size=batch_size)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = snapshot_every
+        self.segment = 0
+        self._file = None
+        self._export: Optional[Callable[[], Iterable[Dict]]] = None
+        self._barrier = SnapshotBarrier()
+        # 直近のスナップショット以降に書き込んだ件数（書き込みスレッドだけが更新する）
+        self._since_snapshot = 0
+        self.snapshots = 0
+        self.recovery: Dict = {}
+
+    def _path(self, kind: str, number: int) -> Path:
+        return self.directory / f"{kind}-{number:06d}.ndjson"
+
+    def _numbers(self, kind: str) -> List[int]:
+        numbers = []
+        for path in self.directory.glob(f"{kind}-*.ndjson"):
+            try:
+                numbers.append(int(path.stem.split("-", 1)[1]))
+            except ValueError:
+                continue
+        return sorted(numbers)
+
+    @staticmethod
+    def _read(path: Path) -> Iterator[Dict]:
+        """1行1記録で読み込む（書き込み途中で止まった末尾の不完全な行は読み飛ばす）"""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def load(self) -> Iterator[Dict]:
+        started = time.perf_counter()
+        snapshots = self._numbers("snapshot")
+        base = snapshots[-1] if snapshots else 0
+        snapshot_records = tail_records = 0
+        if snapshots:
+            for record in self._read(self._path("snapshot", base)):
+                snapshot_records += 1
+                yield record
+        segments = [n for n in self._numbers("journal") if n >= base]
+        for number in segments:
+            for record in self._read(self._path("journal", number)):
+                tail_records += 1
+                yield record
+        self.segment = max(segments[-1] if segments else base, base)
+        self._since_snapshot = tail_records
+        self.recovery = {
+            "snapshot": base if snapshots else None,
+            "snapshot_records": snapshot_records,
+            "tail_records": tail_records,
+            "load_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    @staticmethod
+    def _truncate_torn_tail(path: Path):
+        """書き込み途中で止まった末尾の不完全な行を切り詰める（続けて追記した記録が壊れないように）"""
+        if not path.exists():
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def start(self, export: Optional[Callable[[], Iterable[Dict]]] = None,
+              apply: Optional[Callable[[Dict], None]] = None):
+        self._export = export
+        path = self._path("journal", self.segment)
+        self._truncate_torn_tail(path)
+        self._file = self._open_segment(path)
+        super().start()
+
+    @staticmethod
+    def _open_segment(path: Path):
+        # バッファを挟まずに書き込む（失敗したときに書きかけの位置まで確実に切り詰められるように）
+        return open(path, "ab", buffering=0)
+
+    def exclusive(self):
+        return self._barrier.shared()
+
+    def _write(self, batch: List[Dict]):
+        data = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in batch
+        ).encode("utf-8")
+        fd = self._file.fileno()
+        position = os.lseek(fd, 0, os.SEEK_END)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        except OSError:
+            # 再試行で同じ記録が重複しないよう、書きかけの分を取り除く
+            try:
+                os.ftruncate(fd, position)
+            except OSError:
+                pass
+            raise
+        self.written += len(batch)
+        self.batches += 1
+        self._since_snapshot += len(batch)
+
+    def _after_batch(self):
+        if self._export is None or self.snapshot_every <= 0 or self._since_snapshot < self.snapshot_every:
+            return
+        with self._barrier.exclusive():
+            # 更新の途中のものはないので、キューに残った記録を書き切れば書き込んだ記録とメモリ上の状態が一致する
+            # （ここでは状態を写し取るだけで、退避したチャット履歴などはバリアを外してから読みながら書き出す）
+            self._drain()
+            records = self._export()
+        self._since_snapshot = 0
+        self._write_snapshot(records)
+
+    def _write_snapshot(self, records: Iterable[Dict]):
+        """スナップショットを一時ファイルに書いてから置き換え、新しいセグメントに切り替えて古いファイルを消す"""
+        number = self.segment + 1
+        path = self._path("snapshot", number)
+        temporary = path.with_suffix(".tmp")
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        except (OSError, TypeError, ValueError) as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            return
+
+        self._file.close()
+        self.segment = number
+        self._file = self._open_segment(self._path("journal", number))
+        self.snapshots += 1
+        for kind in ("journal", "snapshot"):
+            for old in self._numbers(kind):
+                if old < number:
+                    self._path(kind, old).unlink(missing_ok=True)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict:
+        return {
+            **super().stats(),
+            "directory": str(self.directory),
+            "segment": self.segment,
+            "since_snapshot": self._since_snapshot,
+            "snapshots": self.snapshots,
+            "recovery": self.recovery,
+        }
+
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+-- 連番 seq までの記録をすべて反映した状態（最新の1つだけを残す）
+CREATE TABLE IF NOT EXISTS snapshot_records (
+    seq INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (seq, pos)
+);
+-- 各プロセスが取り込み済みの連番（これより後の記録は消さない）
+CREATE TABLE IF NOT EXISTS readers (
+    pid INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+
+def _process_alive(pid: int) -> bool:
+    """同じホストのプロセスが生きているか（確かめられない環境では生きているとみなす）"""
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class SharedSQLiteBackend(StorageBackend):
+    """
+    複数のワーカープロセス（uvicorn --workers N）で1つのSQLiteファイルを共有する
+    - 記録は連番付きの記録表に同期的に書き込む（BEGIN IMMEDIATEでプロセス間の書き込みを直列化）
+    - 各プロセスはメモリ上に状態を持ち、リクエストの開始時と更新の直前に他プロセスの記録を連番順に取り込む
+    - 他プロセスの書き込みの有無は PRAGMA data_version で確認するため、変更がなければ記録表は読まない
+    - snapshot_every 件ごとに、書き込みロック中のプロセスがメモリ上の状態をスナップショットとして書き、
+      全プロセスが取り込み済みの記録を記録表から消す（取り込み済みの連番は readers 表に書き込みのたびに残す）
+    - 起動時は最新のスナップショットと、それより後の記録だけを読み込む
+    """
+    name = "shared"
+    multi_process = True
+
+    def __init__(self, path: Path = STORE_SHARED_PATH, snapshot_every: int = STORE_SNAPSHOT_EVERY):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                     timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SHARED_SCHEMA)
+        self.snapshot_every = snapshot_every
+        self.pid = os.getpid()
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._seq = 0
+        self._snapshot_seq = 0
+        self._data_version: Optional[int] = None
+        self._export: Optional[Callable[[], Iterable[Dict]]] = None
+        self._apply: Optional[Callable[[Dict], None]] = None
+        self.pulled = 0
+        self.written = 0
+        self.snapshots = 0
+        self.last_error: Optional[str] = None
+
+    def _current_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _pending(self) -> Iterator[Dict]:
+        rows = self._conn.execute("SELECT seq, record FROM events WHERE seq > ? ORDER BY seq", (self._seq,))
+        for seq, body in rows.fetchall():
+            self._seq = seq
+            yield json.loads(body)
+
+    def _latest_snapshot(self) -> int:
+        return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM snapshot_records").fetchone()[0]
+
+    def load(self) -> Iterator[Dict]:
+        with self._lock:
+            # 読み込む前に取り込み済みの位置を登録する（読み込む途中の記録を他プロセスが消さないように）
+            self._conn.execute(
+                "INSERT OR REPLACE INTO readers (pid, seq) VALUES "
+                "(?, (SELECT COALESCE(MAX(seq), 0) FROM snapshot_records))",
+                (self.pid,),
+            )
+            # スナップショットと記録表を同じ時点のものとして読む（WALの読み取りトランザクション）
+            self._conn.execute("BEGIN")
+            try:
+                self._data_version = self._current_data_version()
+                self._seq = self._snapshot_seq = self._latest_snapshot()
+                if self._seq:
+                    rows = self._conn.execute(
+                        "SELECT record FROM snapshot_records WHERE seq = ? ORDER BY pos", (self._seq,)
+                    )
+                    for (body,) in rows:
+                        yield json.loads(body)
+                yield from self._pending()
+            finally:
+                self._conn.execute("COMMIT")
+
+    def start(self, export: Optional[Callable[[], Iterable[Dict]]] = None,
+              apply: Optional[Callable[[Dict], None]] = None):
+        self._export = export
+        self._apply = apply
+
+    def _pull(self):
+        for record in self._pending():
+            self._apply(record)
+            self.pulled += 1
+
+    def catch_up(self):
+        with self._lock:
+            version = self._current_data_version()
+            if version == self._data_version:
+                return
+            self._pull()
+            self._data_version = version
+
+    @contextmanager
+    def exclusive(self):
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._pull()
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                # 書き込みロック中は他プロセスがコミットできないので、ここまでの記録はすべて取り込み済み
+                # （自プロセスのコミットでは data_version は変わらない）
+                self._conn.execute("INSERT OR REPLACE INTO readers (pid, seq) VALUES (?, ?)",
+                                   (self.pid, self._seq))
+                self._maybe_snapshot()
+                self._data_version = self._current_data_version()
+                self._conn.execute("COMMIT")
+
+    def _maybe_snapshot(self):
+        if self._export is None or self.snapshot_every <= 0:
+            return
+        if self._seq - self._snapshot_seq < self.snapshot_every:
+            return
+        # 他プロセスが先にスナップショットを取っていれば、そこから数え直す
+        self._snapshot_seq = max(self._snapshot_seq, self._latest_snapshot())
+        if self._seq - self._snapshot_seq < self.snapshot_every:
+            return
+        self._write_snapshot()
+
+    def _write_snapshot(self):
+        """
+        メモリ上の状態を連番 _seq のスナップショットとして書き、古いスナップショットと
+        全プロセスが取り込み済みの記録を消す（書き込みロックの中で、他プロセスの記録をすべて取り込んだ状態で呼ぶ）
+        失敗した場合はスナップショットだけを取り消し、同じトランザクションの記録はそのままコミットする
+        """
+        seq = self._seq
+        self._conn.execute("SAVEPOINT snapshot")
+        try:
+            self._conn.executemany(
+                "INSERT INTO snapshot_records (seq, pos, record) VALUES (?, ?, ?)",
+                ((seq, pos, json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                 for pos, record in enumerate(self._export())),
+            )
+            self._conn.execute("DELETE FROM snapshot_records WHERE seq < ?", (seq,))
+            # 異常終了したプロセスの登録は外す（残っていると記録をいつまでも消せない）
+            for (pid,) in self._conn.execute("SELECT pid FROM readers").fetchall():
+                if pid != self.pid and not _process_alive(pid):
+                    self._conn.execute("DELETE FROM readers WHERE pid = ?", (pid,))
+            oldest = self._conn.execute("SELECT MIN(seq) FROM readers").fetchone()[0]
+            self._conn.execute("DELETE FROM events WHERE seq <= ?", (min(seq, oldest),))
+            self._conn.execute("RELEASE snapshot")
+        except (sqlite3.Error, OSError, TypeError, ValueError) as e:
+            self._conn.execute("ROLLBACK TO snapshot")
+            self._conn.execute("RELEASE snapshot")
+            self.last_error = f"{type(e).__name__}: {e}"
+            return
+        self._snapshot_seq = seq
+        self.snapshots += 1
+
+    def append(self, record: Dict):
+        with self.exclusive():
+            cursor = self._conn.execute(
+                "INSERT INTO events (type, record) VALUES (?, ?)",
+                (record["type"], json.dumps(record, ensure_ascii=False, separators=(",", ":"))),
+            )
+            self._seq = cursor.lastrowid
+            self.written += 1
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM readers WHERE pid = ?", (self.pid,))
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            oldest, latest, events = self._conn.execute(
+                "SELECT MIN(seq), MAX(seq), COUNT(*) FROM events"
+            ).fetchone()
+            snapshot = self._latest_snapshot()
+            readers = self._conn.execute("SELECT COUNT(*) FROM readers").fetchone()[0]
+        return {
+            "backend": self.name,
+            "path": str(self.path),
+            "pid": self.pid,
+            "applied_seq": self._seq,
+            "latest_seq": max(latest or 0, snapshot),
+            "oldest_seq": oldest,
+            "events": events,
+            "snapshot_seq": snapshot,
+            "snapshots": self.snapshots,
+            "readers": readers,
+            "pulled": self.pulled,
+            "written": self.written,
+            "last_error": self.last_error,
+        }
+
+
+BACKENDS = {
+    MemoryBackend.name: MemoryBackend,
+    SQLiteBackend.name: SQLiteBackend,
+    JournalBackend.name: JournalBackend,
+    SharedSQLiteBackend.name: SharedSQLiteBackend,
+}
+
+
+def create_backend(name: str = None) -> StorageBackend:
+    """環境変数 STORE_BACKEND（または name）に応じたバックエンドを作成"""
+    name = name or STORE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown store backend: {name}")
+    return BACKENDS[name]()
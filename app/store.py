@@ -1,28 +1,172 @@
 """
 インメモリデータストア
+
+並行処理（スレッドプールで動くハンドラ）への対応:
+- ユーザーごとの進捗・チャット履歴の更新は、ユーザー名で選ぶロック（ロックストライピング）で直列化する
+- エスカレーションIDは IdAllocator で単調増加に採番する
+- 管理画面の集計は更新のたびに不変のスナップショットとして公開し、読み取り側はロックを取らない
+- テーマ×状態の二次索引（StatusIndex）は状態が変わったときだけ更新し、未受講者などの抽出で全ユーザーを走査しない
 """
-from typing import Dict, List, Optional
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import threading
+from array import array
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime
 from app.schemas import Question
 from app import data
+from app.storage import MemoryBackend, StorageBackend, create_backend
+
+
+TOPICS = ("governance", "harassment", "infosec")
+TOPIC_INDEX = {topic: i for i, topic in enumerate(TOPICS)}
+STATUSES = ("not_started", "in_progress", "completed")
+ESCALATION_STATUSES = ("open", "in_progress", "closed")
+
+# ユーザーごとにメモリに保持するチャットメッセージ数の上限
+CHAT_HISTORY_LIMIT = int(os.environ.get("CHAT_HISTORY_LIMIT", "200"))
+# 上限を超えた古いメッセージの退避先（空なら退避せず、メモリから捨てる）
+CHAT_SPILL_DIR = os.environ.get("CHAT_SPILL_DIR", "")
+
+# 未回答を表す選択肢番号（回答はbytearrayに1設問1バイトで保持）
+UNANSWERED = 0xFF
+
+# テーマごとに保持する値（状態, 回答済みの設問数, 正解数, 未回答の最初の設問の位置）
+_STATUS, _ANSWERED, _CORRECT, _NEXT = range(4)
+_TOPIC_FIELDS = 4
+
+
+class AnswersView(Mapping):
+    """UserProgressの回答を 設問ID → 選択肢番号 の読み取り専用マッピングとして見せる"""
+    __slots__ = ("_answers",)
+
+    def __init__(self, answers: bytearray):
+        self._answers = answers
+
+    def _ordinal(self, question_id: str) -> Optional[int]:
+        try:
+            return data.get_question_ordinal(question_id)
+        except ValueError:
+            return None
+
+    def __getitem__(self, question_id: str) -> int:
+        ordinal = self._ordinal(question_id)
+        if ordinal is None or self._answers[ordinal] == UNANSWERED:
+            raise KeyError(question_id)
+        return self._answers[ordinal]
+
+    def __contains__(self, question_id) -> bool:
+        ordinal = self._ordinal(question_id)
+        return ordinal is not None and self._answers[ordinal] != UNANSWERED
+
+    def __iter__(self):
+        for ordinal, selected in enumerate(self._answers):
+            if selected != UNANSWERED:
+                yield data.get_question_by_ordinal(ordinal).id
+
+    def __len__(self) -> int:
+        return len(self._answers) - self._answers.count(UNANSWERED)
 
 
 class UserProgress:
-    """ユーザーの進捗情報"""
-    def __init__(self, name: str):
+    """
+    ユーザーの進捗情報
+    回答は設問の通し番号で引くbytearray（未回答はUNANSWERED）、テーマごとの状態・回答数・正解数・
+    未回答の最初の設問の位置は1本のarrayに並べて保持する（ユーザー数が多くても1人あたりが小さい）
+    answers / status_by_topic / score_by_topic は従来の辞書形式の読み取り用ビュー
+    """
+    __slots__ = ("name", "updated_at", "_answers", "_topics")
+
+    def __init__(self, name: str, question_count: Optional[int] = None):
         self.name = name
-        self.status_by_topic: Dict[str, str] = {
-            "governance": "not_started",
-            "harassment": "not_started",
-            "infosec": "not_started"
-        }
-        self.answers: Dict[str, int] = {}  # question_id -> selected_index
-        self.score_by_topic: Dict[str, Dict[str, int]] = {
-            "governance": {"correct": 0, "total": 0},
-            "harassment": {"correct": 0, "total": 0},
-            "infosec": {"correct": 0, "total": 0}
-        }
         self.updated_at: Optional[datetime] = None
+        if question_count is None:
+            question_count = len(data.REPOSITORY)
+        self._answers = bytearray([UNANSWERED]) * question_count
+        self._topics = array("H", [0]) * (_TOPIC_FIELDS * len(TOPICS))
+
+    def _get(self, topic: str, field: int) -> int:
+        return self._topics[TOPIC_INDEX[topic] * _TOPIC_FIELDS + field]
+
+    def status(self, topic: str) -> str:
+        return STATUSES[self._get(topic, _STATUS)]
+
+    def answered_count(self, topic: str) -> int:
+        return self._get(topic, _ANSWERED)
+
+    def correct_count(self, topic: str) -> int:
+        return self._get(topic, _CORRECT)
+
+    def next_position(self, topic: str) -> int:
+        """テーマ内で未回答の最初の設問の位置（これより前の設問はすべて回答済み）"""
+        return self._get(topic, _NEXT)
+
+    def selected_index(self, ordinal: int) -> Optional[int]:
+        selected = self._answers[ordinal]
+        return None if selected == UNANSWERED else selected
+
+    def record_answer(self, question: Question, ordinal: int, selected_index: int) -> Optional[int]:
+        """
+        回答を記録し、テーマの回答数・正解数・次の設問の位置・状態を更新して前回の回答を返す
+        同じ設問に回答し直した場合は回答数を増やさず、正解数だけを前回の回答との差分で更新する
+        """
+        previous_index = self.selected_index(ordinal)
+        self._answers[ordinal] = selected_index
+
+        base = TOPIC_INDEX[question.topic] * _TOPIC_FIELDS
+        topics = self._topics
+        if previous_index is None:
+            topics[base + _ANSWERED] += 1
+        topics[base + _CORRECT] += (
+            int(selected_index == question.correct_index)
+            - int(previous_index is not None and previous_index == question.correct_index)
+        )
+
+        # 未回答の最初の設問の位置を進める（各位置は一度しか通らない）
+        topic_ordinals = data.REPOSITORY.topic_ordinals(question.topic)
+        position = topics[base + _NEXT]
+        while position < len(topic_ordinals) and self._answers[topic_ordinals[position]] != UNANSWERED:
+            position += 1
+        topics[base + _NEXT] = position
+
+        # ステータス更新
+        if topics[base + _ANSWERED] == len(topic_ordinals):
+            topics[base + _STATUS] = STATUSES.index("completed")
+        elif topics[base + _ANSWERED] > 0:
+            topics[base + _STATUS] = STATUSES.index("in_progress")
+        return previous_index
+
+    @property
+    def answers(self) -> AnswersView:
+        """設問ID → 選択肢番号"""
+        return AnswersView(self._answers)
+
+    @property
+    def status_by_topic(self) -> Dict[str, str]:
+        return {topic: self.status(topic) for topic in TOPICS}
+
+    @property
+    def score_by_topic(self) -> Dict[str, Dict[str, int]]:
+        """total は回答済みの設問数、correct は現在の回答が正解の設問数"""
+        return {
+            topic: {"correct": self.correct_count(topic), "total": self.answered_count(topic)}
+            for topic in TOPICS
+        }
+
+    @property
+    def next_by_topic(self) -> Dict[str, int]:
+        return {topic: self.next_position(topic) for topic in TOPICS}
+
+
+DEFAULT_NOTIFICATION_MESSAGE = "リマインド通知を送信しました"
 
 
 class NotificationLog:
@@ -31,7 +175,8 @@ class NotificationLog:
         self.sent_at = datetime.now()
         self.to_name = to_name
         self.topic = topic
-        self.message = message or "リマインド通知を送信しました"
+        self.message = message or DEFAULT_NOTIFICATION_MESSAGE
+        self.id = 0  # 送信順の通し番号（1から）
 
 
 class ChatMessage:
@@ -44,12 +189,115 @@ class ChatMessage:
         self.answer = None  # 回答内容
         self.references = []  # 参照条文
         self.confidence = None  # 自信度
+        self.seq = 0  # ユーザーごとの通し番号（1から）
+
+
+def _chat_record(chat_msg: ChatMessage) -> Dict:
+    return {"type": "chat", "name": chat_msg.name, "message": chat_msg.message, "is_user": chat_msg.is_user,
+            "answer": chat_msg.answer, "references": chat_msg.references, "confidence": chat_msg.confidence,
+            "at": chat_msg.timestamp.isoformat()}
+
+
+def _chat_message(record: Dict) -> ChatMessage:
+    chat_msg = ChatMessage(record["name"], record["message"], record["is_user"])
+    chat_msg.timestamp = datetime.fromisoformat(record["at"])
+    chat_msg.answer = record["answer"]
+    chat_msg.references = record["references"]
+    chat_msg.confidence = record["confidence"]
+    chat_msg.seq = record.get("seq", 0)
+    return chat_msg
+
+
+class ChatHistory:
+    """
+    ユーザーごとのチャット履歴
+    新しい CHAT_HISTORY_LIMIT 件だけをメモリに保持するリングバッファで、溢れた古いメッセージは
+    退避先が設定されていればユーザーごとのNDJSONファイルに追記する（ファイル内の位置を通し番号順に保持）
+    """
+    __slots__ = ("name", "messages", "total", "_offsets", "_spill_start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.messages: Deque[ChatMessage] = deque()
+        self.total = 0
+        self._offsets = array("Q")  # 退避したメッセージのファイル内の位置（通し番号 _spill_start から連続）
+        self._spill_start = 1
+
+    def append(self, chat_msg: ChatMessage):
+        self.total += 1
+        chat_msg.seq = self.total
+        self.messages.append(chat_msg)
+        if len(self.messages) > CHAT_HISTORY_LIMIT:
+            self._spill(self.messages.popleft())
+
+    def _spill_path(self) -> Optional[Path]:
+        if _spill_dir is None:
+            return None
+        return _spill_dir / (hashlib.sha1(self.name.encode("utf-8")).hexdigest() + ".ndjson")
+
+    def _spill(self, chat_msg: ChatMessage):
+        path = self._spill_path()
+        if path is None:
+            return
+        line = json.dumps({**_chat_record(chat_msg), "seq": chat_msg.seq}, ensure_ascii=False) + "\n"
+        try:
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(line.encode("utf-8"))
+        except OSError:
+            # 書き込めなかった場合は、それより前の退避分も含めて読めないものとして扱う
+            self._offsets = array("Q")
+            self._spill_start = chat_msg.seq + 1
+            return
+        if not self._offsets:
+            self._spill_start = chat_msg.seq
+        self._offsets.append(offset)
+
+    def first_seq(self) -> int:
+        """読み出せる最も古いメッセージの通し番号"""
+        if self._offsets:
+            return self._spill_start
+        return self.messages[0].seq if self.messages else self.total + 1
+
+    def page(self, limit: Optional[int] = None, before: Optional[int] = None) -> List[ChatMessage]:
+        """通し番号が before より前のメッセージのうち新しい limit 件を古い順に返す（省略時は読み出せるすべて）"""
+        end = self.total + 1 if before is None else min(before, self.total + 1)
+        start = self.first_seq() if limit is None else max(end - limit, self.first_seq())
+        memory_start = self.messages[0].seq if self.messages else self.total + 1
+        result: List[ChatMessage] = []
+        if start < min(end, memory_start):
+            result.extend(self._read_spilled(start, min(end, memory_start)))
+        if end > memory_start:
+            result.extend(itertools.islice(self.messages, max(start, memory_start) - memory_start,
+                                           end - memory_start))
+        return result
+
+    def spilled(self) -> Tuple[Optional[Path], int, int]:
+        """
+        読み出せる退避分の (ファイル, 先頭の位置, 件数)
+        退避ファイルは追記のみで、読み出せる範囲の行は連続しているため、後から先頭の位置から件数分を読めば同じ内容になる
+        """
+        if not self._offsets:
+            return None, 0, 0
+        return self._spill_path(), self._offsets[0], len(self._offsets)
+
+    def _read_spilled(self, start: int, end: int) -> List[ChatMessage]:
+        path = self._spill_path()
+        if path is None or not self._offsets:
+            return []
+        try:
+            with open(path, "rb") as f:
+                f.seek(self._offsets[start - self._spill_start])
+                return [_chat_message(json.loads(f.readline())) for _ in range(end - start)]
+        except (OSError, ValueError):
+            return []
 
 
 class Escalation:
     """エスカレーション"""
-    def __init__(self, name: str, message: str, retrieved_articles: List[dict], confidence: str):
-        self.id = len(_escalations) + 1
+    def __init__(self, name: str, message: str, retrieved_articles: List[dict], confidence: str,
+                 escalation_id: Optional[int] = None):
+        self.id = escalation_id if escalation_id is not None else _escalation_ids.allocate()
         self.created_at = datetime.now()
         self.name = name
         self.message = message
@@ -59,18 +307,555 @@ class Escalation:
         self.updated_at = datetime.now()
 
 
+class IncorrectRanking:
+    """
+    設問ごとの誤答数（設問の通し番号で管理）
+    誤答のある設問を (-誤答数, 通し番号) のソート済みリストで保持し、上位K件をO(K)で返す
+    """
+    def __init__(self, size: int):
+        self.counts: List[int] = [0] * size
+        self._order: List[Tuple[int, int]] = []
+
+    def add(self, ordinal: int, delta: int):
+        old = self.counts[ordinal]
+        new = old + delta
+        if old > 0:
+            del self._order[bisect_left(self._order, (-old, ordinal))]
+        if new > 0:
+            insort(self._order, (-new, ordinal))
+        self.counts[ordinal] = new
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        """誤答数の多い順（同数は設問の並び順）に（通し番号, 誤答数）を返す"""
+        return [(ordinal, -negative) for negative, ordinal in self._order[:k]]
+
+    def snapshot(self) -> Tuple[Tuple[int, int], ...]:
+        """誤答数の多い順の（通し番号, 誤答数）をすべて返す（公開用の不変のコピー）"""
+        return tuple(self.top(len(self._order)))
+
+
+class IdAllocator:
+    """単調増加するIDの採番（復元した記録のIDは observe で反映し、以降はその次から採番する）"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = 0
+
+    def allocate(self) -> int:
+        with self._lock:
+            self._last += 1
+            return self._last
+
+    def observe(self, used_id: int):
+        with self._lock:
+            if used_id > self._last:
+                self._last = used_id
+
+
+class AggregateSnapshot:
+    """管理画面用の集計の不変のスナップショット（読み取り側はロックなしで参照する）"""
+    __slots__ = ("totals", "ranking")
+
+    def __init__(self, totals: Dict[str, Tuple[int, int, int]], ranking: Tuple[Tuple[int, int], ...]):
+        self.totals = totals  # テーマ → (正解数, 回答数, 回答したユーザー数)
+        self.ranking = ranking  # 誤答数の多い順の（通し番号, 誤答数）
+
+
+class StatusIndex:
+    """
+    テーマ×状態 → ユーザー名（昇順のリスト）の二次索引
+    テーマを問わない条件は (None, 状態)（いずれかのテーマがその状態）、全ユーザーは (None, None) で引く
+    名前の昇順に並べておき、名前をカーソルにして結果の件数分だけ取り出す
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names: Dict[Tuple[Optional[str], Optional[str]], List[str]] = {(None, None): []}
+        for status in STATUSES:
+            self._names[(None, status)] = []
+            for topic in TOPICS:
+                self._names[(topic, status)] = []
+        # 状態 → ユーザー名 → その状態のテーマ数（0になったら (None, 状態) から外す）
+        self._topic_counts: Dict[str, Dict[str, int]] = {status: {} for status in STATUSES}
+
+    def _insert(self, key: Tuple[Optional[str], Optional[str]], name: str):
+        names = self._names[key]
+        position = bisect_left(names, name)
+        if position == len(names) or names[position] != name:
+            names.insert(position, name)
+
+    def _remove(self, key: Tuple[Optional[str], Optional[str]], name: str):
+        names = self._names[key]
+        position = bisect_left(names, name)
+        if position < len(names) and names[position] == name:
+            del names[position]
+
+    def add_user(self, name: str):
+        """新しいユーザーを全テーマ未受講として登録"""
+        with self._lock:
+            self._insert((None, None), name)
+            self._insert((None, "not_started"), name)
+            self._topic_counts["not_started"][name] = len(TOPICS)
+            for topic in TOPICS:
+                self._insert((topic, "not_started"), name)
+
+    def move(self, name: str, topic: str, old: str, new: str):
+        """テーマの状態が old から new に変わったユーザーを付け替える"""
+        with self._lock:
+            self._remove((topic, old), name)
+            self._insert((topic, new), name)
+            counts = self._topic_counts[old]
+            counts[name] -= 1
+            if counts[name] == 0:
+                del counts[name]
+                self._remove((None, old), name)
+            counts = self._topic_counts[new]
+            counts[name] = counts.get(name, 0) + 1
+            if counts[name] == 1:
+                self._insert((None, new), name)
+
+    def page(self, topic: Optional[str], status: Optional[str], limit: int,
+             after: Optional[str] = None) -> Tuple[List[str], Optional[str], int]:
+        """
+        条件に合うユーザー名を after より後ろから名前順に limit 件取り出す
+        (名前, 次の after（続きがなければNone）, 条件に合う全件数) を返す
+        """
+        with self._lock:
+            names = self._names[(topic if status else None, status)]
+            start = 0 if after is None else bisect_right(names, after)
+            page = names[start:start + limit]
+            more = start + limit < len(names)
+            return page, (page[-1] if more and page else None), len(names)
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """テーマ（テーマを問わない場合は "any"）→ 状態 → 人数"""
+        with self._lock:
+            return {
+                topic or "any": {status: len(self._names[(topic, status)]) for status in STATUSES}
+                for topic in (*TOPICS, None)
+            }
+
+
+class ImportConflictError(ValueError):
+    """適用済みの冪等キーで、内容の異なるバッチを取り込もうとした"""
+
+
 # グローバルストア
 _user_progress: Dict[str, UserProgress] = {}
-_notification_logs: List[NotificationLog] = []
-_chat_history: Dict[str, List[ChatMessage]] = {}  # name -> messages
-_escalations: List[Escalation] = []
+_notification_logs: List[NotificationLog] = []  # 送信順（= 通し番号順）に追記のみ
+_notifications_by_recipient: Dict[str, List[int]] = {}  # 送信先 → 通し番号（昇順）
+_chat_history: Dict[str, ChatHistory] = {}  # name -> 履歴
+_chat_names: List[str] = []  # 履歴のあるユーザー名（作成順に追記のみ。エクスポートで位置をカーソルにする）
+_escalations: List[Escalation] = []  # ID順に追記のみ
+_escalations_by_id: Dict[int, Escalation] = {}
+_escalation_order: List[int] = []  # 全件のID（昇順）
+_escalations_by_status: Dict[str, List[int]] = {status: [] for status in ESCALATION_STATUSES}  # ステータス → ID（昇順）
+_escalations_by_name: Dict[str, List[int]] = {}  # 相談者 → ID（昇順）
+
+# 管理画面用の集計（save_answerで差分更新する）
+_topic_totals: Dict[str, Dict[str, int]] = {
+    topic: {"correct": 0, "total": 0, "users": 0} for topic in TOPICS
+}
+_incorrect_ranking = IncorrectRanking(len(data.REPOSITORY))
+_aggregates = AggregateSnapshot({topic: (0, 0, 0) for topic in TOPICS}, ())
+
+# 一括取り込みの冪等キー → 最初に適用したときの結果
+_import_results: Dict[str, Dict] = {}
+
+# テーマ×状態の二次索引（ユーザーの作成・save_answerで状態が変わったときに更新する）
+_status_index = StatusIndex()
+
+# ロック（取る順番は バックエンドの exclusive〈journalではスナップショットとの読み書きロック〉 → _import_lock → ユーザー/エスカレーション/通知のロック → _aggregate_lock・StatusIndexのロック）
+USER_LOCK_STRIPES = 64
+_user_locks = [threading.RLock() for _ in range(USER_LOCK_STRIPES)]
+_escalation_lock = threading.RLock()
+_notification_lock = threading.RLock()
+_import_lock = threading.RLock()  # 一括取り込み（冪等キーの確認と適用）を直列化する
+_aggregate_lock = threading.Lock()
+_escalation_ids = IdAllocator()
+
+# チャット履歴の退避先（init_storageで CHAT_SPILL_DIR から決める）
+_spill_dir: Optional[Path] = None
+
+# 永続化バックエンド（既定はメモリのみ。init_storageで切り替える）
+_backend: StorageBackend = MemoryBackend()
+
+
+# ==================== 更新の記録と適用 ====================
+# 更新はすべて記録（dict）として _apply_* でメモリ上の状態に適用し、同じ記録をバックエンドに渡す
+# 起動時はバックエンドから読み戻した記録を同じ _apply_* で再適用する
+
+def _timestamp() -> str:
+    return datetime.now().isoformat()
+
+
+def _apply_user(record: Dict) -> UserProgress:
+    user = _user_progress.get(record["name"])
+    if user is None:
+        # ユーザーのロックの中で呼ばれるため、同じ名前で重ねて作成されることはない
+        user = UserProgress(record["name"])
+        _user_progress[record["name"]] = user
+        _status_index.add_user(user.name)
+    return user
+
+
+def _apply_answer(record: Dict) -> UserProgress:
+    """
+    回答を適用し、スコアを更新
+    同じ設問に回答し直した場合は回答数を増やさず、正解数だけを前回の回答との差分で更新する
+    """
+    question = data.get_question_by_id(record["question_id"])
+    user = _apply_user(record)
+    before = user.status_by_topic
+    delta = _record_answer(user, question, record)
+    _update_status_index(user, before)
+    _add_aggregates([delta])
+    return user
+
+
+def _record_answer(user: UserProgress, question: Question, record: Dict) -> Tuple[str, int, int, int, int, int]:
+    """
+    回答をユーザーの進捗に記録し、テーマ別の集計・誤答数に加える差分
+    (テーマ, 回答したユーザー数, 回答数, 正解数, 設問の通し番号, 誤答数) を返す
+    """
+    selected_index = record["selected_index"]
+    topic = question.topic
+    first_in_topic = user.answered_count(topic) == 0
+    ordinal = data.get_question_ordinal(question.id)
+    previous_index = user.record_answer(question, ordinal, selected_index)
+    answered_at = datetime.fromisoformat(record["at"])
+    # 取り込んだ過去の回答で最終更新日時が戻らないようにする
+    if user.updated_at is None or answered_at > user.updated_at:
+        user.updated_at = answered_at
+    
+    # 回答し直した場合は前回の回答の分を差し引く
+    is_correct = selected_index == question.correct_index
+    was_correct = previous_index is not None and previous_index == question.correct_index
+    was_incorrect = previous_index is not None and not was_correct
+    return (
+        topic,
+        int(previous_index is None and first_in_topic),
+        int(previous_index is None),
+        int(is_correct) - int(was_correct),
+        ordinal,
+        int(not is_correct) - int(was_incorrect),
+    )
+
+
+def _update_status_index(user: UserProgress, before: Dict[str, str]):
+    """回答の前後で状態が変わったテーマだけ、状態の索引を付け替える"""
+    for topic in TOPICS:
+        status = user.status(topic)
+        if status != before[topic]:
+            _status_index.move(user.name, topic, before[topic], status)
+
+
+def _add_aggregates(deltas: List[Tuple[str, int, int, int, int, int]]):
+    """回答の差分をテーマ別の集計・誤答数にまとめて加え、スナップショットを1回だけ差し替える"""
+    if not deltas:
+        return
+    incorrect: Dict[int, int] = {}
+    with _aggregate_lock:
+        for topic, users, total, correct, ordinal, wrong in deltas:
+            totals = _topic_totals[topic]
+            totals["users"] += users
+            totals["total"] += total
+            totals["correct"] += correct
+            if wrong:
+                incorrect[ordinal] = incorrect.get(ordinal, 0) + wrong
+        for ordinal, wrong in incorrect.items():
+            if wrong:
+                _incorrect_ranking.add(ordinal, wrong)
+        _publish_aggregates()
 
 
+def _publish_aggregates():
+    """集計のスナップショットを差し替える（_aggregate_lock を取って呼ぶ）"""
+    global _aggregates
+    _aggregates = AggregateSnapshot(
+        {topic: (totals["correct"], totals["total"], totals["users"]) for topic, totals in _topic_totals.items()},
+        _incorrect_ranking.snapshot(),
+    )
+
+
+def _apply_notification(record: Dict) -> NotificationLog:
+    log = NotificationLog(record["to_name"], record["topic"], record["message"])
+    log.sent_at = datetime.fromisoformat(record["at"])
+    log.id = len(_notification_logs) + 1
+    _notification_logs.append(log)
+    _notifications_by_recipient.setdefault(log.to_name, []).append(log.id)
+    return log
+
+
+def _apply_chat(record: Dict) -> ChatMessage:
+    chat_msg = _chat_message(record)
+    history = _chat_history.get(record["name"])
+    if history is None:
+        history = ChatHistory(record["name"])
+        _chat_history[record["name"]] = history
+        _chat_names.append(record["name"])
+    history.append(chat_msg)
+    return chat_msg
+
+
+def _apply_escalation(record: Dict) -> Escalation:
+    escalation = Escalation(record["name"], record["message"], record["retrieved_articles"],
+                            record["confidence"], escalation_id=record["id"])
+    escalation.created_at = escalation.updated_at = datetime.fromisoformat(record["at"])
+    _escalations.append(escalation)
+    _escalations_by_id[escalation.id] = escalation
+    # IDは採番順に届くので通常は末尾への追加になる
+    for ids in (_escalation_order, _escalations_by_status[escalation.status],
+                _escalations_by_name.setdefault(escalation.name, [])):
+        insort(ids, escalation.id)
+    _escalation_ids.observe(escalation.id)
+    return escalation
+
+
+def _apply_escalation_status(record: Dict) -> Optional[Escalation]:
+    esc = _escalations_by_id.get(record["id"])
+    if esc is None:
+        return None
+    if record["status"] != esc.status:
+        old_ids = _escalations_by_status[esc.status]
+        del old_ids[bisect_left(old_ids, esc.id)]
+        insort(_escalations_by_status[record["status"]], esc.id)
+        esc.status = record["status"]
+    esc.updated_at = datetime.fromisoformat(record["at"])
+    return esc
+
+
+def _apply_batch(record: Dict) -> Dict:
+    """
+    一括取り込みの記録（ユーザー・回答の記録の列）を適用
+    状態の索引はユーザーごとに1回、集計はバッチ全体で1回だけ更新する
+    冪等キーが適用済みなら何もせず、最初に適用したときの結果を返す
+    """
+    key = record.get("key")
+    if key is not None and key in _import_results:
+        return {**_import_results[key], "replayed": True}
+    users: Dict[str, Tuple[UserProgress, Dict[str, str]]] = {}
+    deltas = []
+    created = 0
+    for item in record["records"]:
+        entry = users.get(item["name"])
+        if entry is None:
+            created += item["name"] not in _user_progress
+            user = _apply_user(item)
+            entry = users[item["name"]] = (user, user.status_by_topic)
+        if item["type"] == "answer":
+            try:
+                question = data.get_question_by_id(item["question_id"])
+            except ValueError:
+                # 設問データから削除された設問への回答は読み飛ばす
+                continue
+            deltas.append(_record_answer(entry[0], question, item))
+    for user, before in users.values():
+        _update_status_index(user, before)
+    _add_aggregates(deltas)
+    
+    # 結果は記録にも残し、再起動後や他のワーカーでも同じキーに同じ結果を返す（内容の照合用に指紋も残す）
+    result = record.setdefault("result", {"records": len(record["records"]), "created_users": created,
+                                          "answers": len(deltas), "fingerprint": record.get("fingerprint")})
+    if key is not None:
+        _import_results[key] = result
+    return {**result, "replayed": False}
+
+
+def _apply_import_key(record: Dict) -> Dict:
+    """適用済みの冪等キー（スナップショットやSQLiteから読み戻したもの）を登録"""
+    _import_results[record["key"]] = record["result"]
+    return record["result"]
+
+
+_APPLY = {
+    "user": _apply_user,
+    "answer": _apply_answer,
+    "notification": _apply_notification,
+    "chat": _apply_chat,
+    "escalation": _apply_escalation,
+    "escalation_status": _apply_escalation_status,
+    "batch": _apply_batch,
+    "import_key": _apply_import_key,
+}
+
+
+def _user_lock(name: str) -> threading.RLock:
+    """ユーザー名で選ぶロック（同じユーザーの更新は直列化し、別のユーザーの更新は並行に進める）"""
+    return _user_locks[hash(name) % USER_LOCK_STRIPES]
+
+
+@contextmanager
+def _batch_locks(names):
+    """
+    一括取り込み用のロック（_import_lock と、含まれるユーザーのロックすべて）
+    複数のユーザーのロックを持つのは _import_lock で直列化した一括取り込みだけで、
+    ほかの処理はユーザーのロックを1つ持ったまま別のユーザーのロックを取らないため、番号順に取ればデッドロックしない
+    """
+    locks = [_user_locks[stripe] for stripe in sorted({hash(name) % USER_LOCK_STRIPES for name in names})]
+    with _import_lock:
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+def _lock_for(record: Dict):
+    kind = record["type"]
+    if kind in ("user", "answer", "chat"):
+        return _user_lock(record["name"])
+    if kind == "batch":
+        return _batch_locks(item["name"] for item in record["records"])
+    if kind == "import_key":
+        return _import_lock
+    if kind in ("escalation", "escalation_status"):
+        return _escalation_lock
+    return _notification_lock
+
+
+def _record(record: Dict):
+    """
+    更新をメモリ上の状態に適用し、バックエンドに渡す
+    適用とバックエンドへの追加を同じロックの中で行い、同じユーザーの記録の順番がメモリと永続化先で一致するようにする
+    """
+    with _backend.exclusive(), _lock_for(record):
+        result = _APPLY[record["type"]](record)
+        _backend.append(record)
+    return result
+
+
+def _apply_record(record: Dict):
+    """保存済みの記録や他プロセスの記録を適用する"""
+    try:
+        with _lock_for(record):
+            _APPLY[record["type"]](record)
+    except ValueError:
+        # 設問データから削除された設問への回答など、適用できない記録は読み飛ばす
+        pass
+
+
+def init_storage(backend: Optional[StorageBackend] = None) -> StorageBackend:
+    """
+    永続化バックエンドを設定し、保存済みの記録を読み込んでメモリ上の状態を復元する
+    backendを省略すると環境変数 STORE_BACKEND に応じて作成する
+    """
+    global _backend
+    backend = backend or create_backend()
+    _reset_spill_dir()
+    for record in backend.load():
+        _apply_record(record)
+    backend.start(export=export_records, apply=_apply_record)
+    _backend = backend
+    return backend
+
+
+def export_records() -> Iterator[Dict]:
+    """
+    メモリ上の現在の状態を、再適用すると同じ状態になる最小の記録の列として返す（スナップショット用）
+    回答し直した設問は最後の回答だけになる
+    バックエンドが更新の区間をすべて止めた状態（journalではスナップショットとの読み書きロックの exclusive、
+    sharedではプロセス間の書き込みロックを持ったまま更新の区間を抜けるところ）で呼ばれるため、
+    ユーザーなどのロックは取らない（更新中のユーザーのロックを待つことはない）
+    呼び出した時点ではメモリ上の状態と退避ファイルの位置だけを写し取り、退避したチャット履歴は返したイテレータを
+    進めるときにファイルから読む（更新を止めている時間が、ディスク上の履歴の量に比例しないように）
+    """
+    records: List[Dict] = []
+    for user in list(_user_progress.values()):
+        at = user.updated_at.isoformat() if user.updated_at else _timestamp()
+        records.append({"type": "user", "name": user.name, "at": at})
+        for question_id, selected_index in user.answers.items():
+            records.append({"type": "answer", "name": user.name, "question_id": question_id,
+                            "selected_index": selected_index, "at": at})
+    for log in list(_notification_logs):
+        records.append({"type": "notification", "to_name": log.to_name, "topic": log.topic,
+                        "message": log.message, "at": log.sent_at.isoformat()})
+    chats = [(history.spilled(), [_chat_record(chat_msg) for chat_msg in history.messages])
+             for history in list(_chat_history.values())]
+    tail: List[Dict] = []
+    for key, result in list(_import_results.items()):
+        tail.append({"type": "import_key", "key": key, "result": result, "at": _timestamp()})
+    for esc in list(_escalations):
+        tail.append({"type": "escalation", "id": esc.id, "name": esc.name, "message": esc.message,
+                     "retrieved_articles": esc.retrieved_articles, "confidence": esc.confidence,
+                     "at": esc.created_at.isoformat()})
+        tail.append({"type": "escalation_status", "id": esc.id, "status": esc.status,
+                     "at": esc.updated_at.isoformat()})
+
+    def stream() -> Iterator[Dict]:
+        yield from records
+        for (path, offset, count), in_memory in chats:
+            yield from _iter_spilled(path, offset, count)
+            yield from in_memory
+        yield from tail
+    return stream()
+
+
+def _iter_spilled(path: Optional[Path], offset: int, count: int) -> Iterator[Dict]:
+    """退避ファイルの offset から count 件をチャットの記録として返す（読めなくなった場合はそこまで）"""
+    if path is None:
+        return
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for _ in range(count):
+                yield _chat_record(_chat_message(json.loads(f.readline())))
+    except (OSError, ValueError):
+        return
+
+
+def _reset_spill_dir():
+    """
+    チャット履歴の退避先を空にする（退避分は記録の再適用で作り直す）
+    複数のワーカープロセスが同じ CHAT_SPILL_DIR を使えるよう、プロセスごとのディレクトリに分ける
+    """
+    global _spill_dir
+    if not CHAT_SPILL_DIR:
+        _spill_dir = None
+        return
+    _spill_dir = Path(CHAT_SPILL_DIR) / f"pid-{os.getpid()}"
+    shutil.rmtree(_spill_dir, ignore_errors=True)
+    _spill_dir.mkdir(parents=True, exist_ok=True)
+
+
+def refresh():
+    """
+    他のワーカープロセスの更新をメモリ上の状態に取り込む（STORE_BACKEND=shared の場合）
+    リクエストの処理を始める前に呼ぶ
+    """
+    _backend.catch_up()
+
+
+def needs_refresh() -> bool:
+    """refresh で取り込む他プロセスの更新がありうるか（複数プロセスで共有するバックエンドの場合のみ）"""
+    return _backend.multi_process
+
+
+def close_storage():
+    """未書き込みの記録を書き出してバックエンドを閉じる"""
+    global _backend
+    _backend.close()
+    _backend = MemoryBackend()
+    if _spill_dir is not None:
+        shutil.rmtree(_spill_dir, ignore_errors=True)
+
+
+def get_storage_stats() -> Dict:
+    return _backend.stats()
+
+
+# ==================== 受講者の進捗 ====================
+
 def get_or_create_user(name: str) -> UserProgress:
     """ユーザーを取得または作成"""
-    if name not in _user_progress:
-        _user_progress[name] = UserProgress(name)
-    return _user_progress[name]
+    user = _user_progress.get(name)
+    if user is None:
+        with _backend.exclusive():
+            # 他プロセスが作成済みの場合は、区間の開始時に取り込まれている
+            user = _user_progress.get(name)
+            if user is None:
+                user = _record({"type": "user", "name": name, "at": _timestamp()})
+    return user
 
 
 def get_user(name: str) -> Optional[UserProgress]:
@@ -83,32 +868,65 @@ def get_all_users() -> List[UserProgress]:
     return list(_user_progress.values())
 
 
+def find_users(topic: Optional[str] = None, status: Optional[str] = None, limit: int = 100,
+               after: Optional[str] = None) -> Tuple[List[UserProgress], Optional[str], int]:
+    """
+    テーマ×状態の索引からユーザーを名前順に1ページ取得（全ユーザーを走査しない）
+    topic を省略するといずれかのテーマが status のユーザー、status を省略すると全ユーザー
+    after は前のページの最後の名前。(ユーザー, 次の after, 条件に合う全件数) を返す
+    """
+    names, next_after, total = _status_index.page(topic, status, limit, after)
+    return [_user_progress[name] for name in names], next_after, total
+
+
+def get_status_counts() -> Dict[str, Dict[str, int]]:
+    """テーマ（テーマを問わない場合は "any"）ごとの状態別の人数"""
+    return _status_index.counts()
+
+
 def save_answer(name: str, question_id: str, selected_index: int, question: Question):
-    """回答を保存し、スコアを更新"""
-    user = get_or_create_user(name)
-    user.answers[question_id] = selected_index
-    user.updated_at = datetime.now()
-    
-    # スコア更新
-    topic = question.topic
-    user.score_by_topic[topic]["total"] += 1
-    if selected_index == question.correct_index:
-        user.score_by_topic[topic]["correct"] += 1
-    
-    # ステータス更新
-    topic_questions = [q for q in data.QUESTIONS if q.topic == topic]
-    answered_count = sum(1 for q in topic_questions if q.id in user.answers)
-    if answered_count == len(topic_questions):
-        user.status_by_topic[topic] = "completed"
-    elif answered_count > 0:
-        user.status_by_topic[topic] = "in_progress"
+    """
+    回答を保存し、スコアを更新
+    同じ設問に回答し直した場合は回答数を増やさず、正解数だけを前回の回答との差分で更新する
+    """
+    if not 0 <= selected_index < len(question.choices):
+        raise ValueError(f"Invalid choice index: {selected_index}")
+    get_or_create_user(name)
+    _record({
+        "type": "answer",
+        "name": name,
+        "question_id": question_id,
+        "selected_index": selected_index,
+        "at": _timestamp(),
+    })
+
+
+def import_batch(records: List[Dict], key: Optional[str] = None, fingerprint: Optional[str] = None) -> Dict:
+    """
+    検証済みのユーザー・回答の記録の列を、1件の記録としてまとめて適用・保存する（一括取り込み用）
+    key（冪等キー）を指定すると、同じキーの2回目以降は適用せず最初の結果を replayed=True で返す
+    fingerprint（バッチの内容のハッシュ）が最初に適用したときと異なる場合は ImportConflictError
+    """
+    with _backend.exclusive(), _import_lock:
+        # 他プロセスが適用したキーも、区間の開始時に取り込まれている
+        if key is not None and key in _import_results:
+            result = _import_results[key]
+            if fingerprint is not None and result.get("fingerprint") not in (None, fingerprint):
+                raise ImportConflictError(f"Idempotency key {key} was already used for different records")
+            return {**result, "replayed": True}
+        return _record({"type": "batch", "key": key, "fingerprint": fingerprint, "records": records,
+                        "at": _timestamp()})
 
 
 def add_notification_log(to_name: str, topic: Optional[str] = None, message: Optional[str] = None):
     """通知ログを追加"""
-    log = NotificationLog(to_name, topic, message)
-    _notification_logs.append(log)
-    return log
+    return _record({
+        "type": "notification",
+        "to_name": to_name,
+        "topic": topic,
+        "message": message or DEFAULT_NOTIFICATION_MESSAGE,
+        "at": _timestamp(),
+    })
 
 
 def get_notification_logs() -> List[NotificationLog]:
@@ -116,47 +934,55 @@ def get_notification_logs() -> List[NotificationLog]:
     return _notification_logs.copy()
 
 
+def _keyset_page(keys: Sequence[int], limit: int, before: Optional[int]) -> Tuple[List[int], Optional[int]]:
+    """
+    昇順のキーから before より小さいものを大きい順に limit 件取り出す
+    さらに古いページがあれば、次の before（今回の最後のキー）も返す
+    """
+    end = len(keys) if before is None else bisect_left(keys, before)
+    start = max(0, end - limit)
+    page = list(keys[start:end])
+    page.reverse()
+    return page, (page[-1] if start > 0 and page else None)
+
+
+def get_notification_page(limit: int, before: Optional[int] = None,
+                          to_name: Optional[str] = None) -> Tuple[List[NotificationLog], Optional[int]]:
+    """
+    通知ログを新しい順に1ページ取得（送信順に追記しているため並べ替えない）
+    before は前のページの最後の通し番号、to_name で送信先を絞り込む
+    """
+    with _notification_lock:
+        if to_name:
+            keys = _notifications_by_recipient.get(to_name, [])
+        else:
+            keys = range(1, len(_notification_logs) + 1)
+        ids, next_before = _keyset_page(keys, limit, before)
+        return [_notification_logs[log_id - 1] for log_id in ids], next_before
+
+
 def get_topic_statistics() -> Dict[str, Dict[str, float]]:
-    """テーマ別の統計情報を取得"""
+    """テーマ別の統計情報を取得（save_answerで更新済みの集計のスナップショットを参照）"""
     stats = {}
-    for topic in ["governance", "harassment", "infosec"]:
-        total_correct = 0
-        total_questions = 0
-        user_count = 0
-        
-        for user in _user_progress.values():
-            if user.score_by_topic[topic]["total"] > 0:
-                total_correct += user.score_by_topic[topic]["correct"]
-                total_questions += user.score_by_topic[topic]["total"]
-                user_count += 1
-        
-        avg_score = (total_correct / total_questions * 100) if total_questions > 0 else 0.0
+    snapshot = _aggregates
+    for topic in TOPICS:
+        correct, total, users = snapshot.totals[topic]
+        avg_score = (correct / total * 100) if total > 0 else 0.0
         stats[topic] = {
             "average": avg_score,
-            "user_count": user_count
+            "user_count": users
         }
     
     return stats
 
 
 def get_top_incorrect_questions(limit: int = 3) -> List[Dict]:
-    """誤答が多い設問TOP3を取得"""
-    incorrect_count: Dict[str, int] = {}
-    
-    for user in _user_progress.values():
-        for question_id, selected_index in user.answers.items():
-            question = data.get_question_by_id(question_id)
-            if selected_index != question.correct_index:
-                incorrect_count[question_id] = incorrect_count.get(question_id, 0) + 1
-    
-    # 誤答数でソート
-    sorted_questions = sorted(incorrect_count.items(), key=lambda x: x[1], reverse=True)
-    
+    """誤答が多い設問TOP3を取得（誤答数順に保持しているリストの先頭から取得）"""
     result = []
-    for question_id, count in sorted_questions[:limit]:
-        question = data.get_question_by_id(question_id)
+    for ordinal, count in _aggregates.ranking[:limit]:
+        question = data.get_question_by_ordinal(ordinal)
         result.append({
-            "question_id": question_id,
+            "question_id": question.id,
             "title": question.title,
             "topic": question.topic,
             "incorrect_count": count
@@ -171,30 +997,59 @@ def add_chat_message(name: str, message: str, is_user: bool = True,
                      answer: Optional[str] = None, references: Optional[List] = None,
                      confidence: Optional[str] = None) -> ChatMessage:
     """チャットメッセージを追加"""
-    if name not in _chat_history:
-        _chat_history[name] = []
-    
-    chat_msg = ChatMessage(name, message, is_user)
-    chat_msg.answer = answer
-    chat_msg.references = references or []
-    chat_msg.confidence = confidence
-    
-    _chat_history[name].append(chat_msg)
-    return chat_msg
+    return _record({
+        "type": "chat",
+        "name": name,
+        "message": message,
+        "is_user": is_user,
+        "answer": answer,
+        "references": references or [],
+        "confidence": confidence,
+        "at": _timestamp(),
+    })
+
 
+def get_chat_history(name: str, limit: Optional[int] = None, before: Optional[int] = None) -> List[ChatMessage]:
+    """
+    チャット履歴を古い順に取得（追加中の更新の影響を受けないコピー）
+    before を指定するとその通し番号より前のメッセージだけを、limit を指定すると新しい方から limit 件を返す
+    """
+    history = _chat_history.get(name)
+    if history is None:
+        return []
+    with _user_lock(name):
+        return history.page(limit, before)
 
-def get_chat_history(name: str) -> List[ChatMessage]:
-    """チャット履歴を取得"""
-    return _chat_history.get(name, [])
+
+def get_chat_page(name: str, limit: int, before: Optional[int] = None) -> Tuple[List[ChatMessage], Optional[int]]:
+    """
+    チャット履歴の1ページ（新しい方から limit 件）と、さらに古いページを取得するときの before を返す
+    古いメッセージが残っていなければ before は None
+    """
+    history = _chat_history.get(name)
+    if history is None:
+        return [], None
+    with _user_lock(name):
+        messages = history.page(limit, before)
+        has_older = bool(messages) and messages[0].seq > history.first_seq()
+    return messages, messages[0].seq if has_older else None
 
 
 # ==================== エスカレーション ====================
 
 def add_escalation(name: str, message: str, retrieved_articles: List[dict], confidence: str) -> Escalation:
     """エスカレーションを追加"""
-    escalation = Escalation(name, message, retrieved_articles, confidence)
-    _escalations.append(escalation)
-    return escalation
+    with _backend.exclusive(), _escalation_lock:
+        # IDは他プロセスの登録を取り込んだ後に採番する（一覧がID順に並ぶよう、登録と同じロックの中で採番）
+        return _record({
+            "type": "escalation",
+            "id": _escalation_ids.allocate(),
+            "name": name,
+            "message": message,
+            "retrieved_articles": retrieved_articles,
+            "confidence": confidence,
+            "at": _timestamp(),
+        })
 
 
 def get_escalations() -> List[Escalation]:
@@ -202,13 +1057,99 @@ def get_escalations() -> List[Escalation]:
     return _escalations.copy()
 
 
+def get_escalation(escalation_id: int) -> Optional[Escalation]:
+    return _escalations_by_id.get(escalation_id)
+
+
+def get_escalation_counts() -> Dict[str, int]:
+    """ステータスごとの件数"""
+    with _escalation_lock:
+        return {status: len(ids) for status, ids in _escalations_by_status.items()}
+
+
+def get_escalation_page(limit: int, before: Optional[int] = None, status: Optional[str] = None,
+                        name: Optional[str] = None) -> Tuple[List[Escalation], Optional[int]]:
+    """
+    エスカレーションを新しい順（ID の降順）に1ページ取得
+    before は前のページの最後のID、status / name でステータス・相談者を絞り込む
+    """
+    with _escalation_lock:
+        if name:
+            ids = _escalations_by_name.get(name, [])
+            if status:
+                # 相談者ごとの件数は少ないため、ステータスはその中で絞り込む
+                ids = [escalation_id for escalation_id in ids if _escalations_by_id[escalation_id].status == status]
+        elif status:
+            ids = _escalations_by_status[status]
+        else:
+            ids = _escalation_order
+        page, next_before = _keyset_page(ids, limit, before)
+        return [_escalations_by_id[escalation_id] for escalation_id in page], next_before
+
+
 def update_escalation_status(escalation_id: int, status: str) -> Optional[Escalation]:
     """エスカレーションのステータスを更新"""
-    for esc in _escalations:
-        if esc.id == escalation_id:
-            if status in ["open", "in_progress", "closed"]:
-                esc.status = status
-                esc.updated_at = datetime.now()
-                return esc
-    return None
+    if status not in ESCALATION_STATUSES:
+        return None
+    with _backend.exclusive(), _escalation_lock:
+        if escalation_id not in _escalations_by_id:
+            return None
+        return _record({"type": "escalation_status", "id": escalation_id, "status": status, "at": _timestamp()})
+
+
+# ==================== エクスポート ====================
+# 全件を一度に集めず、一定件数ずつ短くロックを取って順に返す（エクスポート中も回答の保存を止めない）
+
+EXPORT_BATCH = 500
+
+
+def iter_users(batch: int = EXPORT_BATCH) -> Iterator[UserProgress]:
+    """全ユーザーを名前順に返す（テーマ×状態の索引を名前をカーソルにして少しずつ読む）"""
+    after = None
+    while True:
+        users, after, _ = find_users(limit=batch, after=after)
+        yield from users
+        if after is None:
+            return
+
+
+def get_answers(name: str) -> List[Tuple[Question, int]]:
+    """ユーザーの回答（設問, 選択肢番号）を設問の通し番号順に取得"""
+    user = _user_progress.get(name)
+    if user is None:
+        return []
+    with _user_lock(name):
+        answers = list(user.answers.items())
+    return [(data.get_question_by_id(question_id), selected_index) for question_id, selected_index in answers]
+
+
+def iter_chat_messages(batch: int = EXPORT_BATCH) -> Iterator[ChatMessage]:
+    """全ユーザーのチャット履歴を、ユーザーごとに古い順に返す（読み出せる範囲のみ）"""
+    position = 0
+    while position < len(_chat_names):
+        name = _chat_names[position]
+        position += 1
+        history = _chat_history[name]
+        seq = 0
+        while True:
+            with _user_lock(name):
+                # 読んでいる間に退避されずに捨てられた分は飛ばす
+                seq = max(seq, history.first_seq())
+                end = min(seq + batch, history.total + 1)
+                messages = history.page(limit=end - seq, before=end) if end > seq else []
+            if not messages:
+                break
+            yield from messages
+            seq = messages[-1].seq + 1
+
 
+def iter_escalations(batch: int = EXPORT_BATCH) -> Iterator[Escalation]:
+    """エスカレーションをID順に返す"""
+    position = 0
+    while True:
+        with _escalation_lock:
+            chunk = _escalations[position:position + batch]
+        if not chunk:
+            return
+        position += len(chunk)
+        yield from chunk
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+エクスポートのメモリ使用量・所要時間のベンチマーク
+
+指定人数のユーザーに回答させた状態を作り、データセットごとにエクスポートを最後まで読み進めて
+出力サイズ・所要時間・tracemallocで見た確保量のピークを表示する
+エクスポート中も別スレッドから回答を保存し続け、保存が止まらないことも確認する
+
+    python bench_export.py [--users 100000] [--answers 5] [--gzip]
+"""
+import argparse
+import random
+import threading
+import time
+import tracemalloc
+
+from app import data, export, store
+
+
+def populate(args, questions):
+    rng = random.Random(0)
+    for i in range(args.users):
+        name = f"export-{i:06d}"
+        for question in rng.sample(questions, args.answers):
+            store.save_answer(name, question.id, rng.randrange(len(question.choices)), question)
+        if i % 10 == 0:
+            store.add_chat_message(name, f"question {i}", is_user=True)
+        if i % 100 == 0:
+            store.add_escalation(name, f"escalation {i}", [], "low")
+
+
+def writer(stop, questions, saved):
+    """エクスポートと並行して回答を保存し続ける"""
+    rng = random.Random(1)
+    while not stop.is_set():
+        question = rng.choice(questions)
+        store.save_answer(f"writer-{rng.randrange(100):03d}", question.id, 0, question)
+        saved[0] += 1
+
+
+def bench(dataset, fmt, compress, questions):
+    stop = threading.Event()
+    saved = [0]
+    thread = threading.Thread(target=writer, args=(stop, questions, saved))
+    tracemalloc.start()
+    thread.start()
+    started = time.perf_counter()
+    size = 0
+    for chunk in export.export(dataset, fmt, compress):
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    thread.join()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak, saved[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000, help="ユーザー数")
+    parser.add_argument("--answers", type=int, default=5, help="1人あたりの回答数")
+    parser.add_argument("--gzip", action="store_true", help="gzip圧縮して出力する")
+    args = parser.parse_args()
+
+    questions = list(data.REPOSITORY.questions)
+    started = time.perf_counter()
+    populate(args, questions)
+    print(f"users: {args.users}  answers/user: {args.answers}  populate: {time.perf_counter() - started:.1f}s")
+    print(f"{'dataset':>12} {'format':>7} {'output':>10} {'elapsed':>8} {'peak':>9} {'writes':>7}")
+    for dataset in export.DATASETS:
+        for fmt in export.EXPORT_FORMATS:
+            size, elapsed, peak, saved = bench(dataset, fmt, args.gzip, questions)
+            print(f"{dataset:>12} {fmt:>7} {size / 1e6:>8.1f}MB {elapsed:>7.2f}s {peak / 1e6:>7.2f}MB {saved:>7}")
+
+
+if __name__ == "__main__":
+    main()
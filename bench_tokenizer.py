@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+規程QA検索のベンチマーク（従来トークナイザ vs 日本語文字n-gram）
+
+研修設問・README例質問をクエリとし、正解カテゴリの規程が上位3件に入る割合（recall@3）と
+1クエリあたりの検索時間を比較する
+
+    python bench_tokenizer.py [--repeat N]
+"""
+import argparse
+import statistics
+import time
+
+from app import data, rag
+
+EXAMPLE_QUERIES = [
+    ("個人メールに資料を送っていい？", "infosec"),
+    ("飲み会で結婚の話をしつこく聞くのは？", "harassment"),
+    ("取引先から会食提案、どう対応？", "governance"),
+    ("接待の承認", "governance"),
+]
+
+
+def labeled_queries():
+    """（クエリ, 正解カテゴリ）の一覧"""
+    queries = list(EXAMPLE_QUERIES)
+    for q in data.QUESTIONS:
+        queries.append((q.title, q.topic))
+        queries.append((q.choices[q.correct_index], q.topic))
+    return queries
+
+
+def legacy_search(query, top_k=3):
+    """インデックス導入前の検索（毎回policies.jsonを読み込み全件をスコアリング）"""
+    scored = []
+    for policy in rag.load_policies():
+        score = rag.calculate_score(query, policy)
+        if score > 0:
+            scored.append((score, policy))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [{"category": policy["category"]} for _, policy in scored[:top_k]]
+
+
+def run(name, search, queries, repeat):
+    hits = 0
+    for query, category in queries:
+        if any(r["category"] == category for r in search(query)):
+            hits += 1
+
+    timings = []
+    for _ in range(repeat):
+        for query, _ in queries:
+            start = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<22} {hits / len(queries):>9.1%} {statistics.mean(timings):>11.1f} {p95:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="レイテンシ計測の繰り返し回数")
+    args = parser.parse_args()
+
+    queries = labeled_queries()
+    rag.get_policy_index()
+
+    print(f"queries: {len(queries)}  policies: {len(rag.get_policy_index())}")
+    print(f"{'search':<22} {'recall@3':>9} {'mean (us)':>11} {'p95 (us)':>11}")
+    run("legacy (full scan)", legacy_search, queries, args.repeat)
+    run("keyword (index)", lambda q: rag.search_policies(q, ranker="keyword"), queries, args.repeat)
+    run("bm25f (word)", lambda q: rag.search_policies(q, ranker="bm25f"), queries, args.repeat)
+    run("ngram (bm25f)", lambda q: rag.search_policies(q, ranker="ngram"), queries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
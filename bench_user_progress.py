@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+UserProgressのメモリ使用量のベンチマーク（従来の辞書ベース vs コンパクト表現）
+
+ユーザーごとに設問の一部へ回答した状態を作り、tracemallocで確保量を比較する
+
+    python bench_user_progress.py [--users 10000 100000] [--questions 77] [--answered 0.5]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from app import store
+
+
+class LegacyUserProgress:
+    """コンパクト化する前のUserProgress（3つの辞書で保持）"""
+    def __init__(self, name):
+        self.name = name
+        self.status_by_topic = {
+            "governance": "not_started",
+            "harassment": "not_started",
+            "infosec": "not_started"
+        }
+        self.answers = {}
+        self.score_by_topic = {
+            "governance": {"correct": 0, "total": 0},
+            "harassment": {"correct": 0, "total": 0},
+            "infosec": {"correct": 0, "total": 0}
+        }
+        self.updated_at = None
+
+
+def build_legacy(names, question_ids, answered):
+    users = {}
+    for name, ordinals in zip(names, answered):
+        user = LegacyUserProgress(name)
+        for ordinal in ordinals:
+            user.answers[question_ids[ordinal]] = ordinal % 4
+            topic = store.TOPICS[ordinal % len(store.TOPICS)]
+            user.score_by_topic[topic]["total"] += 1
+            user.status_by_topic[topic] = "in_progress"
+        users[name] = user
+    return users
+
+
+def build_compact(names, question_count, answered):
+    users = {}
+    for name, ordinals in zip(names, answered):
+        user = store.UserProgress(name, question_count=question_count)
+        for ordinal in ordinals:
+            user._answers[ordinal] = ordinal % 4
+            base = (ordinal % len(store.TOPICS)) * store._TOPIC_FIELDS
+            user._topics[base + store._ANSWERED] += 1
+            user._topics[base + store._STATUS] = store.STATUSES.index("in_progress")
+        users[name] = user
+    return users
+
+
+def measure(build, *args):
+    """build(*args)で確保されたメモリ量（バイト）"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = build(*args)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del users
+    gc.collect()
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000], help="ユーザー数")
+    parser.add_argument("--questions", type=int, default=77, help="設問数（既定は設問バンク全体）")
+    parser.add_argument("--answered", type=float, default=0.5, help="1ユーザーあたりの回答済みの割合")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    question_ids = [f"q-{i:03d}" for i in range(args.questions)]
+    per_user = int(args.questions * args.answered)
+
+    print(f"questions: {args.questions}  answered per user: {per_user}")
+    print(f"{'users':>8} {'legacy (MB)':>12} {'compact (MB)':>13} {'legacy B/user':>14} {'compact B/user':>15} {'ratio':>6}")
+    for count in args.users:
+        names = [f"user{i:06d}" for i in range(count)]
+        answered = [rng.sample(range(args.questions), per_user) for _ in range(count)]
+        # ユーザー名などの共有データは両方の計測から除くため事前に作成済み
+        legacy = measure(build_legacy, names, question_ids, answered)
+        compact = measure(build_compact, names, args.questions, answered)
+        print(f"{count:>8} {legacy / 1e6:>12.1f} {compact / 1e6:>13.1f} "
+              f"{legacy / count:>14.0f} {compact / count:>15.0f} {legacy / compact:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+ワーカープロセス数ごとのスループットの負荷試験（STORE_BACKEND=shared）
+
+ワーカー数ごとに一時ファイルの共有ストアで uvicorn --workers N を起動し、
+回答の送信と進捗ページの表示を並行して送ってスループットを計測する
+最後に全ワーカーが同じ記録まで取り込んでいること（状態が一致していること）を確認する
+（--snapshot-every を指定するとスナップショットで記録表を切り詰めるため、回答件数の照合は行わない）
+
+    python bench_workers.py [--workers 1 2 4] [--requests 2000] [--concurrency 16] [--snapshot-every 0]
+"""
+import argparse
+import http.client
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+from app import data
+
+
+HOST = "127.0.0.1"
+
+
+class Client(threading.local):
+    """スレッドごとにkeep-aliveの接続を使い回す"""
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection(HOST, port, timeout=30)
+
+    def request(self, method, path, body=None):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (OSError, http.client.HTTPException):
+            # ワーカー側で接続が切られた場合は張り直して1回だけ再送する
+            self.connection.close()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        payload = response.read()
+        return response.status, payload
+
+
+def wait_until_ready(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(HOST, port, timeout=1)
+            connection.request("GET", "/admin/storage")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def run_load(port, requests, concurrency, questions):
+    """回答の送信（POST）と進捗ページ（GET）を半数ずつ送り、(秒, 失敗数, 送信した回答数) を返す"""
+    client = Client(port)
+
+    def task(i):
+        name = f"worker-bench-{i % 200:03d}"
+        if i % 2 == 0:
+            question = questions[i % len(questions)]
+            body = urlencode({"name": name, "question_id": question.id, "selected_index": i % 4})
+            # 回答の送信は結果表示付きの設問ページへのリダイレクト（303）を返す
+            status, _ = client.request("POST", f"/quiz/{question.topic}", body)
+            return status == 303
+        status, _ = client.request("GET", f"/result/governance?name={name}")
+        return status == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(task, range(requests)))
+    elapsed = time.perf_counter() - started
+    return elapsed, results.count(False), (requests + 1) // 2
+
+
+def check_consistency(port, path, workers):
+    """
+    /admin/storage を繰り返し呼び、応答したすべてのワーカーが記録表の最新まで取り込んでいるか確認する
+    （各リクエストの開始時に取り込むため、どのワーカーに振り分けられても最新の連番が返るはず）
+    """
+    with sqlite3.connect(path) as conn:
+        # 切り詰めで消えた記録も含めた最新の連番
+        latest = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()[0]
+        answers = conn.execute("SELECT COUNT(*) FROM events WHERE type = 'answer'").fetchone()[0]
+    seen = {}
+    for _ in range(max(20, workers * 20)):
+        connection = http.client.HTTPConnection(HOST, port, timeout=5)
+        connection.request("GET", "/admin/storage")
+        stats = json.loads(connection.getresponse().read())
+        connection.close()
+        seen[stats["pid"]] = stats["applied_seq"]
+    consistent = all(seq == latest for seq in seen.values())
+    return consistent, len(seen), latest, answers
+
+
+def bench(workers, args, questions):
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "store.sqlite3"
+        env = dict(os.environ, STORE_BACKEND="shared", STORE_SHARED_PATH=str(path),
+                   STORE_SNAPSHOT_EVERY=str(args.snapshot_every))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", HOST, "--port", str(args.port),
+             "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+            env=env,
+        )
+        try:
+            wait_until_ready(args.port)
+            # 全ワーカーの起動を待つ（最初に応答したワーカーだけが計測の前半を受けないように）
+            time.sleep(1.0 + 0.5 * workers)
+            elapsed, failures, posted = run_load(args.port, args.requests, args.concurrency, questions)
+            consistent, responders, latest, answers = check_consistency(args.port, path, workers)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return {
+        "workers": workers,
+        "rps": args.requests / elapsed,
+        "failures": failures,
+        "answers_ok": answers == posted if args.snapshot_every <= 0 else None,
+        "consistent": consistent,
+        "responders": responders,
+        "latest": latest,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="ワーカープロセス数")
+    parser.add_argument("--requests", type=int, default=2000, help="ワーカー数ごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時接続数")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--snapshot-every", type=int, default=0, help="スナップショットを取る間隔（記録件数。0で取らない）")
+    args = parser.parse_args()
+
+    questions = list(data.REPOSITORY.questions)
+    print(f"cpus: {os.cpu_count()}  requests: {args.requests}  concurrency: {args.concurrency}")
+    print(f"{'workers':>7} {'req/s':>8} {'scale':>6} {'failures':>8} {'answers':>8} {'consistent':>10} {'pids':>5}")
+    baseline = None
+    for workers in args.workers:
+        result = bench(workers, args, questions)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>8.0f} {result['rps'] / baseline:>5.2f}x {result['failures']:>8} "
+              f"{'-' if result['answers_ok'] is None else 'ok' if result['answers_ok'] else 'NG':>8} {'ok' if result['consistent'] else 'NG':>10} "
+              f"{result['responders']:>5}")
+
+
+if __name__ == "__main__":
+    main()
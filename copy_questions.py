@@ -1,14 +1,95 @@
 #!/usr/bin/env python3
-"""questions.jsonをapp/static/にコピーするスクリプト"""
+"""
+静的ファイルのビルドスクリプト
+questions.jsonをapp/static/にコピーし、app/static/の配信ファイルから
+ハッシュ付きファイル・事前圧縮版（gzip、brotliがインストールされていればbrも）・マニフェストを
+app/static/dist/に生成する
+
+    python copy_questions.py
+"""
+import gzip
+import hashlib
+import json
 import shutil
 import os
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from app.assets import DIST_DIR, MANIFEST_PATH, STATIC_DIR
+
 src = 'questions.json'
 dst = 'app/static/questions.json'
 
-if os.path.exists(src):
-    shutil.copy(src, dst)
-    print(f'Copied {src} to {dst}')
-else:
-    print(f'Error: {src} not found')
+# ハッシュ付きで配信するファイルの拡張子
+ASSET_SUFFIXES = ('.css', '.js', '.json')
+# 圧縮しても小さくならない小さなファイルは圧縮版を作らない
+MIN_COMPRESS_SIZE = 256
+
+
+def write_if_changed(path, data):
+    if path.exists() and path.read_bytes() == data:
+        return
+    path.write_bytes(data)
+
+
+def build_assets():
+    """app/static/の配信ファイルをハッシュ付きの名前でdist/に書き出し、マニフェストを返す"""
+    DIST_DIR.mkdir(exist_ok=True)
+    manifest = {}
+    outputs = {MANIFEST_PATH.name}
+
+    for source in sorted(STATIC_DIR.iterdir()):
+        if not source.is_file() or source.suffix not in ASSET_SUFFIXES:
+            continue
+        data = source.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        hashed_name = f'{source.stem}.{digest[:12]}{source.suffix}'
+        write_if_changed(DIST_DIR / hashed_name, data)
+        outputs.add(hashed_name)
+
+        encodings = {}
+        if len(data) >= MIN_COMPRESS_SIZE:
+            variants = [('gzip', '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('br', '.br', brotli.compress(data, quality=11)))
+            for encoding, suffix, compressed in variants:
+                if len(compressed) >= len(data):
+                    continue
+                write_if_changed(DIST_DIR / (hashed_name + suffix), compressed)
+                outputs.add(hashed_name + suffix)
+                encodings[encoding] = len(compressed)
+
+        manifest[source.name] = {
+            'file': f'{DIST_DIR.name}/{hashed_name}',
+            'sha256': digest,
+            'size': len(data),
+            'encodings': encodings,
+        }
+        sizes = ', '.join(f'{encoding} {size}' for encoding, size in encodings.items())
+        print(f'{source.name} -> {DIST_DIR.name}/{hashed_name} ({len(data)} bytes{"; " + sizes if sizes else ""})')
+
+    # 以前のビルドで生成し、今回参照されなくなったファイルを削除
+    for path in DIST_DIR.iterdir():
+        if path.is_file() and path.name not in outputs:
+            path.unlink()
+
+    write_if_changed(
+        MANIFEST_PATH,
+        json.dumps({'assets': manifest}, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8')
+    )
+    print(f'Wrote {MANIFEST_PATH.relative_to(STATIC_DIR.parent.parent)} ({len(manifest)} assets)')
+    if brotli is None:
+        print('brotli is not installed; only gzip variants were written')
+
+
+if __name__ == '__main__':
+    if os.path.exists(src):
+        shutil.copy(src, dst)
+        print(f'Copied {src} to {dst}')
+    else:
+        print(f'Error: {src} not found')
 
+    build_assets()
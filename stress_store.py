@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+ストアの並行更新のストレステスト
+
+複数スレッドから save_answer / import_batch / add_chat_message / add_escalation / update_escalation_status を同時に呼び、
+その間も別スレッドで管理画面用の集計を読み続けたうえで、次の不変条件を確認する
+- エスカレーションIDが重複せず 1..N の連番になっている
+- テーマ別の集計・誤答ランキングが、全ユーザーの回答から計算し直した値と一致する
+- ユーザーごとの回答数・チャット件数が、各スレッドが送った件数と一致する
+- 読み取り側が見た集計のスナップショットは回答数が減らない（途中状態が見えない）
+- テーマ×状態の索引が、全ユーザーの状態から抽出し直した結果と一致する
+
+--journal を指定すると、ジャーナル（--snapshot-every 件ごとにスナップショット）に永続化しながら更新し、
+閉じた後に別プロセスでジャーナルから復元した状態が、更新を終えた時点の状態と一致することも確認する
+
+    python stress_store.py [--threads 16] [--operations 5000] [--users 50] [--journal [--snapshot-every 200]]
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from app import data, store
+from app.storage import JournalBackend
+
+
+def worker(seed, args, questions, sent, errors):
+    rng = random.Random(seed)
+    try:
+        for i in range(args.operations):
+            name = f"stress-{rng.randrange(args.users):03d}"
+            action = rng.random()
+            if action < 0.7:
+                question = rng.choice(questions)
+                store.save_answer(name, question.id, rng.randrange(len(question.choices)), question)
+            elif action < 0.72:
+                # 一括取り込み（複数ユーザーの回答をまとめて適用。一部は同じ冪等キーで再送する）
+                records = []
+                for _ in range(rng.randrange(1, 20)):
+                    question = rng.choice(questions)
+                    records.append({"type": "answer", "name": f"stress-{rng.randrange(args.users):03d}",
+                                    "question_id": question.id,
+                                    "selected_index": rng.randrange(len(question.choices)),
+                                    "at": store._timestamp()})
+                key = f"stress-{seed}-{i // 2}"
+                store.import_batch(records, key=key)
+            elif action < 0.85:
+                store.add_chat_message(name, f"message {seed}-{i}", is_user=True)
+                sent["chat"][name] += 1
+            elif action < 0.95:
+                store.add_escalation(name, f"escalation {seed}-{i}", [], "low")
+                sent["escalation"] += 1
+            else:
+                escalations = store.get_escalations()
+                if escalations:
+                    store.update_escalation_status(rng.choice(escalations).id, rng.choice(["in_progress", "closed"]))
+    except Exception as e:  # スレッド内の例外は集めて最後に報告する
+        errors.append(f"worker {seed}: {type(e).__name__}: {e}")
+
+
+def reader(stop, observations, errors):
+    """集計を読み続け、回答数が後戻りしないことを確認する"""
+    last_total = 0
+    try:
+        while not stop.is_set():
+            snapshot = store._aggregates
+            total = sum(totals[1] for totals in snapshot.totals.values())
+            if total < last_total:
+                errors.append(f"reader: total went backwards ({last_total} -> {total})")
+            last_total = total
+            store.get_topic_statistics()
+            store.get_top_incorrect_questions(limit=3)
+            store.get_all_users()
+            store.find_users(status="not_started", limit=20)
+            observations[0] += 1
+    except Exception as e:
+        errors.append(f"reader: {type(e).__name__}: {e}")
+
+
+def check_invariants(sent):
+    """更新後の状態を全件から計算し直した値と比べ、問題の一覧を返す"""
+    problems = []
+
+    ids = [esc.id for esc in store.get_escalations()]
+    if sorted(ids) != list(range(1, len(ids) + 1)):
+        problems.append(f"escalation ids are not 1..N: {len(ids)} ids, {len(set(ids))} unique")
+    if len(ids) != sent["escalation"]:
+        problems.append(f"escalations: {len(ids)} stored, {sent['escalation']} sent")
+
+    totals = {topic: [0, 0, 0] for topic in store.TOPICS}
+    incorrect = Counter()
+    for user in store.get_all_users():
+        for topic in store.TOPICS:
+            if user.answered_count(topic):
+                totals[topic][2] += 1
+        for question_id, selected_index in user.answers.items():
+            question = data.get_question_by_id(question_id)
+            totals[question.topic][1] += 1
+            if selected_index == question.correct_index:
+                totals[question.topic][0] += 1
+            else:
+                incorrect[data.get_question_ordinal(question_id)] += 1
+        for topic in store.TOPICS:
+            answered = sum(1 for q in data.get_questions_by_topic(topic) if q.id in user.answers)
+            if answered != user.answered_count(topic):
+                problems.append(f"{user.name}/{topic}: answered_count {user.answered_count(topic)} != {answered}")
+
+    snapshot = store._aggregates
+    for topic in store.TOPICS:
+        if tuple(totals[topic]) != snapshot.totals[topic]:
+            problems.append(f"{topic}: aggregates {snapshot.totals[topic]} != recomputed {tuple(totals[topic])}")
+    expected_ranking = sorted(((ordinal, count) for ordinal, count in incorrect.items()),
+                              key=lambda item: (-item[1], item[0]))
+    if list(snapshot.ranking) != expected_ranking:
+        problems.append("incorrect ranking differs from recomputed counts")
+
+    users = store.get_all_users()
+    for topic in (None, *store.TOPICS):
+        for status in store.STATUSES:
+            indexed = [user.name for user in store.find_users(topic, status, limit=len(users) + 1)[0]]
+            expected = sorted(
+                user.name for user in users
+                if (user.status(topic) == status if topic else status in user.status_by_topic.values())
+            )
+            if indexed != expected:
+                problems.append(f"status index {topic or 'any'}/{status}: {len(indexed)} indexed, {len(expected)} expected")
+
+    for name, count in sent["chat"].items():
+        # 通し番号は保持件数（CHAT_HISTORY_LIMIT）を超えて捨てた分も数える
+        stored = store._chat_history[name].total
+        if stored != count:
+            problems.append(f"{name}: {stored} chat messages stored, {count} sent")
+        retained = len(store.get_chat_history(name))
+        expected = count if store._spill_dir else min(count, store.CHAT_HISTORY_LIMIT)
+        if retained != expected:
+            problems.append(f"{name}: {retained} chat messages readable, {expected} expected")
+    return problems
+
+
+def summarize() -> dict:
+    """復元結果と比べるための状態の要約（ユーザーごとの回答・チャット件数、エスカレーション、通知ログなど）"""
+    return {
+        "answers": {user.name: dict(user.answers) for user in store.get_all_users()},
+        "chat": {user.name: len(store.get_chat_history(user.name)) for user in store.get_all_users()},
+        "escalations": [[esc.id, esc.status] for esc in store.get_escalations()],
+        "notifications": len(store.get_notification_logs()),
+        "import_keys": sorted(store._import_results),
+        "aggregates": {topic: list(totals) for topic, totals in store._aggregates.totals.items()},
+    }
+
+
+def replay(directory: str):
+    """ジャーナルから状態を復元して要約をJSONで出力する（--journal の確認用に別プロセスで実行する）"""
+    backend = JournalBackend(Path(directory))
+    store.init_storage(backend)
+    summary = summarize()
+    summary["recovery"] = backend.recovery
+    store.close_storage()
+    print(json.dumps(summary))
+
+
+def check_replay(directory: str, written: dict) -> list:
+    """別プロセスで復元した状態を、書き込んだ時点の状態と比べて問題の一覧を返す"""
+    completed = subprocess.run([sys.executable, __file__, "--replay", directory],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        return [f"replay failed: {completed.stderr.strip().splitlines()[-1:]}"]
+    replayed = json.loads(completed.stdout)
+    recovery = replayed.pop("recovery")
+    print(f"replay: snapshot {recovery['snapshot']}  snapshot records: {recovery['snapshot_records']}  "
+          f"tail records: {recovery['tail_records']}")
+    problems = []
+    for field, expected in written.items():
+        if replayed[field] == expected:
+            continue
+        if isinstance(expected, dict):
+            differing = [key for key in expected.keys() | replayed[field].keys()
+                         if expected.get(key) != replayed[field].get(key)]
+            problems.append(f"replay {field}: {len(differing)} entries differ (e.g. {sorted(differing)[:3]})")
+        else:
+            problems.append(f"replay {field}: {len(replayed[field])} replayed, {len(expected)} written"
+                            if isinstance(expected, list) else f"replay {field}: {replayed[field]} != {expected}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16, help="更新するスレッド数")
+    parser.add_argument("--operations", type=int, default=5000, help="1スレッドあたりの更新回数")
+    parser.add_argument("--users", type=int, default=50, help="ユーザー数（少ないほど同じユーザーへの更新が競合する）")
+    parser.add_argument("--journal", action="store_true", help="ジャーナルに永続化し、復元した状態も確認する")
+    parser.add_argument("--snapshot-every", type=int, default=200,
+                        help="--journal の場合にスナップショットを取る間隔（記録件数）")
+    parser.add_argument("--replay", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.replay:
+        replay(args.replay)
+        return
+
+    # スレッドの切り替えを頻繁にして競合を起こしやすくする
+    sys.setswitchinterval(1e-6)
+    journal_dir = tempfile.mkdtemp(prefix="stress-journal-") if args.journal else None
+    backend = JournalBackend(Path(journal_dir), snapshot_every=args.snapshot_every) if journal_dir else None
+    store.init_storage(backend)
+    questions = list(data.REPOSITORY.questions)
+    errors = []
+
+    # 送信件数はスレッドごとに数えて最後に合算する
+    per_thread = [{"chat": Counter(), "escalation": 0} for _ in range(args.threads)]
+    stop = threading.Event()
+    observations = [0]
+    readers = [threading.Thread(target=reader, args=(stop, observations, errors)) for _ in range(2)]
+    workers = [
+        threading.Thread(target=worker, args=(seed, args, questions, per_thread[seed], errors))
+        for seed in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in readers + workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    sent = {"chat": Counter(), "escalation": 0}
+    for counts in per_thread:
+        sent["chat"].update(counts["chat"])
+        sent["escalation"] += counts["escalation"]
+
+    operations = args.threads * args.operations
+    print(f"threads: {args.threads}  operations: {operations}  users: {args.users}  "
+          f"elapsed: {elapsed:.2f}s ({operations / elapsed:.0f} ops/s)  reads: {observations[0]}")
+    # 退避したチャット履歴は close_storage で消えるため、閉じる前に確認する
+    problems = errors + check_invariants(sent)
+    written = summarize() if journal_dir else None
+    store.close_storage()
+    if journal_dir:
+        print(f"journal: {journal_dir}  snapshots: {backend.snapshots}  written: {backend.written}")
+        problems += check_replay(journal_dir, written)
+    for problem in problems[:20]:
+        print("NG:", problem)
+    if problems:
+        sys.exit(1)
+    print("all invariants hold")
+
+
+if __name__ == "__main__":
+    main()
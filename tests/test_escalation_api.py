@@ -0,0 +1,43 @@
+"""
+エスカレーション登録APIの入力チェック
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app import store
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("form", [
+    {"message": "help"},
+    {"name": "", "message": "help"},
+    {"name": "alice"},
+    {"name": "alice", "message": "  "},
+])
+def test_escalate_rejects_missing_name_or_message(client, form):
+    before = len(store.get_escalations())
+    response = client.post("/api/escalate", data=form, follow_redirects=False)
+    assert response.status_code == 400
+    assert len(store.get_escalations()) == before
+
+
+def test_escalate_registers_escalation(client):
+    response = client.post("/api/escalate", data={"name": "alice", "message": "help"}, follow_redirects=False)
+    assert response.status_code == 303
+    assert store.get_escalations()[-1].name == "alice"
+
+
+def test_escalate_attaches_articles_from_latest_answer(client):
+    store.add_chat_message("bob", "question", is_user=True)
+    store.add_chat_message("bob", "answer", is_user=False,
+                           references=[{"id": "p-1", "title": "規程", "url": "/p-1", "score": 1.0}])
+    store.add_chat_message("bob", "thanks", is_user=True)
+    response = client.post("/api/escalate", data={"name": "bob", "message": "help"}, follow_redirects=False)
+    assert response.status_code == 303
+    assert store.get_escalations()[-1].retrieved_articles == [{"id": "p-1", "title": "規程", "url": "/p-1"}]
@@ -0,0 +1,57 @@
+"""
+一括取り込みの冪等キー（同じ内容の再送は読み飛ばし、内容の異なる再利用は409）
+"""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import store
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def key():
+    return f"test-{uuid.uuid4()}"
+
+
+def _users(*names):
+    return {"users": [{"name": name} for name in names]}
+
+
+def test_same_key_and_content_is_replayed(client, key):
+    first = client.post("/api/import/users", json=_users("import-alice"), headers={"Idempotency-Key": key})
+    assert first.status_code == 200
+    assert first.json()["replayed_batches"] == 0
+
+    second = client.post("/api/import/users", json=_users("import-alice"), headers={"Idempotency-Key": key})
+    assert second.status_code == 200
+    assert second.json()["replayed_batches"] == 1
+    # 適用済みのバッチは数え直さない
+    assert second.json()["applied"]["records"] == 0
+    assert first.json()["applied"]["records"] == 1
+
+
+def test_same_key_with_different_content_is_rejected(client, key):
+    client.post("/api/import/users", json=_users("import-bob"), headers={"Idempotency-Key": key})
+
+    response = client.post("/api/import/users", json=_users("import-carol"), headers={"Idempotency-Key": key})
+
+    assert response.status_code == 409
+    assert key in response.json()["error"]
+    assert store.get_user("import-carol") is None
+
+
+def test_import_batch_raises_on_fingerprint_mismatch(key):
+    records = [{"type": "user", "name": "import-dave", "at": "2024-01-01T00:00:00"}]
+    store.import_batch(records, key=key, fingerprint="a")
+
+    assert store.import_batch(records, key=key, fingerprint="a")["replayed"] is True
+    with pytest.raises(store.ImportConflictError):
+        store.import_batch(records, key=key, fingerprint="b")
@@ -0,0 +1,65 @@
+"""
+ジャーナルのスナップショット（退避したチャット履歴を含む書き出しと、書き出し中の更新）
+"""
+import threading
+from collections import Counter
+
+import pytest
+
+from app import store
+from app.storage import JournalBackend
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    # チャット履歴はメモリに3件だけ残し、それより古いものは退避ファイルに書く
+    monkeypatch.setattr(store, "CHAT_HISTORY_LIMIT", 3)
+    monkeypatch.setattr(store, "CHAT_SPILL_DIR", str(tmp_path / "spill"))
+    backend = JournalBackend(tmp_path / "journal", snapshot_every=10 ** 9, flush_interval=0.01)
+    store.init_storage(backend)
+    yield backend
+    store.close_storage()
+
+
+def _chat_counts(backend, prefix):
+    counts = Counter()
+    for record in JournalBackend(backend.directory).load():
+        if record["type"] == "chat" and record["name"].startswith(prefix):
+            counts[record["name"]] += 1
+    return counts
+
+
+def test_snapshot_includes_spilled_chat_history(journal):
+    for i in range(10):
+        store.add_chat_message("journal-alice", f"message {i}")
+    journal.snapshot_every = 1
+    store.add_chat_message("journal-bob", "trigger")
+    journal.flush()
+
+    assert journal.snapshots >= 1
+    assert _chat_counts(journal, "journal-") == {"journal-alice": 10, "journal-bob": 1}
+
+
+def test_updates_are_not_blocked_while_spilled_history_is_read(journal, monkeypatch):
+    for i in range(10):
+        store.add_chat_message("journal-carol", f"message {i}")
+    finished = []
+    read_spilled = store._iter_spilled
+
+    def slow_read(path, offset, count):
+        # 退避ファイルを読んでいる間に、別のスレッドの更新が待たされずに終わること
+        if not finished:
+            writer = threading.Thread(target=store.add_chat_message, args=("journal-dave", "during snapshot"))
+            writer.start()
+            writer.join(timeout=5)
+            finished.append(not writer.is_alive())
+        yield from read_spilled(path, offset, count)
+
+    monkeypatch.setattr(store, "_iter_spilled", slow_read)
+    journal.snapshot_every = 1
+    store.add_chat_message("journal-carol", "trigger")
+    journal.flush()
+
+    assert journal.snapshots >= 1
+    assert finished == [True]
+    assert _chat_counts(journal, "journal-")["journal-carol"] == 11
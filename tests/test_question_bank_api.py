@@ -0,0 +1,30 @@
+"""
+設問バンクの正誤判定API（読み取り専用で、ストアには記録しない）
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app import store
+from app.main import app
+from app.question_bank import get_question_bank
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_answer_is_graded_without_touching_the_store(client):
+    question = get_question_bank().questions[0]
+    store.get_or_create_user("bank-alice")
+    users_before = [(user.name, dict(user.answers)) for user in store.get_all_users()]
+    stats_before = store.get_topic_statistics()
+
+    response = client.post(f"/api/questions/{question.id}/answer",
+                           json={"selected_index": question.correct_choice_index})
+
+    assert response.status_code == 200
+    assert response.json()["correct"] is True
+    assert [(user.name, dict(user.answers)) for user in store.get_all_users()] == users_before
+    assert store.get_topic_statistics() == stats_before
@@ -0,0 +1,22 @@
+"""
+ランキングの一括スコアリング（1件ずつの検索と同じ結果になること）
+"""
+import pytest
+
+from app import rag
+from app.ranking import RANKERS
+
+QUERIES = [
+    "",
+    "ハラスメント 相談",
+    "ハラスメント 相談 ハラスメント",
+    "パスワード 管理 password",
+    "情報 セキュリティ 事故 報告",
+    "存在しない語",
+]
+
+
+@pytest.mark.parametrize("name", sorted(RANKERS))
+def test_top_k_batch_matches_top_k(name):
+    ranker = rag.get_policy_index().rankers.get(name)
+    assert ranker.top_k_batch(QUERIES, 3) == [ranker.top_k(query, 3) for query in QUERIES]
@@ -0,0 +1,57 @@
+"""
+共有データベースのスナップショットと記録表の切り詰め
+"""
+import os
+
+import pytest
+
+from app import store
+from app.storage import SharedSQLiteBackend
+
+
+@pytest.fixture
+def shared(tmp_path):
+    backend = SharedSQLiteBackend(tmp_path / "shared.sqlite3", snapshot_every=5)
+    store.init_storage(backend)
+    yield backend
+    store.close_storage()
+
+
+def _chats(records, name):
+    return [record["message"] for record in records if record["type"] == "chat" and record["name"] == name]
+
+
+def test_snapshot_compacts_events_and_restores_state(shared):
+    messages = [f"message {i}" for i in range(12)]
+    for message in messages:
+        store.add_chat_message("shared-alice", message)
+
+    stats = shared.stats()
+    assert stats["snapshots"] >= 1
+    assert stats["events"] < len(messages)
+
+    restored = SharedSQLiteBackend(shared.path)
+    restored.pid = os.getppid()
+    try:
+        assert _chats(restored.load(), "shared-alice") == messages
+    finally:
+        restored.close()
+
+
+def test_events_not_yet_pulled_by_another_process_are_kept(shared):
+    # 別のプロセスとして登録し、取り込まないまま他の書き込みでスナップショットを取らせる
+    other = SharedSQLiteBackend(shared.path)
+    other.pid = os.getppid()
+    list(other.load())
+    pulled = []
+    other.start(apply=pulled.append)
+    try:
+        messages = [f"message {i}" for i in range(12)]
+        for message in messages:
+            store.add_chat_message("shared-bob", message)
+        assert shared.stats()["snapshots"] >= 1
+
+        other.catch_up()
+        assert _chats(pulled, "shared-bob") == messages
+    finally:
+        other.close()
@@ -0,0 +1,104 @@
+"""
+永続化バックエンドの書き込み失敗時の扱い（再試行・不正な記録の読み捨て）
+"""
+import sqlite3
+
+import pytest
+
+from app.storage import SQLiteBackend
+
+
+def _user(name):
+    return {"type": "user", "name": name, "at": "2025-01-01T00:00:00"}
+
+
+def _escalation(escalation_id, name):
+    return {"type": "escalation", "id": escalation_id, "name": name, "message": "m",
+            "retrieved_articles": [], "confidence": "low", "at": "2025-01-01T00:00:00"}
+
+
+class FlakyConnection:
+    """executemany を指定回数だけ失敗させる接続（それ以外は本物の接続に任せる）"""
+
+    def __init__(self, conn, failures):
+        self._conn = conn
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def executemany(self, sql, params):
+        if self.failures > 0:
+            self.failures -= 1
+            raise sqlite3.OperationalError("disk I/O error")
+        return self._conn.executemany(sql, params)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(tmp_path / "store.sqlite3", flush_interval=0.01)
+    backend.retry_interval = 0.01
+    backend.retry_max_interval = 0.02
+    yield backend
+    backend.close()
+
+
+def _count(backend, table):
+    conn = sqlite3.connect(backend.path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_transient_failure_is_retried_until_written(backend):
+    real = backend._conn
+    backend._conn = FlakyConnection(real, failures=3)
+    backend.start()
+    for i in range(10):
+        backend.append(_user(f"user-{i}"))
+    backend.flush()
+    backend._conn = real
+
+    stats = backend.stats()
+    assert stats["written"] == 10
+    assert stats["retries"] == 3
+    assert stats["healthy"]
+    assert stats["dropped"] == stats["rejected"] == 0
+    assert _count(backend, "users") == 10
+
+
+def test_integrity_error_rejects_only_the_bad_record(backend):
+    backend.start()
+    backend.append(_user("before"))
+    # name が NOT NULL の制約に反する記録（再試行しても書き込めない）
+    backend.append(_escalation(1, None))
+    backend.append(_escalation(2, "after"))
+    backend.append(_user("after"))
+    backend.flush()
+
+    stats = backend.stats()
+    assert stats["rejected"] == 1
+    assert stats["last_rejected"]["type"] == "escalation"
+    assert "IntegrityError" in stats["last_rejected"]["error"]
+    assert stats["retries"] == 0
+    assert stats["healthy"]
+    assert _count(backend, "users") == 2
+    assert _count(backend, "escalations") == 1
+
+    # 読み捨てた後の記録もそのまま書き込まれる
+    backend.append(_user("later"))
+    backend.flush()
+    assert _count(backend, "users") == 3
+
+
+def test_close_gives_up_on_persistent_failure(backend):
+    real = backend._conn
+    backend._conn = FlakyConnection(real, failures=10 ** 6)
+    backend.retry_interval = backend.retry_max_interval = 60
+    backend.start()
+    backend.append(_user("lost"))
+    backend.close()
+    backend._conn = real
+
+    assert backend.stats()["dropped"] == 1